@@ -25,57 +25,58 @@ Sources :
 - https://app.dvf.etalab.gouv.fr
 - PEL : https://www.service-public.fr/particuliers/vosdroits/F16140
 """
+import dataclasses
 import datetime
+import time
 
 import numpy as np
 import pandas as pd
 import streamlit as st
-from PIL import Image
 
 from fonctions import (
-    INFLATION_SUR_NB_YEARS, TAUX_BNP, TAUX_NOMINAL_PUBLIC, TAUX_PEL, barême, get_CRD_à_date,
-    get_mt_emprunt_max, get_mt_max_prêt_PEL, img_to_bytes, LIEU_TO_INFLATION_APPART,
+    INFLATION_SUR_NB_YEARS, TAUX_BNP, TAUX_NOMINAL_PUBLIC, TAUX_PEL, img_to_bytes,
     LIEU_TO_INFLATION_MAISON, lieu_to_url_meilleurs_agents, nb_mois_depuis_que_lisa_économise,
-    sep_milliers, get_inflation_annuelle, projette_prix_inflate
-)
-
-# Hypothèses
-SECURITE_LISA = 10_000
-
-# Appartement actuel à Cachan
-TX_LBP = 0.9
-DATE_DÉBUT_DU_PRÊT_EXISTANT = datetime.date(2020, 5, 5)
-MONTANT_REMBOURSÉ_PAR_MOIS = 878.19
-CHARGES_MENSUELLES = 200
-PRIX_APPARTEMENT_CACHAN = 259_000
-MONTANT_EMPRUNTE = 192_820
-ASSURANCE_PRÊT = 16
-
-# "Le taux maximum d'endettement ne peux excéder 35 % des revenus des emprunteurs,
-# assurance comprise"
-TAUX_MAX_ENDETTEMENT = 0.35  # assurance comprise
-# "Depuis le 1er janvier 2022, les banques doivent limiter à 25 ans la durée
-# des crédits immobiliers"
-DURÉE_MAX_CRÉDIT_EN_MOIS = 25 * 12
-
-PARTICIPATION = 3697  # montant pour 2024
-INTERESSEMENT = 3460  # montant pour 2024
-PARTICIPATION_INTERESSEMENT = PARTICIPATION + INTERESSEMENT
-W_TOTAL_AVANT_IMPÔT = (67_000 + 5000 + 12_000) * (63_000 / 84_000)  # hors PI et abondemment
-W_VARIABLE_AVANT_IMPÔT = 12_000 * (63_000 / 84_000)  # https://www.salaire-brut-en-net.fr
+    sep_milliers
+)
+import cache_disque
+import index_communes
+import instrumentation
+from balayage import balaye
+from chronologie import SÉRIES as SÉRIES_CHRONOLOGIE, chronologie
+from epargne import PRODUITS as PRODUITS_ÉPARGNE
+from inversion import inverse
+from monte_carlo import monte_carlo
+from optimisation_pel import optimise_PEL
+from refinancement import MODES as MODES_REFINANCEMENT, refinance, trajectoires_taux
+from sensibilite import sensibilités
+from simulation import (
+    DATE_REMB_ANTICIPÉ_GRATUIT, SECURITE_LISA, W_TOTAL_AVANT_IMPÔT, W_VARIABLE_AVANT_IMPÔT,
+    CalculIncrémental, ScenarioParams, simulate, type_local_retenu
+)
+from vente import SÉRIES as SÉRIES_VENTE, ventes
 
 
 st.set_page_config(
     page_title='Estimation logement',
-    page_icon=Image.open("logo.png")
+    # Streamlit ouvre lui-même l'image : pas besoin d'importer PIL ici
+    page_icon="logo.png"
 )
 
 titre = st.empty()
 
+# Ajouter ?debug à l'URL pour chronométrer les étapes du calcul, pour cette session
+# seulement : les mesures sont gardées dans la session et réinstallées à chaque exécution
+profilage = 'debug' in st.query_params
+if profilage and 'mesures' not in st.session_state:
+    st.session_state.mesures = instrumentation.Mesures()
+instrumentation.utilise(st.session_state.mesures if profilage else None)
+
 
 @st.cache_data()
 def md_from_title_and_img(title: str, img_path: str):
-    img64 = img_to_bytes(img_path)
+    # N'est chronométré qu'en l'absence de cache
+    with instrumentation.étape('encodage base64 des images'):
+        img64 = img_to_bytes(img_path)
     size = 28 if img_path != 'tirelire.png' else 35
     width = f'width={size} height={size}'
     return f"""## <img src='data:image/png;base64,{img64}' class='img-fluid' {width}>  {title}"""
@@ -86,13 +87,35 @@ st.sidebar.markdown(
     unsafe_allow_html=True
 )
 
+# Si l'index DVF a été construit (cf index_communes.py), toutes les communes de France :
+# le sélecteur n'en propose que celles qui commencent par le texte recherché
+index = index_communes.charge()
+recherche_ville = '' if index is None else st.sidebar.text_input(
+    'Rechercher une commune', placeholder='ex : saint germ'
+)
+VILLES = sorted(LIEU_TO_INFLATION_MAISON)
+if recherche_ville:
+    préfixe = index_communes.normalise(recherche_ville)
+    VILLES = sorted(
+        {ville for ville in VILLES if index_communes.normalise(ville).startswith(préfixe)}
+        | set(index.recherche(recherche_ville))
+    ) or VILLES
 select_ville = st.sidebar.selectbox(
-    'Ville', sorted(LIEU_TO_INFLATION_MAISON.keys()),
-    index=sorted(LIEU_TO_INFLATION_MAISON).index('RUEIL-MALMAISON')
+    'Ville', VILLES,
+    index=VILLES.index('RUEIL-MALMAISON') if 'RUEIL-MALMAISON' in VILLES else 0
 )
 select_appart_ou_maison = st.sidebar.selectbox(
     'Appartement ou maison', ['Maison', 'Appartement']
 )
+if type_local_retenu(select_ville, select_appart_ou_maison) != select_appart_ou_maison:
+    st.sidebar.warning(
+        f'Pas assez de ventes de type {select_appart_ou_maison} à {select_ville} : '
+        f"l'inflation retenue est celle du type "
+        f'{type_local_retenu(select_ville, select_appart_ou_maison)}.',
+        # Icône explicite : sinon Streamlit charge son catalogue d'emojis (0,3 s) pour
+        # chercher un emoji en tête du texte
+        icon=':material/warning:'
+    )
 select_neuf_ancien = st.sidebar.selectbox('Neuf ou ancien', ['Ancien', 'Neuf'])
 select_date_achat = st.sidebar.date_input('Date achat futur logement', datetime.date(2029, 1, 1))
 titre.header("🏠  Estimation logement " + str(select_date_achat.year))
@@ -109,12 +132,9 @@ select_prise_en_compte_du_variable = st.sidebar.checkbox("Avec prise en compte d
 select_prise_en_compte_participation_interessement = st.sidebar.checkbox(
     "Avec prise en compte de la participation et de l'intéressement", False
 )
-# Une fois révolu le 7e anniversaire suivant la date de signature de la présente offre,
-# l'Emprunteur peut effectuer des remboursements par anticipation, sans frais
-remb_anticipé_gratuit = (DATE_DÉBUT_DU_PRÊT_EXISTANT + pd.DateOffset(years=7)).date()
-remb_anticipé_gratuit = select_date_achat > remb_anticipé_gratuit
 select_remb_anticipé_gratuit = st.sidebar.checkbox(
-    "Avec clause de remboursement anticipée gratuite", value=remb_anticipé_gratuit
+    "Avec clause de remboursement anticipée gratuite",
+    value=select_date_achat > DATE_REMB_ANTICIPÉ_GRATUIT
 )
 
 select_nb_années_pr_rembourser = st.sidebar.slider(
@@ -137,10 +157,11 @@ select_tx_nominal = st.sidebar.slider(
 )
 tx_nominal = select_tx_nominal / 100
 est_PEL_intéressant = TAUX_PEL <= tx_nominal
+PAS_CURSEUR_PEL = 0.01
 
 if est_PEL_intéressant:
     # % de mon endettement alloué au PEL par opposition au prêt principal :
-    curseur_PEL = st.sidebar.slider('curseur_PEL', 0., 1., 0., step=0.01)
+    curseur_PEL = st.sidebar.slider('curseur_PEL', 0., 1., 0., step=PAS_CURSEUR_PEL)
     select_mt_intérêts_acquis_pel = st.sidebar.number_input(
         'Montant des intérêt acquis PEL',
         value=int(0.0225 * 20000 + 0.0225 * 35000 + 0.0225 * 52000 + 0.0225 * 60000),
@@ -148,9 +169,7 @@ if est_PEL_intéressant:
     )
 else:
     curseur_PEL = 0  # par défaut, on n'utilise pas le PEL
-    mensualité_PEL = 0
-    mt_prêt_PEL = 0
-    durée_du_prêt_PEL = 0
+    select_mt_intérêts_acquis_pel = ScenarioParams.mt_intérêts_acquis_pel
 
 select_tx_frais_agence = st.sidebar.slider(
     "[Frais d'agence en %]"
@@ -186,6 +205,24 @@ select_apport_actuel_lvo = st.sidebar.slider(
     'Apport actuel Lisa',
     min_value=20_000, max_value=150_000, value=apport_lvo_actuel_default, step=5000
 )
+with st.sidebar.expander("Placement de l'épargne"):
+    # Part des apports et des gains mensuels sur chaque produit, le reste sur le compte courant
+    parts_épargne = {
+        produit: st.slider(
+            f'Part sur {produit.replace("_", " ")}', 0., 1., 0., step=0.05,
+            help=f'{hypothèses.taux_annuel:.2%} par an'
+            + (f', plafond de {sep_milliers(hypothèses.plafond)} €'
+               if np.isfinite(hypothèses.plafond) else '')
+        )
+        for produit, hypothèses in PRODUITS_ÉPARGNE.items()
+    }
+    if sum(parts_épargne.values()) > 1:
+        st.warning(
+            'Les parts dépassent 100 % : elles sont ramenées à 100 %.', icon=':material/warning:'
+        )
+    select_participation_intéressement_sur_PEE = st.checkbox(
+        'Participation et intéressement placés sur le PEE', False
+    )
 select_w_mensuel_pde_date_achat = st.sidebar.slider(
     "Salaire mensuel net av. impôt Pierre à date d'achat",  # Hors variable !
     min_value=3000, max_value=6000,
@@ -201,108 +238,39 @@ select_w_mensuel_lvo_date_achat = st.sidebar.slider(
 # En 2023, 36 174 € / 12 = 3015€ de mensuel net avant impôt
 # En 2024, (salaire brut = 46 000 * 1,07) * (PS -> 0.8) * (1 / 12) = 3280
 
-# Les dépendances
-lieu_to_inflation_appart, lieu_to_inflation_maison = {}, {}
-for k in LIEU_TO_INFLATION_APPART.keys():
-    lieu_to_inflation_appart[k] = (
-        LIEU_TO_INFLATION_APPART[k] if select_avec_projection_inflation else 0
-    )
-    lieu_to_inflation_maison[k] = (
-        LIEU_TO_INFLATION_MAISON[k] if select_avec_projection_inflation else 0
-    )
-
-années_depuis_achat = (
-    (
-        select_date_achat - DATE_DÉBUT_DU_PRÊT_EXISTANT
-    ).days / 365
-)
-
-nb_mois_restants_avant_achat = round(
-    (select_date_achat - datetime.date.today()).days / 30.5
-)
-nb_années_restantes_avant_achat = nb_mois_restants_avant_achat / 12
-
-inflation_annuelle_cachan = get_inflation_annuelle(
-    inflation_cum=lieu_to_inflation_appart['CACHAN'],
-    nb_years_cum=INFLATION_SUR_NB_YEARS
-)
-prix_estimé_revente = projette_prix_inflate(
-    prix_initial=PRIX_APPARTEMENT_CACHAN,
-    inf_annuelle_en_pct=inflation_annuelle_cachan,
-    nb_years_projetées=nb_années_restantes_avant_achat
-)
-
-CRD = get_CRD_à_date(
-    à_date=select_date_achat,
-    date_début_du_prêt_existant=DATE_DÉBUT_DU_PRÊT_EXISTANT,
-    montant_emprunté=MONTANT_EMPRUNTE
-)
-
-# Source : pdf des conditions générales LBP
-indemnités_de_remb_par_anticipation = min(
-    # "En cas de remboursement anticipé, LBP percevra une indemnité égale à un semestre d'intérêts
-    # calculés au taux indiqué dans les conditions particulières sur le montant du CRD."
-    144.62 * 6,
-    # "Cette indemnité est plafonnée à 3 % du capital restant dû avant le remboursement."
-    CRD * 0.03,
-)
-dû_à_la_banque = CRD + (
-    (not select_remb_anticipé_gratuit) * indemnités_de_remb_par_anticipation
-)
-solde_revente = prix_estimé_revente - dû_à_la_banque
-
-apport_qui_sera_apporté_pde = select_apport_actuel_pde
-apport_qui_sera_apporté_pde += select_gain_mensuel_pde * nb_mois_restants_avant_achat
-apport_qui_sera_apporté_pde += solde_revente * select_avec_vente_appartement
-
-apport_qui_sera_apporté_lvo = select_apport_actuel_lvo
-apport_qui_sera_apporté_lvo += select_gain_mensuel_lvo * nb_mois_restants_avant_achat
-
-montant_total_qui_sera_apporté = apport_qui_sera_apporté_pde + apport_qui_sera_apporté_lvo
-
-
-def calcule_mensualité_max_pde(
-    w_mensuel_pde_date_achat=select_w_mensuel_pde_date_achat,
-    prise_en_compte_du_variable=select_prise_en_compte_du_variable,
-    w_variable=W_VARIABLE_AVANT_IMPÔT,
-    taux_max_endettement=TAUX_MAX_ENDETTEMENT,
-    prise_en_compte_participation_interessement=select_prise_en_compte_participation_interessement,
-    participation_intéressement=PARTICIPATION_INTERESSEMENT,
+params = ScenarioParams(
+    ville=select_ville,
+    appart_ou_maison=select_appart_ou_maison,
+    neuf_ancien=select_neuf_ancien,
+    date_achat=select_date_achat,
     avec_vente_appartement=select_avec_vente_appartement,
-    mt_remboursé_par_mois=MONTANT_REMBOURSÉ_PAR_MOIS,
-    assurance_prêt=ASSURANCE_PRÊT
-):
-    """
-    Si je garde mon appartement, c'est pour le mettre en location (et donc, j'aurai
-    des revenus fonciers). On lit ici que les revenus fonciers sont pris en compte dans le
-    calcul du taux d'endettement à hauteur de 70% :
-    https://fr.luko.eu/conseils/guide/taux-endettement-maximum/
-    1200 € : le montant que je peux mettre en location, charges comprises (source SeLoger)
-    Hypothèse pessimiste : l'établissement bancaire retire les charges de copropriété de
-    mes revenus fonciers dans le calcul du taux d'endettement. C'est plutôt rare, cf ChatGPT.
-    """
-    mensualité_max_pde = taux_max_endettement * (
-        w_mensuel_pde_date_achat +
-        prise_en_compte_du_variable * (w_variable / 12) +
-        prise_en_compte_participation_interessement * (participation_intéressement / 12) +
-        (not avec_vente_appartement) * (0.7 * (1200 - 250)) -
-        (not avec_vente_appartement) * (mt_remboursé_par_mois + assurance_prêt) -
-        (not avec_vente_appartement) * 0.0295 * 1200  # assurance loyer impayé, source Macif
-    )
-    return mensualité_max_pde
-
-
-def calcule_mensualité_max_lvo(
-        w_mensuel_lvo_date_achat=select_w_mensuel_lvo_date_achat,
-        tx_max_endettement=TAUX_MAX_ENDETTEMENT
-):
-    mensualité_max_lvo = tx_max_endettement * w_mensuel_lvo_date_achat
-    return mensualité_max_lvo
-
-
-mensualité_max_lvo = calcule_mensualité_max_lvo()
-mensualité_max_pde = calcule_mensualité_max_pde()
-mensualité_maximale = mensualité_max_pde + mensualité_max_lvo
+    avec_crédit_BNP=select_avec_crédit_BNP,
+    prise_en_compte_du_variable=select_prise_en_compte_du_variable,
+    prise_en_compte_participation_interessement=(
+        select_prise_en_compte_participation_interessement
+    ),
+    remb_anticipé_gratuit=select_remb_anticipé_gratuit,
+    nb_années_pr_rembourser=select_nb_années_pr_rembourser,
+    tx_nominal=tx_nominal,
+    curseur_PEL=curseur_PEL,
+    mt_intérêts_acquis_pel=select_mt_intérêts_acquis_pel,
+    tx_frais_agence=select_tx_frais_agence,
+    avec_projection_inflation=select_avec_projection_inflation,
+    gain_mensuel_pde=select_gain_mensuel_pde,
+    gain_mensuel_lvo=select_gain_mensuel_lvo,
+    apport_actuel_pde=select_apport_actuel_pde,
+    apport_actuel_lvo=select_apport_actuel_lvo,
+    w_mensuel_pde_date_achat=select_w_mensuel_pde_date_achat,
+    w_mensuel_lvo_date_achat=select_w_mensuel_lvo_date_achat,
+    **{f'part_épargne_{produit}': part for produit, part in parts_épargne.items()},
+    participation_intéressement_sur_PEE=select_participation_intéressement_sur_PEE,
+)
+# Un calcul incrémental par session : seules les étapes touchées par le widget modifié
+# sont réévaluées
+if 'calcul' not in st.session_state:
+    st.session_state.calcul = CalculIncrémental()
+r = st.session_state.calcul.calcule(params)
+début_rendu = time.perf_counter()
 
 st.markdown('_Mis à jour le 05/04/2026_')
 
@@ -311,60 +279,34 @@ st.markdown(
     f"Lisa aura {age_lisa} ans, Pierre aura {age_pierre} ans."
 )
 
-mois_depuis_achat = (années_depuis_achat * 12)
+mois_depuis_achat = (r.années_depuis_achat * 12)
 pct_remboursé = mois_depuis_achat / 240
 if select_avec_vente_appartement:
     phrase = (
         f"L'appartement de Cachan sera remboursé à {pct_remboursé:.0%} "
-        f"depuis {années_depuis_achat:.2} années ({int(mois_depuis_achat)} / 240 mensualités) :\n"
-        f"* En tenant compte d'une inflation annuelle de {inflation_annuelle_cachan:.2%} "
+        f"depuis {r.années_depuis_achat:.2} années "
+        f"({int(mois_depuis_achat)} / 240 mensualités) :\n"
+        f"* En tenant compte d'une inflation annuelle de {r.inflation_annuelle_cachan:.2%} "
         f"les {INFLATION_SUR_NB_YEARS} dernières années à Cachan, le prix de revente est estimé "
-        f"à {sep_milliers(prix_estimé_revente)} €.\n"
-        f"* Le CRD au {select_date_achat.strftime('%d/%m/%Y')} sera de {sep_milliers(CRD)} €.\n"
-        f"La revente de l'appartement apportera donc {sep_milliers(solde_revente)} €."
+        f"à {sep_milliers(r.prix_estimé_revente)} €.\n"
+        f"* Le CRD au {select_date_achat.strftime('%d/%m/%Y')} sera de {sep_milliers(r.CRD)} €.\n"
+        f"La revente de l'appartement apportera donc {sep_milliers(r.solde_revente)} €."
     )
     st.markdown(phrase)
 
 st.markdown(
-    f'Notre apport sera de {sep_milliers(montant_total_qui_sera_apporté)} €, '
-    f'dont {sep_milliers(apport_qui_sera_apporté_lvo)} € pour Lisa '
-    f'et {sep_milliers(apport_qui_sera_apporté_pde)} € pour Pierre.'
+    f'Notre apport sera de {sep_milliers(r.montant_total_qui_sera_apporté)} €, '
+    f'dont {sep_milliers(r.apport_qui_sera_apporté_lvo)} € pour Lisa '
+    f'et {sep_milliers(r.apport_qui_sera_apporté_pde)} € pour Pierre.'
 )
 
-mensualité_plafond_pde_PEL = curseur_PEL * mensualité_max_pde
-mensualité_max_pde_prêt_principal = (1 - curseur_PEL) * mensualité_max_pde
-
-if est_PEL_intéressant:
-    (
-        durée_du_prêt_PEL, mt_prêt_PEL,
-        mensualité_PEL, intérêts_acquis_utilisés_PEL
-    ) = get_mt_max_prêt_PEL(
-        barême,
-        mt_intérêts_acquis_PEL=select_mt_intérêts_acquis_pel,
-        mensualité_plafond=mensualité_plafond_pde_PEL
-    )
-
-mt_prêt_principal_pde = get_mt_emprunt_max(
-    mensualité_max=mensualité_max_pde_prêt_principal,
-    tx_nominal=tx_nominal,
-    nb_mois=select_nb_années_pr_rembourser * 12
-)
-mt_prêt_principal_lvo = get_mt_emprunt_max(
-    mensualité_max=mensualité_max_lvo,
-    tx_nominal=tx_nominal,
-    nb_mois=select_nb_années_pr_rembourser * 12
-)
-mt_prêt_principal = mt_prêt_principal_pde + mt_prêt_principal_lvo
-mt_emprunt_max = mt_prêt_principal + mt_prêt_PEL
-mensualités_prêt_principal = mensualité_max_pde_prêt_principal + mensualité_max_lvo
-
 phrase = (
     'Mensualité maximale supportable par Lisa et Pierre : '
-    f'{sep_milliers(mensualité_maximale)} €, '
-    f'dont {sep_milliers(mensualité_max_pde)} € pour Pierre et '
-    f'{sep_milliers(mensualité_max_lvo)} € pour Lisa.\n'
+    f'{sep_milliers(r.mensualité_maximale)} €, '
+    f'dont {sep_milliers(r.mensualité_max_pde)} € pour Pierre et '
+    f'{sep_milliers(r.mensualité_max_lvo)} € pour Lisa.\n'
     f'Cette mensualité, adossée à un taux nominal de {tx_nominal:.2%}, '
-    f"permet d'emprunter au maximum {sep_milliers(mt_emprunt_max)} € "
+    f"permet d'emprunter au maximum {sep_milliers(r.mt_emprunt_max)} € "
     f'sur {select_nb_années_pr_rembourser} ans.'
 )
 st.markdown(phrase)
@@ -372,47 +314,35 @@ st.markdown(phrase)
 if est_PEL_intéressant:
     st.markdown(
         phrase +
-        f'\n* {sep_milliers(mt_prêt_PEL)} € '
-        f'avec le PEL (sur {durée_du_prêt_PEL} ans, '
-        f'avec des mensualités de {mensualité_PEL} € et en utilisant '
-        f"{sep_milliers(intérêts_acquis_utilisés_PEL)} € d'intérêts acquis)"
-        f'\n* {sep_milliers(mt_prêt_principal)} € '
+        f'\n* {sep_milliers(r.mt_prêt_PEL)} € '
+        f'avec le PEL (sur {r.durée_du_prêt_PEL} ans, '
+        f'avec des mensualités de {r.mensualité_PEL} € et en utilisant '
+        f"{sep_milliers(r.intérêts_acquis_utilisés_PEL)} € d'intérêts acquis)"
+        f'\n* {sep_milliers(r.mt_prêt_principal)} € '
         f'avec le prêt principal (sur {select_nb_années_pr_rembourser} ans '
-        f'avec des mensualités de {sep_milliers(mensualités_prêt_principal)} €)'
+        f'avec des mensualités de {sep_milliers(r.mensualités_prêt_principal)} €)'
     )
 
-budget = montant_total_qui_sera_apporté + mt_emprunt_max
-
-st.markdown(f"Notre budget total d'achat sera donc de {sep_milliers(budget)} €.")
+st.markdown(f"Notre budget total d'achat sera donc de {sep_milliers(r.budget)} €.")
 
 st.markdown("Attention, il faut prendre en compte :")
-lieu_to_inflation = (
-    lieu_to_inflation_appart if select_appart_ou_maison == 'Appartement'
-    else lieu_to_inflation_maison
-)
-inflation_par_an_les_x_dernières_années = get_inflation_annuelle(
-    inflation_cum=lieu_to_inflation[select_ville],
-    nb_years_cum=INFLATION_SUR_NB_YEARS
-)
-inflation_temps_restant_avant_achat = (
-    (1 + inflation_par_an_les_x_dernières_années) ** nb_années_restantes_avant_achat
-)
-budget = round(budget / inflation_temps_restant_avant_achat)
-url_meilleurs_agents = lieu_to_url_meilleurs_agents[select_ville]
+budget = r.budget_après_inflation
+if select_ville in lieu_to_url_meilleurs_agents:
+    url_inflation = (
+        'https://www.meilleursagents.com/prix-immobilier/'
+        f'{lieu_to_url_meilleurs_agents[select_ville]}/'
+    )
+else:
+    url_inflation = 'https://app.dvf.etalab.gouv.fr'
 st.markdown(
-    f"* [L'inflation](https://www.meilleursagents.com/prix-immobilier/{url_meilleurs_agents}/)"
-    f' ({lieu_to_inflation[select_ville]:.2%} en {INFLATION_SUR_NB_YEARS} ans à {select_ville}, '
-    f'soit {inflation_par_an_les_x_dernières_années:.2%} par an, '
-    f"soit {inflation_temps_restant_avant_achat - 1:.2%} d'ici les "
-    f"{nb_années_restantes_avant_achat:.0f} ans avant l'achat) : reste {sep_milliers(budget)} €"
+    f"* [L'inflation]({url_inflation})"
+    f' ({r.inflation_cum_ville:.2%} en {INFLATION_SUR_NB_YEARS} ans à {select_ville}, '
+    f'soit {r.inflation_par_an_les_x_dernières_années:.2%} par an, '
+    f"soit {r.inflation_temps_restant_avant_achat - 1:.2%} d'ici les "
+    f"{r.nb_années_restantes_avant_achat:.0f} ans avant l'achat) : reste {sep_milliers(budget)} €"
 )
 
-coût_crédit_principal = (
-    mensualités_prêt_principal * 12 * select_nb_années_pr_rembourser - mt_prêt_principal
-)
-coût_crédit_PEL = mensualité_PEL * 12 * durée_du_prêt_PEL - mt_prêt_PEL
-coût_crédit = coût_crédit_principal + coût_crédit_PEL
-budget -= coût_crédit
+budget -= r.coût_crédit
 if select_avec_crédit_BNP:
     prefix = (
         "* [Le coût du crédit ]"
@@ -421,27 +351,22 @@ if select_avec_crédit_BNP:
 else:
     prefix = '* Le coût du crédit '
 st.markdown(
-    prefix + f"(hors assurance) : {sep_milliers(coût_crédit)} €, "
+    prefix + f"(hors assurance) : {sep_milliers(r.coût_crédit)} €, "
     f"reste {sep_milliers(budget)} €. Détail :\n"
-    f"\t - {sep_milliers(coût_crédit_principal)} € "
+    f"\t - {sep_milliers(r.coût_crédit_principal)} € "
     "d'intérêts à rembourser au titre du crédit principal\n"
-    f"\t - {sep_milliers(coût_crédit_PEL)} € "
+    f"\t - {sep_milliers(r.coût_crédit_PEL)} € "
     "d'intérêts à rembourser au titre du crédit PEL"
 )
 
-# mensualité d'assurance / mensualité du crédit
-tx_assurance_actuelle = 16.07 / MONTANT_REMBOURSÉ_PAR_MOIS
-coût_assurance = tx_assurance_actuelle * mt_emprunt_max
-budget -= coût_assurance
+budget -= r.coût_assurance
 st.markdown(f"* Le coût de l'assurance emprunteur : reste {sep_milliers(budget)} €")
 
-frais_de_notaire = 0.075 if select_neuf_ancien == 'Ancien' else 0.03
-frais_de_notaire *= budget
-budget -= frais_de_notaire
+budget -= r.frais_de_notaire
 st.markdown(f"* Les frais de notaire : reste {sep_milliers(budget)} €")
 
 if select_avec_vente_appartement:
-    budget -= (select_tx_frais_agence * prix_estimé_revente)
+    budget -= r.frais_agence
     st.markdown(
         "* Les [frais d'agence]"
         "(https://www.human-immobilier.fr/content/pdf/bareme_honoraires_human_immobilier.pdf) "
@@ -450,16 +375,234 @@ if select_avec_vente_appartement:
     )
 
 if not select_remb_anticipé_gratuit:
-    budget -= indemnités_de_remb_par_anticipation
+    budget -= r.indemnités_déduites
     st.markdown(
         "* Les indemnités de remboursement par anticipation : "
         f'reste {sep_milliers(budget)} €'
     )
 
-budget -= 1000
+budget -= r.frais_de_dossier
 st.markdown(f'* Les frais de dossier bancaire : reste {sep_milliers(budget)} €')
 
-st.markdown(f'**➜ Soit un prix final maximum de : {sep_milliers(budget)} €**')
+st.markdown(f'**➜ Soit un prix final maximum de : {sep_milliers(r.prix_final_maximum)} €**')
+
+AXES_BALAYAGE = {
+    'Taux nominal': ('tx_nominal', np.round(np.arange(0.01, 0.0501, 0.0025), 4)),
+    "Nombre d'années pour rembourser": ('nb_années_pr_rembourser', [15, 20, 25]),
+    "Date d'achat": (
+        'date_achat',
+        [datetime.date(année, mois, 1) for année in range(2027, 2033) for mois in (1, 7)]
+    ),
+    'Ville': ('ville', sorted(set(LIEU_TO_INFLATION_MAISON) | {select_ville})),
+    'Gain mensuel Pierre': ('gain_mensuel_pde', list(range(1000, 2501, 250))),
+    'Gain mensuel Lisa': ('gain_mensuel_lvo', list(range(1000, 2501, 250))),
+    'Salaire mensuel Pierre': ('w_mensuel_pde_date_achat', list(range(3000, 6001, 500))),
+    'Salaire mensuel Lisa': ('w_mensuel_lvo_date_achat', list(range(3000, 6001, 500))),
+    'curseur_PEL': ('curseur_PEL', np.round(np.linspace(0, 1, 11), 2)),
+    "Frais d'agence": ('tx_frais_agence', np.round(np.arange(0, 0.0701, 0.01), 2)),
+}
+with st.expander("Explorer d'autres hypothèses"):
+    axe_x = st.selectbox('Axe horizontal', list(AXES_BALAYAGE), index=0)
+    axe_y = st.selectbox(
+        'Axe vertical', [axe for axe in AXES_BALAYAGE if axe != axe_x], index=1
+    )
+    (champ_x, valeurs_x), (champ_y, valeurs_y) = AXES_BALAYAGE[axe_x], AXES_BALAYAGE[axe_y]
+    base = params
+    if 'date_achat' in (champ_x, champ_y):
+        # La clause de remboursement anticipé gratuit suit alors la date d'achat
+        base = dataclasses.replace(params, remb_anticipé_gratuit=None)
+    # Calculé et tracé seulement à la demande : sinon, à chaque rerun de la page
+    if st.toggle('Afficher la carte des prix', key='balayage'):
+        import altair as alt  # 0,4 s d'import : seulement si un graphique altair est tracé
+
+        with instrumentation.étape('balayage'):
+            df_balayage = balaye(
+                base, **{champ_x: valeurs_x, champ_y: valeurs_y}
+            ).to_frame(['prix_final_maximum']).reset_index()
+        df_balayage[[champ_x, champ_y]] = df_balayage[[champ_x, champ_y]].astype(str)
+        st.altair_chart(
+            alt.Chart(df_balayage).mark_rect().encode(
+                x=alt.X(f'{champ_x}:O', title=axe_x),
+                y=alt.Y(f'{champ_y}:O', title=axe_y),
+                color=alt.Color('prix_final_maximum:Q', title='Prix final maximum'),
+                tooltip=[champ_x, champ_y, alt.Tooltip('prix_final_maximum:Q', format=',.0f')]
+            )
+        )
+with st.expander("Incertitude sur l'inflation et les taux (Monte Carlo)"):
+    nb_tirages = st.number_input('Nombre de tirages', 1000, 1_000_000, 100_000, step=10_000)
+    if st.button('Lancer les tirages'):
+        résultat_mc = monte_carlo(params, nb_tirages=nb_tirages, graine=0)
+        st.table({
+            'Prix final maximum': {
+                p: f'{sep_milliers(v)} €'
+                for p, v in résultat_mc.percentiles('prix_final_maximum').items()
+            },
+            'Solde de la revente de Cachan': {
+                p: f'{sep_milliers(v)} €'
+                for p, v in résultat_mc.percentiles('solde_revente').items()
+            },
+        })
+RECHERCHES_INVERSES = {
+    "Date d'achat au plus tôt": ('date_achat', str),
+    'Gain mensuel Pierre minimal': ('gain_mensuel_pde', lambda v: f'{sep_milliers(v)} € / mois'),
+    'Gain mensuel Lisa minimal': ('gain_mensuel_lvo', lambda v: f'{sep_milliers(v)} € / mois'),
+    'Taux nominal maximal': ('tx_nominal', lambda v: f'{v:.2%}'),
+}
+with st.expander('Recherche inverse : que faut-il pour atteindre un prix ?'):
+    recherche = st.selectbox('On cherche', list(RECHERCHES_INVERSES))
+    champ_recherché, formate = RECHERCHES_INVERSES[recherche]
+    prix_cible = st.number_input('Prix visé (€)', 100_000, 3_000_000, 650_000, step=10_000)
+    villes = st.multiselect(
+        'Villes', sorted(set(LIEU_TO_INFLATION_MAISON) | set(VILLES)),
+        default=sorted(LIEU_TO_INFLATION_MAISON)
+    )
+    if villes and st.toggle('Lancer la recherche', key='recherche_inverse'):
+        base = dataclasses.replace(params, ville=np.array(villes), inflation_cum_ville=None)
+        if champ_recherché == 'date_achat':
+            base = dataclasses.replace(base, remb_anticipé_gratuit=None)
+        with instrumentation.étape('recherche inverse'):
+            inversion = inverse(base, champ_recherché, cible=prix_cible)
+        st.table({
+            recherche: {
+                ville: formate(valeur) if atteignable else 'Hors de portée'
+                for ville, valeur, atteignable in zip(
+                    villes, inversion.valeur, inversion.atteignable
+                )
+            }
+        })
+with st.expander("Mois par mois jusqu'à l'achat"):
+    if st.toggle('Afficher la projection', key='chronologie'):
+        with instrumentation.étape('chronologie'):
+            projection = chronologie(params)
+        if len(projection.dates) > 1:
+            meilleur_mois = projection.meilleur_mois()
+            st.markdown(
+                f'Le prix final maximum est le plus élevé pour un achat '
+                f'le {meilleur_mois:%d/%m/%Y} : '
+                f"{sep_milliers(projection.série('prix_final_maximum').max())} €."
+            )
+            df_projection = projection.to_frame().rename(columns=SÉRIES_CHRONOLOGIE)
+            st.line_chart(df_projection[[
+                SÉRIES_CHRONOLOGIE[champ] for champ in (
+                    'prix_final_maximum', 'budget', 'montant_total_qui_sera_apporté', 'CRD'
+                )
+            ]])
+        else:
+            st.info("La date d'achat est déjà passée.", icon=':material/info:')
+with st.expander('Date de vente de Cachan'):
+    if select_avec_vente_appartement:
+        achat_à_la_vente = st.radio(
+            'Achat', ['À la date choisie', 'Le jour de la vente'], horizontal=True,
+            help="À la date choisie, vendre après l'achat oblige à payer en parallèle les "
+                 "mensualités de Cachan et les charges (coût de portage)"
+        ) == 'Le jour de la vente'
+        loyer_après_vente = st.number_input(
+            "Loyer mensuel entre la vente et l'achat", 0, 5000, 0, step=100,
+            help="0 : le loyer compense exactement les mensualités et charges de Cachan"
+        )
+        if st.toggle('Afficher les dates de vente', key='date_vente'):
+            with instrumentation.étape('date de vente'):
+                projection_ventes = ventes(
+                    params, achat_à_la_vente=achat_à_la_vente,
+                    loyer_après_vente=loyer_après_vente or None,
+                )
+            st.markdown(
+                f'Vendre le {projection_ventes.meilleur_mois():%d/%m/%Y} donne le prix final '
+                "maximum le plus élevé, portage déduit : "
+                f"{sep_milliers(projection_ventes.série('prix_final_net').max())} €."
+            )
+            df_ventes = projection_ventes.to_frame().rename(columns=SÉRIES_VENTE)
+            st.line_chart(df_ventes[[
+                SÉRIES_VENTE[champ] for champ in ('prix_final_net', 'produit_net_vente')
+            ]])
+    else:
+        st.info("Sans vente de l'appartement de Cachan.", icon=':material/info:')
+with st.expander('Répartition optimale entre le PEL et le prêt principal'):
+    if not est_PEL_intéressant:
+        st.info(
+            f'Le PEL ({TAUX_PEL:.2%}) ne devient intéressant que si le taux nominal '
+            'le dépasse.', icon=':material/info:'
+        )
+    elif st.toggle("Chercher l'optimum", key='optimum_PEL'):
+        with instrumentation.étape('optimisation PEL'):
+            optimum = optimise_PEL(params)
+            # Le curseur de la barre latérale avance par pas de PAS_CURSEUR_PEL et laisse
+            # `get_mt_max_prêt_PEL` choisir la durée et les intérêts : prix atteignable
+            curseur_atteignable = min(
+                np.ceil(round(optimum.curseur_PEL / PAS_CURSEUR_PEL, 6)) * PAS_CURSEUR_PEL, 1.
+            )
+            atteignable = simulate(dataclasses.replace(params, curseur_PEL=curseur_atteignable))
+        st.markdown(
+            f'Le prix final maximal est de **{sep_milliers(optimum.prix_final_maximum)} €** '
+            f'(contre {sep_milliers(r.prix_final_maximum)} € avec le curseur actuel), '
+            f'avec curseur_PEL = {optimum.curseur_PEL:.4f}, un prêt PEL sur '
+            f'{optimum.durée_du_prêt_PEL} ans et '
+            f"{sep_milliers(optimum.intérêts_acquis_utilisés_PEL)} € d'intérêts acquis utilisés. "
+            "La durée et les intérêts utilisés ne se règlent pas depuis l'application : "
+            f'avec curseur_PEL = {curseur_atteignable:.2f} dans la barre latérale, le prix '
+            f'final maximum est de {sep_milliers(atteignable.prix_final_maximum)} €.'
+        )
+        st.line_chart(optimum.courbe.set_index('curseur_PEL'))
+
+with st.expander('Renégociation ou rachat du prêt'):
+    mode_refinancement = st.radio(
+        'Refinancement', MODES_REFINANCEMENT, horizontal=True,
+        help="Rachat par une autre banque (indemnités de remboursement anticipé, frais de "
+             "dossier et de garantie) ou renégociation avec la banque actuelle (avenant)"
+    )
+    nb_trajectoires = st.number_input(
+        'Nombre de trajectoires de taux', 100, 100_000, 10_000, step=1000
+    )
+    if st.button('Simuler les trajectoires de taux'):
+        with instrumentation.étape('refinancement'):
+            trajectoires = trajectoires_taux(
+                tx_nominal, nb_trajectoires=nb_trajectoires,
+                nb_mois=params.nb_années_pr_rembourser * 12, graine=0,
+            )
+            refinancement = refinance(params, trajectoires, mode=mode_refinancement)
+        refinancés = refinancement.mois_optimal > 0
+        st.markdown(
+            f'Sur {sep_milliers(nb_trajectoires)} trajectoires de taux, refinancer rapporte '
+            f'quelque chose dans {refinancement.proportion_intéressante:.0%} des cas. '
+            "Au meilleur mois (à trajectoire connue), l'économie médiane est de "
+            f'**{sep_milliers(np.median(refinancement.économie_optimale))} €**'
+            + (
+                f', au bout de {np.median(refinancement.mois_optimal[refinancés]):.0f} mois '
+                'en médiane.' if refinancés.any() else '.'
+            )
+        )
+        st.bar_chart(
+            pd.Series(refinancement.mois_optimal[refinancés] // 12, name='trajectoires')
+            .value_counts().sort_index().rename_axis('année du refinancement')
+        )
+
+with st.expander('Sensibilité du prix final aux hypothèses'):
+    if st.toggle('Calculer les sensibilités', key='sensibilité'):
+        import altair as alt
+
+        pas_sensibilité = st.slider('Variation de chaque entrée (%)', 1, 50, 10) / 100
+        with instrumentation.étape('sensibilité'):
+            df_sensibilité = sensibilités(params, pas_relatif=pas_sensibilité)
+        df_tornade = df_sensibilité.melt(
+            id_vars='champ', value_vars=['impact_bas', 'impact_haut'],
+            var_name='variation', value_name='impact'
+        ).replace({
+            'impact_bas': f'-{pas_sensibilité:.0%}', 'impact_haut': f'+{pas_sensibilité:.0%}'
+        })
+        st.altair_chart(
+            alt.Chart(df_tornade).mark_bar().encode(
+                x=alt.X('impact:Q', title='Écart de prix final maximum (€)'),
+                y=alt.Y('champ:N', sort=list(df_sensibilité['champ']), title=None),
+                color=alt.Color('variation:N', title="Variation de l'entrée"),
+                tooltip=['champ', 'variation', alt.Tooltip('impact:Q', format=',.0f')],
+            )
+        )
+        st.dataframe(
+            df_sensibilité.set_index('champ')[[
+                'valeur_basse', 'valeur', 'valeur_haute', 'impact_bas', 'impact_haut',
+                'élasticité'
+            ]]
+        )
 st.markdown('-' * 3)
 
 
@@ -484,19 +627,46 @@ st.markdown(
     * des éventuels frais de courtage,
     * des éventuels frais de tenue de compte en cas d'ouverture de compte dans une banque,
     * des éventuels frais de garanties (hypothèque ou cautionnement),
-    * d'une éventuelle renégociation de taux ultérieure,
+    * d'une éventuelle renégociation de taux ultérieure (explorée à part ci-dessus),
     * de l'[impôt sur la plus-value immobilière](https://www.service-public.fr/particuliers/vosdroits/F10864) en cas d'achat d'une résidence secondaire (TODO)
 
     Hypothèses prises :
     * Pour prédire l'inflation, on a estimé l'inflation moyenne dans la ville
     sur les {INFLATION_SUR_NB_YEARS} dernières années, et projeté ce taux d'inflation sur le temps restant avant achat.
-    * En cas de revente de l'appartement cachanais, on suppose que la vente a lieu en même temps que
-    l'achat du futur logement.
+    * En cas de revente de l'appartement cachanais, le prix final ci-dessus suppose que la vente a
+    lieu le jour de l'achat du futur logement. La section « Date de vente de Cachan » évalue une
+    vente à chaque mois restant du prêt LBP, avant ou après l'achat, coût de portage déduit.
     """
 )
 
+instrumentation.enregistre('rendu', time.perf_counter() - début_rendu)
+if profilage:
+    with st.expander('Profilage', expanded=True):
+        st.caption(
+            'Étapes recalculées à cette exécution : '
+            + (', '.join(st.session_state.calcul.recalculées) or 'aucune')
+        )
+        stats_cache = cache_disque.statistiques()
+        st.caption(
+            f"Cache disque (tous processus) : {stats_cache['nb_entrées']} entrées, "
+            f"{stats_cache['taille'] / 2**20:.1f} Mo ; dans ce processus : "
+            f"{stats_cache['succès']} succès, {stats_cache['échecs']} échecs"
+        )
+        st.dataframe(
+            pd.DataFrame(instrumentation.statistiques()).T,
+            column_config={
+                'durée_totale': st.column_config.NumberColumn(format='%.6f s'),
+                'durée_moyenne': st.column_config.NumberColumn(format='%.6f s'),
+            }
+        )
+        st.download_button(
+            'Exporter les mesures (JSON lines)', instrumentation.en_jsonl(),
+            file_name='profilage.jsonl'
+        )
+        if st.button('Réinitialiser les mesures'):
+            instrumentation.réinitialise()
+
 # TODO :
 # refactoring
 # vf que pour un euro d'emprunt supplémentaire, ça passe plus (mensualité > mensualité max)
-# compte à terme : https://placement.meilleurtaux.com/assurance-vie/actualites/2024-avril/voici-le-meilleur-compte-a-terme-en-2024.html
 # Y a-t-il une assurance du PEL ?
@@ -0,0 +1,77 @@
+"""
+Balayage de paramètres : évalue le budget sur le produit cartésien de plusieurs plages
+d'entrées de la barre latérale, en un seul appel vectorisé de `simulate`.
+
+Chaque plage reçoit son propre axe (forme (1, ..., n, ..., 1)) et NumPy diffuse les
+calculs sur la grille complète ; aucune boucle Python sur les points de la grille.
+
+>>> b = balaye(ScenarioParams(), tx_nominal=np.arange(0.02, 0.04, 0.001),
+...            nb_années_pr_rembourser=[15, 20, 25])
+>>> b.grille('prix_final_maximum').shape
+(20, 3)
+"""
+import dataclasses
+
+import numpy as np
+import pandas as pd
+
+from simulation import ScenarioParams, ScenarioResult, simulate
+from table_resultats import TableRésultats
+
+CHAMPS_BALAYABLES = [champ.name for champ in dataclasses.fields(ScenarioParams)]
+
+
+def en_tableau(champ: str, valeurs) -> np.ndarray:
+    """Les valeurs d'un champ de `ScenarioParams` en tableau (dates en datetime64[D])"""
+    if champ in ('date_achat', 'date_vente', 'date_calcul'):
+        return np.asarray(valeurs, dtype='datetime64[D]')
+    return np.asarray(valeurs)
+
+
+@dataclasses.dataclass(frozen=True)
+class Balayage:
+    """Résultats d'un balayage : un axe par paramètre balayé, dans l'ordre des arguments"""
+    axes: dict
+    résultat: ScenarioResult
+
+    @property
+    def forme(self) -> tuple:
+        return tuple(len(valeurs) for valeurs in self.axes.values())
+
+    def grille(self, champ: str) -> np.ndarray:
+        """Le champ `champ` du résultat, sur la grille complète"""
+        return np.broadcast_to(getattr(self.résultat, champ), self.forme)
+
+    def to_table(self, réels=np.float64) -> TableRésultats:
+        """Une ligne par point de la grille, dans l'ordre de `to_frame`"""
+        # Chaque champ diffusé sur la grille (vues), pour avoir bien une ligne par point
+        return TableRésultats.depuis_résultat(ScenarioResult(**{
+            champ.name: self.grille(champ.name) for champ in dataclasses.fields(ScenarioResult)
+        }), réels)
+
+    def to_frame(self, champs=None) -> pd.DataFrame:
+        """Une ligne par point de la grille, indexée par les valeurs des paramètres"""
+        champs = champs or [champ.name for champ in dataclasses.fields(ScenarioResult)]
+        index = pd.MultiIndex.from_product(list(self.axes.values()), names=list(self.axes))
+        return pd.DataFrame(
+            {champ: self.grille(champ).ravel() for champ in champs}, index=index
+        )
+
+
+def balaye(base: ScenarioParams = ScenarioParams(), **plages) -> Balayage:
+    """
+    `plages` associe à des champs de `ScenarioParams` les valeurs à explorer ; les autres
+    champs sont pris dans `base`. Les champs à None de `base` sont résolus point par point
+    (par exemple `remb_anticipé_gratuit` suit la date d'achat balayée).
+    """
+    inconnus = set(plages) - set(CHAMPS_BALAYABLES)
+    if inconnus:
+        raise ValueError(f'Paramètres inconnus : {sorted(inconnus)}')
+    axes = {champ: en_tableau(champ, valeurs) for champ, valeurs in plages.items()}
+    diffusés = {}
+    for i, (champ, valeurs) in enumerate(axes.items()):
+        forme = [1] * len(axes)
+        forme[i] = len(valeurs)
+        diffusés[champ] = valeurs.reshape(forme)
+    résultat = simulate(dataclasses.replace(base, **diffusés))
+    return Balayage(axes=axes, résultat=résultat)
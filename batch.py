@@ -0,0 +1,136 @@
+"""
+Calcul en lot : lit des scénarios au format JSONL (un objet par ligne, avec les champs de
+`ScenarioParams`, dates au format AAAA-MM-JJ, et un éventuel "id") et écrit une ligne de
+résultats par scénario, une colonne par ligne du budget, dans un dossier Parquet.
+
+Le fichier d'entrée est lu au fil de l'eau, par paquets de `--taille-paquet` lignes,
+répartis sur un pool de processus. Chaque paquet est écrit dans son propre fichier
+`part-000042.parquet` : la mémoire reste constante quelle que soit la taille de l'entrée,
+et une exécution interrompue reprend là où elle s'était arrêtée (les paquets déjà écrits
+sont sautés).
+
+$ python batch.py scenarios.jsonl resultats/ --processus 8
+$ python -c "import pandas as pd; print(pd.read_parquet('resultats/'))"
+"""
+import argparse
+import dataclasses
+import itertools
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from balayage import en_tableau
+from simulation import ScenarioParams, ScenarioResult, résout, simulate
+
+CHAMPS_PARAMS = [champ.name for champ in dataclasses.fields(ScenarioParams)]
+CHAMPS_RÉSULTAT = [champ.name for champ in dataclasses.fields(ScenarioResult)]
+
+
+def params_depuis_scénarios(scénarios: list) -> ScenarioParams:
+    """
+    Un `ScenarioParams` dont chaque champ est un tableau (un élément par scénario JSON).
+    Les champs absents d'un scénario prennent la valeur par défaut, résolue un par un.
+    """
+    inconnus = {clé for scénario in scénarios for clé in scénario} - set(CHAMPS_PARAMS) - {'id'}
+    if inconnus:
+        raise ValueError(f'Champs inconnus : {sorted(inconnus)}')
+    colonnes, partiels = {}, {}
+    for champ in CHAMPS_PARAMS:
+        présents = np.array([champ in scénario for scénario in scénarios])
+        if not présents.any():
+            continue
+        défaut = getattr(ScenarioParams, champ)
+        valeurs = [scénario.get(champ, défaut) for scénario in scénarios]
+        if défaut is None and not présents.all():
+            partiels[champ] = présents, valeurs
+        else:
+            colonnes[champ] = en_tableau(champ, valeurs)
+    params = résout(ScenarioParams(**colonnes))
+    for champ, (présents, valeurs) in partiels.items():
+        défauts = np.broadcast_to(getattr(params, champ), présents.shape)
+        valeurs = [v if présent else d for v, d, présent in zip(valeurs, défauts, présents)]
+        colonnes[champ] = en_tableau(champ, valeurs)
+    return résout(ScenarioParams(**colonnes)) if partiels else params
+
+
+def _traite_paquet(index: int, première_ligne: int, lignes: list, dossier: Path) -> int:
+    scénarios = [json.loads(ligne) for ligne in lignes]
+    r = simulate(params_depuis_scénarios(scénarios))
+    ids = [scénario.get('id', première_ligne + i) for i, scénario in enumerate(scénarios)]
+    table = pa.table({
+        'id': pa.array([str(id_) for id_ in ids]),
+        **{
+            champ: np.broadcast_to(getattr(r, champ), (len(lignes),))
+            for champ in CHAMPS_RÉSULTAT
+        }
+    })
+    # Écriture puis renommage : un paquet présent sur disque est toujours complet
+    chemin = dossier / f'part-{index:06d}.parquet'
+    tmp = chemin.with_suffix('.tmp')
+    pq.write_table(table, tmp)
+    os.replace(tmp, chemin)
+    return len(lignes)
+
+
+def _paquets(chemin_jsonl: Path, taille_paquet: int):
+    with open(chemin_jsonl, encoding='utf-8') as f:
+        lignes = (ligne for ligne in f if ligne.strip())
+        for index in itertools.count():
+            paquet = list(itertools.islice(lignes, taille_paquet))
+            if not paquet:
+                return
+            yield index, index * taille_paquet, paquet
+
+
+def calcule_en_lot(chemin_jsonl, dossier_sortie, taille_paquet: int = 10_000,
+                   nb_processus: int = None) -> tuple:
+    """Retourne (nombre de scénarios calculés, durée en secondes)"""
+    dossier = Path(dossier_sortie)
+    dossier.mkdir(parents=True, exist_ok=True)
+    chemin_meta = dossier / '_meta.json'
+    if chemin_meta.exists():
+        meta = json.loads(chemin_meta.read_text())
+        if meta['taille_paquet'] != taille_paquet:
+            raise ValueError(
+                f"{dossier} a été commencé avec --taille-paquet {meta['taille_paquet']}"
+            )
+    else:
+        chemin_meta.write_text(json.dumps({'taille_paquet': taille_paquet}))
+
+    nb_processus = nb_processus or os.cpu_count()
+    début, nb_scénarios = time.perf_counter(), 0
+    with ProcessPoolExecutor(max_workers=nb_processus) as pool:
+        en_cours = set()
+        for index, première_ligne, lignes in _paquets(chemin_jsonl, taille_paquet):
+            if (dossier / f'part-{index:06d}.parquet').exists():
+                continue
+            # Au plus deux paquets en attente par processus : la lecture ne prend pas
+            # d'avance sur le calcul
+            if len(en_cours) >= 2 * nb_processus:
+                finis, en_cours = wait(en_cours, return_when=FIRST_COMPLETED)
+                nb_scénarios += sum(future.result() for future in finis)
+            en_cours.add(pool.submit(_traite_paquet, index, première_ligne, lignes, dossier))
+        nb_scénarios += sum(future.result() for future in en_cours)
+    return nb_scénarios, time.perf_counter() - début
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('scenarios', type=Path, help='fichier JSONL des scénarios')
+    parser.add_argument('sortie', type=Path, help='dossier Parquet des résultats')
+    parser.add_argument('--taille-paquet', type=int, default=10_000)
+    parser.add_argument('--processus', type=int, default=None)
+    args = parser.parse_args()
+    nb_scénarios, durée = calcule_en_lot(
+        args.scenarios, args.sortie, args.taille_paquet, args.processus
+    )
+    print(
+        f'{nb_scénarios} scénarios calculés en {durée:.1f} s '
+        f'({nb_scénarios / max(durée, 1e-9):.0f} scénarios/s)'
+    )
@@ -0,0 +1,152 @@
+"""
+Benchmarks des fonctions critiques et du calcul complet du budget.
+
+Chaque benchmark est comparé à sa référence dans `benchmarks_reference.json` : le
+script échoue (code de retour 1) si l'un d'eux est plus lent que la référence de plus de
+`--tolérance` (100 % par défaut, les mesures étant bruitées). Les références dépendent de
+la machine ; après une optimisation volontaire, ou sur une nouvelle machine, on les
+régénère avec `--mise-à-jour`.
+
+$ python benchmarks.py
+$ python benchmarks.py --mise-à-jour
+$ python benchmarks.py --filtre simulate
+"""
+import argparse
+import datetime
+import json
+import subprocess
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+CHEMIN_RÉFÉRENCE = Path(__file__).parent / 'benchmarks_reference.json'
+DATE_CALCUL = datetime.date(2026, 1, 1)
+
+
+def _temps_import(module: str) -> float:
+    """Meilleure durée de l'import de `module` sur 3 interpréteurs neufs"""
+    return min(
+        float(subprocess.run(
+            [sys.executable, '-c',
+             f'import time; t = time.perf_counter(); import {module}; '
+             'print(time.perf_counter() - t)'],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        ).stdout)
+        for _ in range(3)
+    )
+
+
+def _scénarios(n: int):
+    """`n` scénarios tirés au hasard, en un seul `ScenarioParams` vectorisé"""
+    from simulation import ScenarioParams
+    rng = np.random.default_rng(0)
+    return ScenarioParams(
+        ville=rng.choice(['CACHAN', 'CHATOU', 'RUEIL-MALMAISON', 'VÉSINET'], n),
+        appart_ou_maison=rng.choice(['Maison', 'Appartement'], n),
+        date_achat=np.datetime64('2027-01-01') + rng.integers(0, 3000, n),
+        avec_vente_appartement=rng.random(n) < 0.5,
+        tx_nominal=rng.uniform(0.01, 0.05, n),
+        nb_années_pr_rembourser=rng.choice([15, 20, 25], n),
+        curseur_PEL=rng.uniform(0, 1, n),
+        gain_mensuel_pde=rng.integers(1000, 2500, n),
+        date_calcul=DATE_CALCUL,
+    )
+
+
+def benchmarks() -> dict:
+    """Nom -> fonction sans argument à chronométrer"""
+    import fonctions
+    import simulation
+    from simulation import ScenarioParams
+
+    début_prêt = simulation.DATE_DÉBUT_DU_PRÊT_EXISTANT
+    params = simulation.résout(ScenarioParams(date_calcul=DATE_CALCUL))
+    lots = {n: simulation.résout(_scénarios(n)) for n in (1, 10**3, 10**6)}
+    return {
+        'get_CRD_à_date': lambda: fonctions.get_CRD_à_date(
+            datetime.date(2029, 1, 1), début_prêt, simulation.MONTANT_EMPRUNTE
+        ),
+        'PrêtExistant.CRD_à_date': lambda: simulation.PRÊT_LBP.CRD_à_date(
+            datetime.date(2029, 1, 1)
+        ),
+        # Sans le cache par conditions du prêt
+        'génération tableau_amortissement': lambda: (
+            fonctions._génère_tableau_amortissement.__wrapped__(
+                simulation.MONTANT_EMPRUNTE, simulation.TX_LBP / 100, 240, 0.
+            )
+        ),
+        'get_tableau_amortissement_prêt_pierre': lambda: (
+            fonctions.get_tableau_amortissement_prêt_pierre(simulation.MONTANT_EMPRUNTE)
+        ),
+        'get_mt_max_prêt_PEL': lambda: fonctions.get_mt_max_prêt_PEL(
+            fonctions.get_barême(), mt_intérêts_acquis_PEL=3712, mensualité_plafond=421
+        ),
+        # Pire cas de l'ancienne version récursive : plafond très bas, beaucoup d'intérêts
+        'get_mt_max_prêt_PEL (plafond bas)': lambda: fonctions.get_mt_max_prêt_PEL(
+            fonctions.get_barême(), mt_intérêts_acquis_PEL=50_000, mensualité_plafond=1
+        ),
+        'get_mt_emprunt_max': lambda: fonctions.get_mt_emprunt_max(1164, 0.02, 20 * 12),
+        'sep_milliers': lambda: fonctions.sep_milliers(1254839.1245, 2),
+        # Sans le cache de `simulate`
+        'simulate': lambda: simulation._simule(params),
+        **{
+            f'simulate x {n}': (lambda lot=lot: simulation._simule(lot))
+            for n, lot in lots.items()
+        },
+    }
+
+
+def mesure(fonction, durée_min: float = 0.2) -> float:
+    """Meilleure durée d'un appel, en secondes, sur 7 séries d'au moins `durée_min`"""
+    timer = timeit.Timer(fonction)
+    nb_appels, _ = timer.autorange()
+    nb_appels = max(1, int(nb_appels * durée_min / 0.2))
+    return min(timer.repeat(repeat=7, number=nb_appels)) / nb_appels
+
+
+def _format(secondes: float) -> str:
+    for unité, facteur in (('s', 1), ('ms', 1e-3), ('µs', 1e-6)):
+        if secondes >= facteur:
+            return f'{secondes / facteur:8.2f} {unité}'
+    return f'{secondes / 1e-9:8.2f} ns'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mise-à-jour', action='store_true',
+                        help='enregistre les mesures comme nouvelles références')
+    parser.add_argument('--tolérance', type=float, default=1.0)
+    parser.add_argument('--filtre', default='',
+                        help='ne lance que les benchmarks contenant ce texte')
+    args = parser.parse_args()
+
+    références = json.loads(CHEMIN_RÉFÉRENCE.read_text()) if CHEMIN_RÉFÉRENCE.exists() else {}
+    mesures = {}
+    if args.filtre in 'import fonctions':
+        mesures['import fonctions'] = _temps_import('fonctions')
+    for nom, fonction in benchmarks().items():
+        if args.filtre in nom:
+            mesures[nom] = mesure(fonction)
+
+    régressions = []
+    for nom, durée in mesures.items():
+        ligne = f'{nom:<40} {_format(durée)}'
+        if nom in références:
+            ratio = durée / références[nom]
+            ligne += f'   x{ratio:5.2f} vs référence'
+            if ratio > 1 + args.tolérance:
+                régressions.append(nom)
+                ligne += '   RÉGRESSION'
+        print(ligne)
+
+    if args.mise_à_jour:
+        CHEMIN_RÉFÉRENCE.write_text(
+            json.dumps({**références, **mesures}, indent=2, ensure_ascii=False) + '\n'
+        )
+        print(f'Références enregistrées dans {CHEMIN_RÉFÉRENCE.name}')
+    elif régressions:
+        print(f'{len(régressions)} régression(s) au-delà de +{args.tolérance:.0%} : '
+              + ', '.join(régressions))
+        sys.exit(1)
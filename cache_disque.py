@@ -0,0 +1,298 @@
+"""
+Cache persistant des résultats coûteux (budgets complets, répartition optimale du PEL,
+sensibilités...), partagé par toutes les sessions Streamlit, les processus de calcul en
+lot et les redémarrages du serveur.
+
+Une base SQLite dans `DOSSIER_CACHE` associe à chaque clé le résultat sérialisé
+(pickle). La clé est un hash SHA-256 :
+- du nom de la fonction et de ses arguments (champs des dataclasses, contenu des
+  tableaux NumPy) ;
+- du contenu des fichiers de données (`data/*.csv` et le référentiel DVF) ;
+- de la version du code (contenu des fichiers .py du projet).
+Modifier un CSV ou le code rend donc les anciennes entrées inaccessibles ; elles
+finissent évincées.
+
+La taille totale est bornée (`TAILLE_MAX`) : au-delà, les entrées les moins récemment
+lues sont supprimées (LRU). La base est en mode WAL, chaque écriture est une transaction
+`BEGIN IMMEDIATE` avec attente en cas de verrou : plusieurs processus peuvent s'en
+servir en même temps. Toute erreur d'accès (disque plein, données en lecture seule...)
+revient à calculer sans cache.
+
+Actif par défaut ; SIMULATION_CACHE_DISQUE=0 le désactive.
+
+>>> @en_cache_disque
+... def calcul_long(params): ...
+>>> statistiques()
+{'succès': 0, 'échecs': 0, 'nb_entrées': 0, 'taille': 0, ...}
+"""
+import dataclasses
+import datetime
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+import instrumentation
+from fonctions import DOSSIER_CACHE, DOSSIER_DATA
+
+CHEMIN_BASE = DOSSIER_CACHE / 'resultats.sqlite'
+TAILLE_MAX = 256 * 2**20  # octets
+DOSSIER_CODE = Path(__file__).parent
+
+_actif = os.environ.get('SIMULATION_CACHE_DISQUE', '1') != '0'
+
+
+def active(actif: bool = True):
+    global _actif
+    _actif = actif
+
+
+def est_actif() -> bool:
+    return _actif
+
+
+def _ajoute_empreinte(h, objet):
+    """Ajoute à `h` une représentation stable de `objet`, quel que soit son type NumPy"""
+    if dataclasses.is_dataclass(objet) and not isinstance(objet, type):
+        h.update(type(objet).__qualname__.encode())
+        for champ in dataclasses.fields(objet):
+            h.update(champ.name.encode())
+            _ajoute_empreinte(h, getattr(objet, champ.name))
+    elif isinstance(objet, np.ndarray) and objet.ndim:
+        h.update(f'ndarray {objet.dtype.str} {objet.shape}'.encode())
+        h.update(np.ascontiguousarray(objet).tobytes())
+    elif isinstance(objet, (np.ndarray, np.generic)):
+        _ajoute_empreinte(h, objet.item())
+    elif isinstance(objet, dict):
+        h.update(b'dict')
+        for clé in sorted(objet, key=repr):
+            _ajoute_empreinte(h, clé)
+            _ajoute_empreinte(h, objet[clé])
+    elif isinstance(objet, (list, tuple)):
+        h.update(f'{type(objet).__name__} {len(objet)}'.encode())
+        for élément in objet:
+            _ajoute_empreinte(h, élément)
+    elif isinstance(objet, (str, int, float, bool, type(None), datetime.date)):
+        h.update(f'{type(objet).__name__} {objet!r};'.encode())
+    else:
+        raise TypeError(f'Argument de type {type(objet).__name__} : pas de clé de cache')
+
+
+@functools.cache
+def version_code() -> str:
+    """Hash des sources du projet, calculé une fois par processus"""
+    h = hashlib.sha256()
+    for chemin in sorted(DOSSIER_CODE.glob('*.py')):
+        h.update(chemin.name.encode())
+        h.update(chemin.read_bytes())
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=64)
+def _hash_fichier(chemin: Path, signature: tuple) -> str:
+    """Mis en cache par (chemin, date de modification, taille) : relu si le fichier change"""
+    return hashlib.sha256(chemin.read_bytes()).hexdigest()
+
+
+def _signature_dossier(dossier: Path, suffixes: tuple) -> tuple:
+    """(nom, date de modification, taille) des fichiers de `dossier` ayant ces suffixes"""
+    try:
+        with os.scandir(dossier) as entrées:
+            return tuple(sorted(
+                (entrée.name, stat.st_mtime_ns, stat.st_size)
+                for entrée in entrées if entrée.name.endswith(suffixes) and entrée.is_file()
+                for stat in (entrée.stat(),)
+            ))
+    except OSError:
+        return ()
+
+
+def version_données() -> str:
+    """
+    Ne relit que les signatures des fichiers (quelques µs) : assez rapide pour être
+    vérifiée à chaque appel d'une fonction mise en cache en mémoire
+    """
+    return _version_données(
+        _signature_dossier(DOSSIER_DATA, ('.csv', '.npz')),
+        _signature_dossier(DOSSIER_DATA / 'index_communes', ('.npy',)),
+    )
+
+
+@functools.lru_cache(maxsize=8)
+def _version_données(fichiers: tuple, fichiers_index: tuple) -> str:
+    h = hashlib.sha256()
+    for nom, *signature in fichiers:
+        h.update(nom.encode())
+        h.update(_hash_fichier(DOSSIER_DATA / nom, tuple(signature)).encode())
+    # L'index des communes (cf index_communes.py), trop gros pour être relu : sa date de
+    # modification et sa taille suffisent, le dossier étant remplacé d'un coup
+    for nom, mtime, taille in fichiers_index:
+        h.update(f'{nom}:{mtime}:{taille}'.encode())
+    return h.hexdigest()
+
+
+def clé(nom: str, *args, **kwargs) -> str:
+    h = hashlib.sha256()
+    h.update(version_code().encode())
+    h.update(version_données().encode())
+    h.update(nom.encode())
+    _ajoute_empreinte(h, args)
+    _ajoute_empreinte(h, kwargs)
+    return h.hexdigest()
+
+
+class CacheDisque:
+    def __init__(self, chemin=CHEMIN_BASE, taille_max: int = TAILLE_MAX):
+        self.chemin = Path(chemin)
+        self.taille_max = taille_max
+        self.succès = 0
+        self.échecs = 0
+        self._connexions = threading.local()
+
+    def _connexion(self) -> sqlite3.Connection:
+        """Une connexion par thread et par processus (pas de partage après un fork)"""
+        connexion = getattr(self._connexions, 'connexion', None)
+        if connexion is not None and self._connexions.pid == os.getpid():
+            return connexion
+        self.chemin.parent.mkdir(parents=True, exist_ok=True)
+        connexion = sqlite3.connect(self.chemin, timeout=30, isolation_level=None)
+        connexion.execute('PRAGMA journal_mode=WAL')
+        connexion.execute('PRAGMA synchronous=NORMAL')
+        connexion.executescript('''
+            CREATE TABLE IF NOT EXISTS résultats (
+                clé TEXT PRIMARY KEY,
+                valeur BLOB NOT NULL,
+                taille INTEGER NOT NULL,
+                dernier_accès REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS résultats_dernier_accès ON résultats (dernier_accès);
+        ''')
+        self._connexions.connexion, self._connexions.pid = connexion, os.getpid()
+        return connexion
+
+    def lit(self, clé: str):
+        """(True, valeur) si `clé` est en cache, sinon (False, None)"""
+        trouvé, valeur = False, None
+        try:
+            connexion = self._connexion()
+            ligne = connexion.execute(
+                'SELECT valeur FROM résultats WHERE clé = ?', (clé,)
+            ).fetchone()
+            if ligne is not None:
+                try:
+                    trouvé, valeur = True, pickle.loads(ligne[0])
+                except (pickle.UnpicklingError, EOFError, AttributeError, ImportError,
+                        TypeError, ValueError):
+                    # Entrée tronquée, ou écrite par une version des classes qui n'existe
+                    # plus : on la supprime et on recalcule
+                    trouvé, valeur = False, None
+                    connexion.execute('DELETE FROM résultats WHERE clé = ?', (clé,))
+                else:
+                    connexion.execute(
+                        'UPDATE résultats SET dernier_accès = ? WHERE clé = ?',
+                        (time.time(), clé)
+                    )
+        except (OSError, sqlite3.Error):
+            pass
+        if trouvé:
+            self.succès += 1
+        else:
+            self.échecs += 1
+        return trouvé, valeur
+
+    def écrit(self, clé: str, valeur):
+        données = pickle.dumps(valeur, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(données) > self.taille_max // 4:
+            return  # une seule entrée ne doit pas vider le cache
+        try:
+            connexion = self._connexion()
+            connexion.execute('BEGIN IMMEDIATE')
+            try:
+                connexion.execute(
+                    'INSERT OR REPLACE INTO résultats VALUES (?, ?, ?, ?)',
+                    (clé, données, len(données), time.time())
+                )
+                self._évince(connexion)
+                connexion.execute('COMMIT')
+            except BaseException:
+                connexion.execute('ROLLBACK')
+                raise
+        except (OSError, sqlite3.Error):
+            pass
+
+    def _évince(self, connexion: sqlite3.Connection):
+        """Supprime les entrées les moins récemment lues au-delà de `taille_max`"""
+        (taille,) = connexion.execute('SELECT COALESCE(SUM(taille), 0) FROM résultats').fetchone()
+        if taille <= self.taille_max:
+            return
+        # On redescend à 90 % de la taille maximale, pour ne pas évincer à chaque écriture
+        connexion.execute('''
+            DELETE FROM résultats WHERE clé IN (
+                SELECT clé FROM (
+                    SELECT clé, SUM(taille) OVER (ORDER BY dernier_accès DESC, clé) AS cumul
+                    FROM résultats
+                ) WHERE cumul > ?
+            )
+        ''', (int(0.9 * self.taille_max),))
+
+    def vide(self):
+        try:
+            self._connexion().execute('DELETE FROM résultats')
+        except (OSError, sqlite3.Error):
+            pass
+
+    def statistiques(self) -> dict:
+        try:
+            nb_entrées, taille = self._connexion().execute(
+                'SELECT COUNT(*), COALESCE(SUM(taille), 0) FROM résultats'
+            ).fetchone()
+        except (OSError, sqlite3.Error):
+            nb_entrées, taille = 0, 0
+        return {
+            'succès': self.succès,
+            'échecs': self.échecs,
+            'nb_entrées': nb_entrées,
+            'taille': taille,
+            'taille_max': self.taille_max,
+            'chemin': str(self.chemin),
+        }
+
+
+CACHE = CacheDisque()
+
+
+def statistiques() -> dict:
+    return CACHE.statistiques()
+
+
+def en_cache_disque(fonction):
+    """
+    Met en cache sur disque les résultats de `fonction`, selon ses arguments. Les
+    arguments sans représentation stable (objets quelconques) désactivent le cache
+    pour cet appel.
+    """
+    nom = f'{fonction.__module__}.{fonction.__qualname__}'
+
+    @functools.wraps(fonction)
+    def enveloppe(*args, **kwargs):
+        if not _actif:
+            return fonction(*args, **kwargs)
+        try:
+            clé_appel = clé(nom, *args, **kwargs)
+        except TypeError:
+            return fonction(*args, **kwargs)
+        trouvé, valeur = CACHE.lit(clé_appel)
+        instrumentation.compte_cache(f'disque {fonction.__name__}', trouvé)
+        if trouvé:
+            return valeur
+        valeur = fonction(*args, **kwargs)
+        CACHE.écrit(clé_appel, valeur)
+        return valeur
+
+    return enveloppe
@@ -0,0 +1,73 @@
+"""
+Projection mois par mois, d'aujourd'hui à la date d'achat.
+
+Au lieu d'un calcul à la seule date d'achat, on évalue le budget pour un achat à chaque
+échéance mensuelle (même jour du mois que la date de calcul) et à la date d'achat
+elle-même, d'un seul appel vectorisé de `simulate` : apports, CRD du prêt de Cachan,
+prix de revente projeté, niveau des prix dans la ville visée et prix final maximum sont
+des tableaux alignés sur les mêmes mois.
+Chaque achat est évalué avec le décompte des mois de `base` (`mois_calendaires`) : le
+dernier point redonne le résultat principal.
+
+>>> c = chronologie(ScenarioParams(date_achat=datetime.date(2029, 1, 1)))
+>>> c.meilleur_mois()
+"""
+import dataclasses
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from fonctions import ajoute_mois, nb_mois_calendaires
+from simulation import ScenarioParams, ScenarioResult, résout, simulate
+
+# Séries retenues pour l'affichage, dans l'ordre
+SÉRIES = {
+    'montant_total_qui_sera_apporté': 'Apports',
+    'CRD': 'CRD du prêt de Cachan',
+    'prix_estimé_revente': 'Prix de revente de Cachan',
+    'solde_revente': 'Solde de la revente',
+    'inflation_temps_restant_avant_achat': 'Niveau des prix dans la ville (base 1 aujourd’hui)',
+    'budget': 'Budget avant déductions',
+    'prix_final_maximum': 'Prix final maximum',
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class Chronologie:
+    dates: np.ndarray  # datetime64[D], une par mois
+    résultat: ScenarioResult  # chaque champ a la forme de `dates`
+
+    def série(self, champ: str) -> np.ndarray:
+        return np.broadcast_to(getattr(self.résultat, champ), self.dates.shape)
+
+    def meilleur_mois(self, champ: str = 'prix_final_maximum') -> datetime.date:
+        """Le mois d'achat qui maximise `champ` (le premier, en cas d'égalité)"""
+        return self.dates[np.argmax(self.série(champ))].astype(datetime.date)
+
+    def to_frame(self, champs=SÉRIES) -> pd.DataFrame:
+        return pd.DataFrame(
+            {champ: self.série(champ) for champ in champs},
+            index=pd.DatetimeIndex(self.dates, name='date_achat')
+        )
+
+
+def chronologie(base: ScenarioParams, date_fin=None) -> Chronologie:
+    """
+    Un achat à chaque mois, de la date de calcul jusqu'à `date_fin` (par défaut la date
+    d'achat de `base`). La clause de remboursement anticipé gratuit suit alors la date
+    de vente, quel que soit `base.remb_anticipé_gratuit`. Sans `base.date_vente`, Cachan
+    est vendu le jour de chaque achat. `base` doit être scalaire.
+    """
+    date_vente = base.date_vente
+    base = résout(base)
+    date_fin = base.date_achat if date_fin is None else date_fin
+    nb_mois = max(int(np.floor(nb_mois_calendaires(base.date_calcul, date_fin))), 0)
+    dates = ajoute_mois(base.date_calcul, np.arange(nb_mois + 1))
+    if dates[-1] < np.datetime64(date_fin, 'D'):
+        # La date d'achat elle-même est le dernier point, même hors des échéances mensuelles
+        dates = np.append(dates, np.datetime64(date_fin, 'D'))
+    résultat = simulate(dataclasses.replace(
+        base, date_achat=dates, date_vente=date_vente, remb_anticipé_gratuit=None
+    ))
+    return Chronologie(dates=dates, résultat=résultat)
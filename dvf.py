@@ -0,0 +1,173 @@
+"""
+Inflation locale des prix à partir des fichiers DVF (Demandes de valeurs foncières).
+
+Ingestion hors ligne des fichiers annuels « géolocalisés » d'etalab
+(https://files.data.gouv.fr/geo-dvf/latest/csv/<année>/full.csv.gz), téléchargés dans
+`data/dvf/` :
+
+$ python dvf.py data/dvf/*.csv.gz
+
+Les fichiers sont lus par paquets de lignes (mémoire bornée, même pour les fichiers
+nationaux de plusieurs Go). On ne garde que les ventes d'une seule maison ou d'un seul
+appartement (le prix d'une vente de plusieurs locaux ne peut pas être réparti), dont on
+accumule le prix au m² dans un histogramme logarithmique (pas de 0,5 %) par commune,
+type de local et année. La médiane s'en déduit à 0,25 % près, et l'inflation cumulée
+sur `INFLATION_SUR_NB_YEARS` ans est le rapport des médianes de la dernière année et de
+celle d'il y a `INFLATION_SUR_NB_YEARS` ans.
+
+Le résultat, quelques Mo pour toute la France, est écrit dans `CHEMIN_RÉFÉRENTIEL`
+(.npz, une colonne par tableau), d'où est tiré l'index projeté en mémoire lu par
+`simulation.résout` et l'application (cf `index_communes.py`) : toute commune qui y
+figure peut être choisie dans l'application, sans modifier le code. Les dictionnaires
+`LIEU_TO_INFLATION_*` ne servent plus que pour les communes absentes.
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from fonctions import DOSSIER_DATA, INFLATION_SUR_NB_YEARS
+
+CHEMIN_RÉFÉRENTIEL = DOSSIER_DATA / 'dvf_communes.npz'
+TYPES_LOCAL = ('Maison', 'Appartement')
+PAS_HISTOGRAMME = np.log1p(0.005)
+PRIX_M2_MIN, PRIX_M2_MAX = 100, 50_000  # au-delà : erreurs de saisie, ventes atypiques
+NB_VENTES_MIN = 10  # en deçà, la médiane d'une année n'est pas retenue
+COLONNES = {
+    'id_mutation': str,
+    'date_mutation': str,
+    'nature_mutation': str,
+    'valeur_fonciere': float,
+    'code_commune': str,
+    'nom_commune': str,
+    'code_departement': str,
+    'type_local': str,
+    'surface_reelle_bati': float,
+}
+
+
+def _ventes(paquet):
+    """Prix au m² des ventes d'un seul local d'habitation, avec commune, type et année"""
+    paquet = paquet[paquet['nature_mutation'] == 'Vente']
+    locaux = paquet[paquet['type_local'].isin(TYPES_LOCAL)]
+    locaux = locaux[locaux.groupby('id_mutation')['id_mutation'].transform('size') == 1]
+    locaux = locaux[locaux['surface_reelle_bati'] > 0]
+    prix_m2 = locaux['valeur_fonciere'] / locaux['surface_reelle_bati']
+    garde = (prix_m2 >= PRIX_M2_MIN) & (prix_m2 <= PRIX_M2_MAX)
+    locaux, prix_m2 = locaux[garde], prix_m2[garde]
+    return locaux.assign(
+        année=locaux['date_mutation'].str[:4].astype(int),
+        case=np.floor(np.log(prix_m2) / PAS_HISTOGRAMME).astype(int),
+    )
+
+
+def _paquets(chemins, taille_paquet: int):
+    """
+    Paquets de lignes DVF. Les lignes d'une même mutation se suivent : celles de la
+    dernière mutation d'un paquet sont reportées au paquet suivant, pour qu'une mutation
+    ne soit jamais coupée en deux.
+    """
+    import pandas as pd
+    for chemin in chemins:
+        report = None
+        lecteur = pd.read_csv(
+            chemin, usecols=list(COLONNES), dtype=COLONNES, chunksize=taille_paquet
+        )
+        for paquet in lecteur:
+            if report is not None:
+                paquet = pd.concat([report, paquet], ignore_index=True)
+            dernière = paquet['id_mutation'].iloc[-1]
+            à_reporter = (paquet['id_mutation'] == dernière).to_numpy()
+            report = paquet[à_reporter]
+            yield paquet[~à_reporter]
+        if report is not None:
+            yield report
+
+
+def histogrammes(chemins, taille_paquet: int = 500_000):
+    """
+    Nombre de ventes par (code_commune, nom_commune, code_departement, type_local,
+    année, case de l'histogramme des prix au m²). La taille du résultat ne dépend que
+    du nombre de cases non vides, pas de celle des fichiers.
+    """
+    import pandas as pd
+    clés = ['code_commune', 'nom_commune', 'code_departement', 'type_local', 'année', 'case']
+    cumul, en_attente = None, []
+    for paquet in _paquets(chemins, taille_paquet):
+        en_attente.append(_ventes(paquet).groupby(clés).size())
+        if len(en_attente) == 20:
+            cumul = pd.concat([cumul, *en_attente]).groupby(level=clés).sum()
+            en_attente = []
+    return pd.concat([cumul, *en_attente]).groupby(level=clés).sum().rename('nb_ventes')
+
+
+def médianes(histogrammes):
+    """Prix médian au m² et nombre de ventes par commune, type de local et année"""
+    groupes = ['code_commune', 'nom_commune', 'code_departement', 'type_local', 'année']
+    h = histogrammes.sort_index().reset_index()
+    par_groupe = h.groupby(groupes)['nb_ventes']
+    h['total'] = par_groupe.transform('sum')
+    h['cumul'] = par_groupe.cumsum()
+    # La médiane est au centre de la première case qui contient la moitié des ventes
+    h = h[2 * h['cumul'] >= h['total']].groupby(groupes).first()
+    h['prix_m2_médian'] = np.exp((h['case'] + 0.5) * PAS_HISTOGRAMME)
+    return h[['prix_m2_médian', 'total']].rename(columns={'total': 'nb_ventes'})
+
+
+def libellés(communes):
+    """
+    Nom de chaque commune en majuscules, comme les clés de `LIEU_TO_INFLATION_*` ; en
+    cas d'homonymes, suivi du département : 'SAINT-DENIS (93)'.
+    """
+    noms = communes['nom_commune'].str.upper()
+    homonymes = communes.groupby(noms)['code_commune'].transform('nunique') > 1
+    return noms.where(~homonymes, noms + ' (' + communes['code_departement'] + ')')
+
+
+def construit_référentiel(chemins, chemin_sortie=CHEMIN_RÉFÉRENTIEL,
+                          taille_paquet: int = 500_000):
+    m = médianes(histogrammes(chemins, taille_paquet))
+    fiables = m['nb_ventes'] >= NB_VENTES_MIN
+    prix = m['prix_m2_médian'].where(fiables).unstack('année')
+    nb_ventes = m['nb_ventes'].unstack('année', fill_value=0)
+    années = prix.columns.to_numpy()
+    année_réf = années.max()
+    if année_réf - INFLATION_SUR_NB_YEARS in prix.columns:
+        inflation_cum = prix[année_réf] / prix[année_réf - INFLATION_SUR_NB_YEARS] - 1
+    else:
+        inflation_cum = prix[année_réf] * np.nan
+    communes = prix.index.to_frame(index=False)
+    colonnes = dict(
+        libellé=libellés(communes).to_numpy(dtype=str),
+        code_commune=communes['code_commune'].to_numpy(dtype=str),
+        type_local=communes['type_local'].to_numpy(dtype=str),
+        années=années.astype(np.int16),
+        prix_m2_médian=prix.to_numpy(dtype=np.float32),
+        nb_ventes=nb_ventes.reindex(prix.index).to_numpy(dtype=np.int32),
+        inflation_cum=inflation_cum.to_numpy(dtype=np.float32),
+    )
+    chemin_sortie = Path(chemin_sortie)
+    tmp = chemin_sortie.with_suffix(f'.{os.getpid()}.tmp.npz')
+    np.savez_compressed(tmp, **colonnes)
+    os.replace(tmp, chemin_sortie)
+    return colonnes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('fichiers', nargs='+', type=Path,
+                        help='fichiers DVF géolocalisés (full.csv.gz), un par année')
+    parser.add_argument('--sortie', type=Path, default=CHEMIN_RÉFÉRENTIEL)
+    parser.add_argument('--taille-paquet', type=int, default=500_000)
+    args = parser.parse_args()
+    début = time.perf_counter()
+    colonnes = construit_référentiel(args.fichiers, args.sortie, args.taille_paquet)
+    from index_communes import construit_index
+    construit_index(args.sortie)
+    print(
+        f"{len(colonnes['libellé'])} couples (commune, type de local), années "
+        f"{colonnes['années'].min()}-{colonnes['années'].max()}, "
+        f'en {time.perf_counter() - début:.1f} s -> {args.sortie}'
+    )
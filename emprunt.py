@@ -0,0 +1,85 @@
+"""
+Calculs de prêts amortissables à taux fixe, vectorisés : chaque argument peut être un
+scalaire ou un tableau NumPy, et les arguments sont diffusés (broadcast) entre eux.
+Par exemple, des taux de forme (n, 1) et des durées de forme (1, m) donnent une grille
+(n, m) de mensualités en un seul appel.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+
+def mensualités(mt_emprunt, tx_nominal, nb_mois):
+    """
+    Montant de chaque mensualité d'un prêt amortissable à taux fixe.
+    Un taux nul donne simplement `mt_emprunt / nb_mois`.
+    Source :
+    https://immobilier.lefigaro.fr/financer/guide-financement-immobilier/
+    1288-pret-amortissable-definition-et-calcul-de-la-mensualite/
+    """
+    mt_emprunt, tx_nominal, nb_mois = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (mt_emprunt, tx_nominal, nb_mois))
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mensualité = ((mt_emprunt * tx_nominal) / 12) / (1 - (1 + (tx_nominal / 12))**(-nb_mois))
+    mensualité = np.where(tx_nominal == 0, mt_emprunt / nb_mois, mensualité)
+    return mensualité[()]
+
+
+def emprunt_max(mensualité_max, tx_nominal, nb_mois):
+    """
+    Montant maximal empruntable avec une mensualité donnée, réciproque de `mensualités`.
+    Un taux nul donne simplement `mensualité_max * nb_mois`.
+    """
+    mensualité_max, tx_nominal, nb_mois = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (mensualité_max, tx_nominal, nb_mois))
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mt_emprunt = 12 * mensualité_max / tx_nominal * (1 - (1 + tx_nominal / 12)**(-nb_mois))
+    mt_emprunt = np.where(tx_nominal == 0, mensualité_max * nb_mois, mt_emprunt)
+    return mt_emprunt[()]
+
+
+class Échéancier(NamedTuple):
+    """
+    Tableau d'amortissement de plusieurs prêts à la fois. `mensualité` a la forme des
+    arguments diffusés ; les autres champs ont une dimension de plus, les mois
+    (l'échéance k est à l'indice k - 1). Au-delà de la durée d'un prêt, tout vaut 0.
+    """
+    mensualité: np.ndarray
+    intérêts: np.ndarray
+    amortissement: np.ndarray
+    CRD: np.ndarray
+
+
+def échéancier(mt_emprunt, tx_nominal, nb_mois, nb_mois_max: int = None) -> Échéancier:
+    """
+    Construit les échéanciers sans boucle Python, à partir de la forme fermée du CRD
+    après k échéances :
+        CRD_k = C (1 + r)^k - M ((1 + r)^k - 1) / r,  avec r = tx_nominal / 12
+    (CRD_k = C - k M à taux nul). `nb_mois_max` fixe le nombre de colonnes, par défaut
+    la plus longue des durées.
+    """
+    mt_emprunt, tx_nominal, nb_mois = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (mt_emprunt, tx_nominal, nb_mois))
+    )
+    mensualité = np.asarray(mensualités(mt_emprunt, tx_nominal, nb_mois))
+    if nb_mois_max is None:
+        nb_mois_max = int(nb_mois.max(initial=0))
+    k = np.arange(nb_mois_max + 1)
+    r = (tx_nominal / 12)[..., None]
+    C, M, n = mt_emprunt[..., None], mensualité[..., None], nb_mois[..., None]
+    facteur = (1 + r)**k
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crd = C * facteur - M * (facteur - 1) / r
+    crd = np.where(r == 0, C - k * M, crd)
+    crd = np.where(k >= n, 0., crd)
+    crd[..., 0] = mt_emprunt
+    intérêts = np.where(k[1:] <= n, r * crd[..., :-1], 0.)
+    amortissement = crd[..., :-1] - crd[..., 1:]
+    return Échéancier(
+        mensualité=mensualité[()],
+        intérêts=intérêts,
+        amortissement=amortissement,
+        CRD=crd[..., 1:]
+    )
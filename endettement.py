@@ -0,0 +1,116 @@
+"""
+Capacité d'endettement d'un foyer de N emprunteurs, pour M profils à la fois.
+
+Chaque emprunteur a des revenus (salaire, variable, participation et intéressement...),
+chacun retenu par la banque à une certaine part (`prise_en_compte`), des revenus
+locatifs retenus après décote (70 % en général), moins l'assurance loyers impayés, et
+des prêts en cours. La mensualité maximale est le taux d'endettement appliqué au reste :
+
+    taux_max_endettement * (Σ revenus retenus + Σ loyers retenus - prêts en cours)
+
+Tous les montants sont mensuels et diffusés ensemble : le dernier axe est celui des
+emprunteurs, les axes précédents ceux des profils. On évalue ainsi le plafond de
+`TAUX_MAX_ENDETTEMENT` pour des milliers de configurations de foyer d'un seul appel.
+
+>>> foyer = Emprunteurs(
+...     revenus={'salaire': Revenu(np.array([[4000, 3500], [5000, 0]]))},
+...     taux_max_endettement=np.array([0.33, 0.35])[:, None],
+... )
+>>> mensualités_max(foyer)
+array([[1320., 1155.],
+       [1750.,    0.]])
+>>> mensualité_max_foyer(foyer)
+array([2475., 1750.])
+"""
+import dataclasses
+
+import numpy as np
+
+# "Le taux maximum d'endettement ne peux excéder 35 % des revenus des emprunteurs,
+# assurance comprise"
+TAUX_MAX_ENDETTEMENT = 0.35  # assurance comprise
+# Revenus fonciers pris en compte à hauteur de 70 % :
+# https://fr.luko.eu/conseils/guide/taux-endettement-maximum/
+DÉCOTE_LOYERS = 0.7
+
+
+@dataclasses.dataclass(frozen=True)
+class Revenu:
+    mensuel: float
+    prise_en_compte: float = 1.  # part retenue par la banque ; 0 ou 1 pour un booléen
+
+
+@dataclasses.dataclass(frozen=True)
+class RevenuLocatif:
+    loyer_mensuel: float  # charges comprises
+    # Hypothèse pessimiste : la banque retire les charges de copropriété des revenus fonciers
+    charges_mensuelles: float = 0.
+    prise_en_compte: float = DÉCOTE_LOYERS
+    tx_assurance_loyers_impayés: float = 0.  # en part du loyer
+
+
+@dataclasses.dataclass(frozen=True)
+class Emprunteurs:
+    """
+    Chaque montant a la forme (..., N) ou une forme qui s'y diffuse : un scalaire vaut
+    pour tous les emprunteurs et tous les profils.
+    """
+    revenus: dict = dataclasses.field(default_factory=dict)  # nom -> Revenu
+    revenus_locatifs: dict = dataclasses.field(default_factory=dict)  # nom -> RevenuLocatif
+    mensualités_prêts_existants: float = 0.  # assurance comprise
+    taux_max_endettement: float = TAUX_MAX_ENDETTEMENT
+
+
+def revenus_retenus(e: Emprunteurs):
+    """Revenus mensuels retenus par la banque, par emprunteur, avant le taux d'endettement"""
+    total = 0.
+    for revenu in e.revenus.values():
+        total = total + np.multiply(revenu.prise_en_compte, revenu.mensuel)
+    for location in e.revenus_locatifs.values():
+        total = total + np.multiply(
+            location.prise_en_compte,
+            np.subtract(location.loyer_mensuel, location.charges_mensuelles)
+        )
+    total = total - np.asarray(e.mensualités_prêts_existants)
+    for location in e.revenus_locatifs.values():
+        total = total - np.multiply(location.tx_assurance_loyers_impayés, location.loyer_mensuel)
+    return total
+
+
+def mensualités_max(e: Emprunteurs):
+    """Mensualité maximale, assurance comprise, de chaque emprunteur : forme (..., N)"""
+    return np.multiply(e.taux_max_endettement, revenus_retenus(e))
+
+
+def mensualité_max_foyer(e: Emprunteurs):
+    """Somme sur les emprunteurs (dernier axe)"""
+    return np.sum(mensualités_max(e), axis=-1)
+
+
+def empile(*emprunteurs: Emprunteurs) -> Emprunteurs:
+    """
+    Le foyer formé de plusieurs emprunteurs décrits séparément (chacun sans axe des
+    emprunteurs) : un nouvel axe est ajouté en dernier. Une composante absente chez un
+    emprunteur vaut 0.
+    """
+    def pile(valeurs):
+        return np.stack(np.broadcast_arrays(*valeurs), axis=-1)
+
+    def pile_composantes(champ: str, classe):
+        noms = dict.fromkeys(nom for e in emprunteurs for nom in getattr(e, champ))
+        composantes = {}
+        for nom in noms:
+            # Une composante absente est nulle : revenu ou loyer de 0 €
+            présentes = [getattr(e, champ).get(nom, classe(0.)) for e in emprunteurs]
+            composantes[nom] = classe(**{
+                f.name: pile([getattr(c, f.name) for c in présentes])
+                for f in dataclasses.fields(classe)
+            })
+        return composantes
+
+    return Emprunteurs(
+        revenus=pile_composantes('revenus', Revenu),
+        revenus_locatifs=pile_composantes('revenus_locatifs', RevenuLocatif),
+        mensualités_prêts_existants=pile([e.mensualités_prêts_existants for e in emprunteurs]),
+        taux_max_endettement=pile([e.taux_max_endettement for e in emprunteurs]),
+    )
@@ -0,0 +1,195 @@
+"""
+Épargne accumulée jusqu'à l'achat, placée sur plusieurs produits.
+
+Chaque mois, les gains mensuels sont répartis entre les produits (PEL, livret,
+compte à terme, PEE) selon `répartition`, le reste allant sur le compte courant, non
+rémunéré. Un versement qui dépasserait le plafond d'un produit déborde sur le compte
+courant. Les intérêts, nets d'impôt, courent chaque mois et sont capitalisés chaque mois
+ou en fin d'année civile selon le produit ; ceux qui ont couru depuis la dernière
+capitalisation sont versés à la clôture, le jour de l'achat. La participation et
+l'intéressement peuvent être versés chaque année sur le PEE, débloqué sans frais pour
+l'achat de la résidence principale.
+
+L'apport actuel est réparti de la même façon au départ (plafonds compris) : avec tout
+sur le compte courant, on retrouve exactement la projection linéaire
+`apport + gain mensuel * nb de mois`, y compris pour un mois entamé ou une date d'achat
+passée (nombre de mois négatif : les gains des mois écoulés depuis l'achat sont retirés du
+compte courant, rien n'est placé).
+
+Les soldes sont des tableaux (..., produit) : les axes précédents sont ceux des
+scénarios (et des emprunteurs), diffusés ensemble. Il n'y a pas de boucle sur les mois :
+la valeur à l'achat d'1 € placé chaque mois (`facteurs_capitalisation`) ne dépend que du
+calendrier, et s'obtient par sommes et produits cumulés ; des milliers de stratégies de
+répartition s'évaluent d'un coup.
+
+Les intérêts bruts du PEL s'ajoutent aux intérêts acquis (`mt_intérêts_acquis_pel`) qui
+déterminent le prêt PEL possible à l'achat, cf `simulation._étape_apports`.
+
+>>> p = projette(apport=100_000, versement_mensuel=1800, nb_mois=36,
+...             répartition=np.array([[0, 0.5, 0.5, 0], [0, 0, 1, 0]]))
+>>> p.total
+"""
+import dataclasses
+
+import numpy as np
+
+
+@dataclasses.dataclass(frozen=True)
+class Produit:
+    taux_annuel: float
+    plafond: float = np.inf  # des versements ; les intérêts capitalisés peuvent le dépasser
+    tx_imposition: float = 0.  # prélevé sur les intérêts
+    capitalisation_annuelle: bool = True  # sinon, chaque mois
+
+
+# Hypothèses de rendement, dans l'ordre des colonnes de `répartition`
+PRODUITS = {
+    # PEL ouvert en 02/2024 : 2,25 %, plafond de 61 200 €, intérêts soumis au PFU
+    'PEL': Produit(0.0225, plafond=61_200, tx_imposition=0.30),
+    # Livret A : 1,7 % depuis le 1er août 2025, plafond de 22 950 €, défiscalisé
+    'livret': Produit(0.017, plafond=22_950),
+    # https://placement.meilleurtaux.com/assurance-vie/actualites/2024-avril/voici-le-meilleur-compte-a-terme-en-2024.html
+    'compte_à_terme': Produit(0.025, tx_imposition=0.30),
+    # Fonds du PEE : rendement supposé, plus-values soumises aux seuls prélèvements sociaux
+    'PEE': Produit(0.04, tx_imposition=0.172, capitalisation_annuelle=False),
+}
+MOIS_VERSEMENT_PARTICIPATION = 5  # mai
+
+
+@dataclasses.dataclass(frozen=True)
+class Projection:
+    soldes: np.ndarray  # (..., produit), intérêts compris, à la date d'achat
+    compte_courant: np.ndarray  # (...)
+    intérêts: np.ndarray  # (...), nets d'impôt, tous produits confondus
+    # (..., produit), avant impôt : ceux du PEL s'ajoutent aux intérêts acquis qui
+    # ouvrent droit au prêt PEL
+    intérêts_bruts: np.ndarray
+
+    @property
+    def total(self) -> np.ndarray:
+        return self.soldes.sum(axis=-1) + self.compte_courant
+
+
+def facteurs_capitalisation(nb_mois, mois_départ=1, produits: dict = PRODUITS) -> np.ndarray:
+    """
+    Valeur à l'achat, intérêts nets compris, d'1 € placé sur chaque produit : au départ
+    (indice 0), puis à la fin de chacun des mois projetés (indice k pour le mois k).
+    Forme (..., 1 + mois, produit), où ... est celle de `nb_mois` et `mois_départ`
+    diffusés : elle ne dépend pas des montants.
+
+    Entre deux capitalisations (fin décembre, ou chaque mois selon le produit, et la
+    clôture à l'achat), un euro rapporte chaque mois le taux mensuel net sans intérêts
+    composés ; chaque capitalisation t multiplie ensuite ce qui est placé par
+    a_t = 1 + somme des taux mensuels depuis la précédente. D'où, avec les sommes
+    cumulées G des taux et les produits cumulés A des a_t, pour un euro placé avant le
+    mois i et capitalisé au mois t : (1 + G_t - G_i-1) * A_final / A_t.
+    """
+    colonnes = list(produits.values())
+    taux = np.array([p.taux_annuel for p in colonnes])
+    nets = 1 - np.array([p.tx_imposition for p in colonnes])
+    annuels = np.array([p.capitalisation_annuelle for p in colonnes])
+    nb_mois = np.asarray(nb_mois, dtype=float)
+    mois = np.arange(int(np.ceil(nb_mois.max(initial=0))))
+    if not len(mois):
+        return np.ones(np.broadcast_shapes(nb_mois.shape, np.shape(mois_départ)) + (1, len(taux)))
+
+    actif = mois < nb_mois[..., None]
+    mois_civil = (np.asarray(mois_départ)[..., None] - 1 + mois) % 12 + 1
+    actif, mois_civil = np.broadcast_arrays(actif, mois_civil)
+    taux_mois = np.where(actif[..., None], taux / 12 * nets, 0.)  # (..., mois, produit)
+    capitalisé = np.where(annuels, (mois_civil == 12)[..., None], True)
+    capitalisé = np.broadcast_to(capitalisé, taux_mois.shape).copy()
+    capitalisé[..., -1, :] = True  # clôture
+
+    G = np.cumsum(taux_mois, axis=-2)
+    G_avant = np.concatenate([np.zeros_like(G[..., :1, :]), G[..., :-1, :]], axis=-2)
+    # Mois de la capitalisation suivante (ou courante), et de la précédente
+    indices = np.broadcast_to(mois[:, None], capitalisé.shape)
+    suivante = np.flip(np.minimum.accumulate(
+        np.flip(np.where(capitalisé, indices, len(mois) - 1), axis=-2), axis=-2
+    ), axis=-2)
+    G_précédente = np.where(capitalisé, G, 0.)
+    G_précédente = np.concatenate([
+        np.zeros_like(G[..., :1, :]), np.maximum.accumulate(G_précédente, axis=-2)[..., :-1, :]
+    ], axis=-2)
+    a = np.where(capitalisé, 1 + G - G_précédente, 1.)
+    A = np.cumprod(a, axis=-2)
+    G_suivante = np.take_along_axis(G, suivante, axis=-2)
+    A_suivante = np.take_along_axis(A, suivante, axis=-2)
+    # Placé avant le mois i (indices 0 à mois - 1) ; versé à la fin du dernier mois : 1 €
+    facteurs = (1 + G_suivante - G_avant) * A[..., -1:, :] / A_suivante
+    return np.concatenate([facteurs, np.ones_like(facteurs[..., :1, :])], axis=-2)
+
+
+def projette(apport, versement_mensuel, nb_mois, répartition=None, versement_annuel_pee=0.,
+             mois_départ=1, produits: dict = PRODUITS) -> Projection:
+    """
+    `répartition` : part de chaque versement sur chaque produit de `produits`, de forme
+    (..., produit), ramenée à 100 % si sa somme dépasse 1, de sorte qu'un balayage ou une
+    sensibilité puisse la faire varier librement (None : tout sur le compte courant).
+    `versement_annuel_pee` est versé sur le PEE chaque mois de
+    `MOIS_VERSEMENT_PARTICIPATION`. `mois_départ` est le mois civil (1 à 12) du premier
+    mois projeté. Le versement d'un dernier mois entamé est proratisé ; un nombre de mois
+    négatif (date d'achat passée) retire les versements correspondants du compte courant.
+
+    Sans boucle sur les mois : les versements de tous les mois forment un tableau
+    (..., mois, produit), plafonné par somme cumulée, puis pondéré par
+    `facteurs_capitalisation`.
+    """
+    plafonds = np.array([p.plafond for p in produits.values()])
+    nets = 1 - np.array([p.tx_imposition for p in produits.values()])
+    seulement_pee = np.array([nom == 'PEE' for nom in produits], dtype=float)
+
+    if répartition is None:
+        répartition = np.zeros(len(produits))
+    répartition = np.maximum(np.asarray(répartition, dtype=float), 0)
+    répartition = répartition / np.maximum(répartition.sum(axis=-1, keepdims=True), 1)
+    nb_mois = np.asarray(nb_mois, dtype=float)
+    forme = np.broadcast_shapes(
+        np.shape(apport), np.shape(versement_mensuel), nb_mois.shape,
+        np.shape(versement_annuel_pee), np.shape(mois_départ), répartition.shape[:-1]
+    )
+    apport = np.broadcast_to(apport, forme).astype(float)
+    versement_mensuel = np.broadcast_to(versement_mensuel, forme).astype(float)
+
+    # Mois projetés, en dernier axe (..., mois)
+    mois = np.arange(int(np.ceil(nb_mois.max(initial=0))))
+    mois_civil = (np.asarray(mois_départ)[..., None] - 1 + mois) % 12 + 1
+    versements = versement_mensuel[..., None] * np.clip(nb_mois[..., None] - mois, 0, 1)
+    participations = np.where(
+        (mois < nb_mois[..., None]) & (mois_civil == MOIS_VERSEMENT_PARTICIPATION),
+        np.asarray(versement_annuel_pee, dtype=float)[..., None], 0.
+    )
+
+    # Montants à placer (..., 1 + mois, produit), l'apport d'abord ; les plafonds portent
+    # sur le cumul des versements, le reste va sur le compte courant
+    à_placer = np.concatenate([
+        apport[..., None, None] * répartition[..., None, :],
+        versements[..., None] * répartition[..., None, :]
+        + participations[..., None] * seulement_pee,
+    ], axis=-2)
+    if np.isfinite(plafonds).any():
+        à_placer = np.diff(
+            np.minimum(np.cumsum(à_placer, axis=-2), plafonds), axis=-2, prepend=0.
+        )
+    compte_courant = (
+        apport + versements.sum(axis=-1) + participations.sum(axis=-1)
+        - à_placer.sum(axis=(-2, -1))
+        # Date d'achat passée : comme la projection linéaire, on retire les mois écoulés
+        + np.minimum(nb_mois, 0) * versement_mensuel
+    )
+
+    # Les facteurs ne dépendent que du calendrier : un calcul par couple (nb de mois,
+    # mois de départ) distinct, souvent bien moins nombreux que les scénarios
+    calendrier = np.broadcast_arrays(nb_mois, np.asarray(mois_départ, dtype=float))
+    couples, inverse = np.unique(
+        np.stack([x.ravel() for x in calendrier], axis=-1), axis=0, return_inverse=True
+    )
+    facteurs = facteurs_capitalisation(couples[:, 0], couples[:, 1], produits)
+    facteurs = facteurs[inverse.ravel()].reshape(calendrier[0].shape + facteurs.shape[-2:])
+    soldes = np.einsum('...mp,...mp->...p', à_placer, facteurs)
+    intérêts_nets = soldes - à_placer.sum(axis=-2)
+    return Projection(
+        soldes=soldes, compte_courant=compte_courant, intérêts=intérêts_nets.sum(axis=-1),
+        intérêts_bruts=intérêts_nets / nets,
+    )
@@ -1,10 +1,23 @@
 """Ce script contient les fonctions utilisées par l'application"""
+import argparse
+import dataclasses
 import datetime
+import functools
+import hashlib
+import io
+import os
 import numpy as np
-import pandas as pd
 import base64
 from pathlib import Path
 
+import emprunt
+import instrumentation
+import pel
+
+DOSSIER_DATA = Path(__file__).parent / 'data'
+# Caches binaires régénérables, ignorés par git
+DOSSIER_CACHE = DOSSIER_DATA / '.cache'
+
 
 TAUX_BNP = {
     15: 0.0230,
@@ -55,14 +68,9 @@ def get_mt_mensualités(mt_emprunt: float, tx_nominal: float, nb_mois: int):
     Source :
     https://immobilier.lefigaro.fr/financer/guide-financement-immobilier/
     1288-pret-amortissable-definition-et-calcul-de-la-mensualite/
+    Accepte aussi des tableaux, cf `emprunt.mensualités`.
     """
-    return ((mt_emprunt * tx_nominal) / 12) / (1 - (1 + (tx_nominal / 12))**(-nb_mois))
-
-
-# Un test, conformément à cette page :
-# https://www.meilleurtaux.com/credit-immobilier/simulation-de-pret-immobilier/
-# calcul-des-mensualites.html
-assert round(get_mt_mensualités(230_000, 0.02, 20 * 12)) == 1164
+    return emprunt.mensualités(mt_emprunt, tx_nominal, nb_mois)
 
 
 def get_mt_emprunt_max(mensualité_max, tx_nominal, nb_mois):
@@ -71,11 +79,9 @@ def get_mt_emprunt_max(mensualité_max, tx_nominal, nb_mois):
     d'échéances, retourne le montant maximal empruntable.
     Source :
     https://immobilier.lefigaro.fr/financer/guide-financement-immobilier/
+    Accepte aussi des tableaux, cf `emprunt.emprunt_max`.
     """
-    return 12 * mensualité_max / tx_nominal * (1 - (1 + tx_nominal / 12)**(-nb_mois))
-
-
-assert round(get_mt_emprunt_max(1164, 0.02, 20 * 12)) == 230_093  # ~230K
+    return emprunt.emprunt_max(mensualité_max, tx_nominal, nb_mois)
 
 
 def sep_milliers(nb, nb_dec=0):
@@ -97,52 +103,241 @@ def sep_milliers(nb, nb_dec=0):
     return res.strip() + decimales[:nb_dec + 1]
 
 
-def nb_mois_depuis_que_lisa_économise():
-    dt_début_INSPART = datetime.date(2022, 11, 1)
-    return (datetime.date.today() - dt_début_INSPART).days // 30.5
+def nb_mois_depuis_que_lisa_économise(à_date=None):
+    """`à_date` (par défaut aujourd'hui) peut être une date ou un tableau de dates"""
+    dt_début_INSPART = np.datetime64(datetime.date(2022, 11, 1), 'D')
+    à_date = datetime.date.today() if à_date is None else à_date
+    nb_jours = (np.asarray(à_date, dtype='datetime64[D]') - dt_début_INSPART).astype(int)
+    return (nb_jours // 30.5)[()]
+
+
+COLONNES_TABLEAU_AMORTISSEMENT = (
+    "Echéance;Intérêts;Amortissement;"
+    "CRD en fin de période;Assurance;Mensualité"
+).split(';')
 
 
-def get_tableau_amortissement_prêt_pierre(montant_emprunté: float):
+def _parse_tableau_amortissement(texte: str) -> np.ndarray:
     """
-    Le tableau est récupéré depuis de site :
+    Convertit le tableau copié depuis anil.org ('192 086,00 €', séparateur tabulation)
+    en tableau de flottants, une ligne par échéance.
+    """
+    texte = texte.replace(',', '.').replace(' ', '').replace('€', '')
+    return np.loadtxt(io.StringIO(texte), delimiter='\t', ndmin=2)
+
+
+class TableauAmortissement:
+    """
+    Tableau d'amortissement parsé une seule fois puis conservé dans un tableau NumPy
+    indexé par échéance : `valeurs[k]` est la ligne de l'échéance k (la ligne 0, qui
+    précède la première échéance, vaut NaN).
+    Le résultat du parsing est persisté dans `DOSSIER_CACHE` (.npz) afin qu'un démarrage
+    à froid évite le traitement des chaînes de caractères. Le cache est invalidé dès que
+    le CSV change : la date de modification sert de contrôle rapide, le hash du contenu
+    tranche en cas de doute (checkout git, copie...).
+    """
+
+    def __init__(self, chemin_csv):
+        self.chemin_csv = Path(chemin_csv)
+        self.chemin_cache = DOSSIER_CACHE / f'{self.chemin_csv.stem}.npz'
+        self._signature = None
+        self._valeurs = None
+
+    @property
+    def valeurs(self) -> np.ndarray:
+        stat = self.chemin_csv.stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+        instrumentation.compte_cache('tableau_amortissement', signature == self._signature)
+        if signature != self._signature:
+            with instrumentation.étape('chargement tableau_amortissement'):
+                self._valeurs = self._charge(signature)
+            self._signature = signature
+        return self._valeurs
+
+    def _charge(self, signature) -> np.ndarray:
+        contenu, sha256 = None, None
+        if self.chemin_cache.exists():
+            with np.load(self.chemin_cache) as cache:
+                if tuple(cache['signature']) == signature:
+                    return cache['valeurs']
+                contenu = self.chemin_csv.read_bytes()
+                sha256 = hashlib.sha256(contenu).hexdigest()
+                if str(cache['sha256']) == sha256:
+                    valeurs = cache['valeurs']
+                    self._sauvegarde(valeurs, signature, sha256)
+                    return valeurs
+        if contenu is None:
+            contenu = self.chemin_csv.read_bytes()
+            sha256 = hashlib.sha256(contenu).hexdigest()
+        lignes = _parse_tableau_amortissement(contenu.decode())
+        échéances = lignes[:, 0].astype(int)
+        valeurs = np.full((échéances.max() + 1, lignes.shape[1]), np.nan)
+        valeurs[échéances] = lignes
+        self._sauvegarde(valeurs, signature, sha256)
+        return valeurs
+
+    def _sauvegarde(self, valeurs, signature, sha256):
+        # Écriture atomique : un autre processus ne lit jamais un cache à moitié écrit
+        tmp = self.chemin_cache.with_suffix(f'.{os.getpid()}.tmp.npz')
+        try:
+            DOSSIER_CACHE.mkdir(exist_ok=True)
+            np.savez(tmp, valeurs=valeurs, signature=np.array(signature), sha256=sha256)
+            os.replace(tmp, self.chemin_cache)
+        except OSError:
+            # Données en lecture seule : on se passe du cache disque
+            tmp.unlink(missing_ok=True)
+
+    @property
+    def nb_échéances(self) -> int:
+        return len(self.valeurs) - 1
+
+    def CRD(self, nb_mois, montant_emprunté: float):
+        """
+        CRD en fin de période après `nb_mois` échéances, en O(1) par mois demandé.
+        `nb_mois` peut être un scalaire ou un tableau. Avant la première échéance, le CRD
+        est le montant emprunté ; après la dernière, le prêt est soldé.
+        """
+        return _CRD_après(self.valeurs, nb_mois, montant_emprunté)
+
+
+def _CRD_après(valeurs: np.ndarray, nb_mois, montant_emprunté: float):
+    nb_mois = np.asarray(nb_mois)
+    crd = valeurs[np.clip(nb_mois, 0, len(valeurs) - 1).astype(int), 3]
+    crd = np.where(nb_mois <= 0, montant_emprunté, crd)
+    crd = np.where(nb_mois > len(valeurs) - 1, 0., crd)
+    return crd[()]
+
+
+_TABLEAUX_AMORTISSEMENT = {}
+
+
+def get_tableau_amortissement(chemin_csv=DOSSIER_DATA / 'tableau_amortissement.csv'):
+    """Un seul `TableauAmortissement` par fichier et par processus"""
+    chemin_csv = Path(chemin_csv)
+    if chemin_csv not in _TABLEAUX_AMORTISSEMENT:
+        _TABLEAUX_AMORTISSEMENT[chemin_csv] = TableauAmortissement(chemin_csv)
+    return _TABLEAUX_AMORTISSEMENT[chemin_csv]
+
+
+def get_tableau_amortissement_prêt_pierre(montant_emprunté: float, tx_nominal: float = 0.009,
+                                          nb_mois: int = 240):
+    """
+    Le tableau est généré à partir des conditions du prêt (cf `PrêtExistant`) ; il
+    reproduit celui du site :
     https://www.anil.org/outils/outils-de-calcul/echeancier-dun-pret/
     """
-    columns = (
-        "Echéance;Intérêts;Amortissement;"
-        "CRD en fin de période;Assurance;Mensualité"
-    ).split(';')
-    df = pd.read_csv('data/tableau_amortissement.csv', sep='\t', header=None, names=columns)
-    df = df.map(
-        lambda x: str(x).replace(',', '.').replace(' ', '').replace('€', '')
-    ).astype(float)
+    import pandas as pd
+    prêt = PrêtExistant(montant_emprunté, tx_nominal, datetime.date(2020, 5, 5), nb_mois)
+    df = pd.DataFrame(prêt.valeurs[1:], columns=COLONNES_TABLEAU_AMORTISSEMENT)
     df['mt_emprunt_initial'] = montant_emprunté
-    df['CRD_précis'] = (df['mt_emprunt_initial'] - df['Amortissement'].cumsum())
+    df['CRD_précis'] = prêt.CRD_précis
     return df
 
 
 def nb_mois_depuis_que_pierre_rembourse_son_prêt(
     date_début_du_prêt_existant, à_date=datetime.date.today()
 ):
-    dt_début = date_début_du_prêt_existant
-    return (à_date - dt_début).days // 30.5
+    """`à_date` peut être une date ou un tableau de dates"""
+    dt_début = np.datetime64(date_début_du_prêt_existant, 'D')
+    nb_jours = (np.asarray(à_date, dtype='datetime64[D]') - dt_début).astype(int)
+    return (nb_jours // 30.5)[()]
+
+
+def ajoute_mois(date, nb_mois):
+    """
+    `date` décalée de `nb_mois` mois calendaires, le jour étant ramené au dernier jour
+    du mois si besoin (31 janvier + 1 mois -> 28 ou 29 février). Vectorisé.
+    """
+    date = np.asarray(date, dtype='datetime64[D]')
+    mois = date.astype('datetime64[M]')
+    jour = (date - mois.astype('datetime64[D]')).astype(int)
+    mois_cible = mois + np.asarray(nb_mois).astype(int)
+    nb_jours_du_mois = ((mois_cible + 1).astype('datetime64[D]')
+                        - mois_cible.astype('datetime64[D]')).astype(int)
+    return (mois_cible.astype('datetime64[D]') + np.minimum(jour, nb_jours_du_mois - 1))[()]
+
+
+def nb_mois_calendaires(début, fin):
+    """
+    Nombre de mois calendaires entre `début` et `fin`, avec sa partie fractionnaire :
+    du 5 mai au 5 juin, 1 mois exactement ; du 5 mai au 20 juin, 1 mois et 15/30.
+    Alternative exacte à l'approximation `nb_jours // 30.5`. Vectorisé.
+    """
+    début = np.asarray(début, dtype='datetime64[D]')
+    fin = np.asarray(fin, dtype='datetime64[D]')
+    nb_mois = (fin.astype('datetime64[M]') - début.astype('datetime64[M]')).astype(int)
+    nb_mois = nb_mois - (ajoute_mois(début, nb_mois) > fin)
+    repère, suivant = ajoute_mois(début, nb_mois), ajoute_mois(début, nb_mois + 1)
+    return (nb_mois + (fin - repère).astype(int) / (suivant - repère).astype(int))[()]
 
 
 def get_CRD_à_date(à_date, date_début_du_prêt_existant, montant_emprunté: float):
+    """`à_date` peut être une date ou un tableau de dates"""
     nb_mois = nb_mois_depuis_que_pierre_rembourse_son_prêt(
         date_début_du_prêt_existant, à_date=à_date
     )
-    amortissement = get_tableau_amortissement_prêt_pierre(montant_emprunté)
-    cond = amortissement.Echéance == nb_mois
-    return amortissement.loc[cond, 'CRD en fin de période'].squeeze()
-
-
-# Ce test vérifie que, le 31 mai 2024, le CRD était bien de 156_980€,
-# conformément au site de LBP
-assert get_CRD_à_date(
-    à_date=datetime.date(2024, 5, 31),
-    date_début_du_prêt_existant=datetime.date(2020, 5, 5),
-    montant_emprunté=192_820
-) == 156_980
+    return get_tableau_amortissement().CRD(nb_mois, montant_emprunté)
+
+
+@functools.lru_cache(maxsize=64)
+def _génère_tableau_amortissement(montant_emprunté: float, tx_nominal: float, nb_mois: int,
+                                  assurance_mensuelle: float) -> tuple:
+    échéances = emprunt.échéancier(montant_emprunté, tx_nominal, nb_mois)
+    valeurs = np.full((nb_mois + 1, len(COLONNES_TABLEAU_AMORTISSEMENT)), np.nan)
+    valeurs[1:, 0] = np.arange(1, nb_mois + 1)
+    # Arrondis de la banque : au centime, et à l'euro pour le CRD
+    valeurs[1:, 1] = np.round(échéances.intérêts, 2)
+    valeurs[1:, 2] = np.round(échéances.amortissement, 2)
+    valeurs[1:, 3] = np.round(échéances.CRD)
+    valeurs[1:, 4] = assurance_mensuelle
+    valeurs[1:, 5] = np.round(échéances.mensualité, 2)
+    crd_précis = échéances.CRD
+    for tableau in (valeurs, crd_précis):
+        tableau.setflags(write=False)  # partagés par tous les appelants
+    return valeurs, crd_précis
+
+
+@dataclasses.dataclass(frozen=True)
+class PrêtExistant:
+    """
+    Un prêt amortissable à taux fixe déjà en cours. Son tableau d'amortissement est
+    généré à partir de ses conditions (récurrence vectorisée de `emprunt.échéancier`),
+    une seule fois par jeu de conditions, et a la même forme que `TableauAmortissement`.
+    """
+    montant_emprunté: float
+    tx_nominal: float  # 0.009 pour 0,9 %
+    date_début: datetime.date
+    nb_mois: int
+    assurance_mensuelle: float = 0.
+
+    @property
+    def valeurs(self) -> np.ndarray:
+        return _génère_tableau_amortissement(
+            self.montant_emprunté, self.tx_nominal, self.nb_mois, self.assurance_mensuelle
+        )[0]
+
+    @property
+    def CRD_précis(self) -> np.ndarray:
+        """CRD non arrondi après chaque échéance"""
+        return _génère_tableau_amortissement(
+            self.montant_emprunté, self.tx_nominal, self.nb_mois, self.assurance_mensuelle
+        )[1]
+
+    def CRD(self, nb_mois):
+        """CRD après `nb_mois` échéances, cf `TableauAmortissement.CRD`"""
+        return _CRD_après(self.valeurs, nb_mois, self.montant_emprunté)
+
+    def CRD_à_date(self, à_date, mois_calendaires=False):
+        """
+        `à_date` peut être un tableau de dates. Les échéances payées sont comptées en
+        tranches de 30,5 jours, comme `get_CRD_à_date`, ou en mois calendaires pleins.
+        """
+        nb_mois = nb_mois_depuis_que_pierre_rembourse_son_prêt(self.date_début, à_date=à_date)
+        if np.any(mois_calendaires):
+            nb_mois = np.where(
+                mois_calendaires, np.floor(nb_mois_calendaires(self.date_début, à_date)), nb_mois
+            )
+        return self.CRD(nb_mois)
 
 
 def img_to_bytes(img_path):
@@ -151,9 +346,23 @@ def img_to_bytes(img_path):
     return encoded
 
 
-converters = {str(i): (lambda x: float(x.replace(',', '.'))) for i in range(2, 15 + 1)}
-barême = pd.read_csv('data/Barême PEL.csv', sep=";",
-                     header=1, index_col=0, converters=converters)
+@functools.cache
+def get_barême():
+    """
+    Le barême du PEL, lu au premier usage seulement puis partagé par toutes les sessions
+    Streamlit du processus.
+    """
+    import pandas as pd
+    converters = {str(i): (lambda x: float(x.replace(',', '.'))) for i in range(2, 15 + 1)}
+    return pd.read_csv(DOSSIER_DATA / 'Barême PEL.csv', sep=";",
+                       header=1, index_col=0, converters=converters)
+
+
+def __getattr__(nom):
+    # `fonctions.barême` reste disponible, mais n'est lu qu'au premier accès
+    if nom == 'barême':
+        return get_barême()
+    raise AttributeError(f"module {__name__!r} has no attribute {nom!r}")
 
 
 def get_mt_prêt_et_mensualité_du_PEL(
@@ -171,98 +380,29 @@ def get_mt_prêt_et_mensualité_du_PEL(
     return round(mt_du_prêt_du_PEL), round(mensualité)
 
 
-# L'exemple donné sur mon contrat PEL
-assert get_mt_prêt_et_mensualité_du_PEL(barême, 100, 7) == (3090, 41)
-
-
 def get_mt_max_prêt_PEL(barême, mt_intérêts_acquis_PEL: int, mensualité_plafond: int,
                         durée_du_prêt_PEL: int = 2, verbose=False):
     """
     Trouve le plus grand montant empruntable tel que la mensualité qu'il permet soit
-    inférieure au plafond
+    inférieure au plafond. On optimise en premier la durée du prêt, puis les intérêts
+    acquis utilisés.
+    `mensualité_plafond` peut être un tableau : on obtient alors des tableaux, cf
+    `pel.mt_max_prêt_PEL`.
     """
-    if mt_intérêts_acquis_PEL <= 0 and durée_du_prêt_PEL >= 15:
-        # Game over, on ne peut pas utiliser le PEL
-        return 0, 0, 0, 0
-    mt_du_prêt_du_PEL, mensualité = get_mt_prêt_et_mensualité_du_PEL(
-        barême=barême,
+    résultat = pel.mt_max_prêt_PEL(
+        pel.barême_par_durée(barême),
         mt_intérêts_acquis_PEL=mt_intérêts_acquis_PEL,
+        mensualité_plafond=mensualité_plafond,
         durée_du_prêt_PEL=durée_du_prêt_PEL
     )
+    if np.ndim(résultat.durée_du_prêt_PEL) == 0:
+        résultat = pel.PrêtPEL(*(x.item() for x in résultat))
     if verbose:
-        debug_msg = f'{durée_du_prêt_PEL=}  {mt_intérêts_acquis_PEL=}  ->  {mt_du_prêt_du_PEL=}  '
-        debug_msg += f'{mensualité=}  '
-        print(debug_msg)
-    # Si on optimise en premier la durée du prêt :
-    if mensualité > mensualité_plafond:
-        if durée_du_prêt_PEL < 15:
-            return get_mt_max_prêt_PEL(
-                barême,
-                mt_intérêts_acquis_PEL=mt_intérêts_acquis_PEL,
-                mensualité_plafond=mensualité_plafond,
-                durée_du_prêt_PEL=durée_du_prêt_PEL + 1,
-                verbose=verbose
-            )
-        else:
-            lr = 100
-            return get_mt_max_prêt_PEL(
-                barême,
-                mt_intérêts_acquis_PEL=mt_intérêts_acquis_PEL - lr,
-                mensualité_plafond=mensualité_plafond,
-                durée_du_prêt_PEL=durée_du_prêt_PEL,
-                verbose=verbose
-            )
-        # Si on optimise en premier les intérêt acquis :
-        # if mt_intérêts_acquis_PEL > 0:
-        #     lr = 100
-        #     return get_mt_max_prêt_PEL(
-        #         barême,
-        #         mt_intérêts_acquis_PEL=mt_intérêts_acquis_PEL - lr,
-        #         mensualité_plafond=mensualité_plafond,
-        #         durée_du_prêt_PEL=durée_du_prêt_PEL
-        #     )
-        # else:
-        #     return get_mt_max_prêt_PEL(
-        #         barême,
-        #         mt_intérêts_acquis_PEL=mt_intérêts_acquis_PEL,
-        #         mensualité_plafond=mensualité_plafond,
-        #         durée_du_prêt_PEL=durée_du_prêt_PEL - 1
-        #     )
-    return (
-        durée_du_prêt_PEL, mt_du_prêt_du_PEL,
-        mensualité, mt_intérêts_acquis_PEL
-    )
-
-
-(
-    durée_du_prêt_PEL, mt_du_prêt_du_PEL,
-    mensualité, intérêts_acquis_utilisés_PEL
-) = get_mt_max_prêt_PEL(
-    barême, mt_intérêts_acquis_PEL=3712, mensualité_plafond=421
-)
-assert durée_du_prêt_PEL == 14
-assert mt_du_prêt_du_PEL == 56_274
-assert mensualité == 421
-
-(
-    durée_du_prêt_PEL, mt_du_prêt_du_PEL,
-    mensualité, intérêts_acquis_utilisés_PEL
-) = get_mt_max_prêt_PEL(
-    barême, mt_intérêts_acquis_PEL=3712, mensualité_plafond=420
-)
-assert durée_du_prêt_PEL == 15
-assert mt_du_prêt_du_PEL == 52_358
-assert mensualité == 372
-
-(
-    durée_du_prêt_PEL, mt_du_prêt_du_PEL,
-    mensualité, intérêts_acquis_utilisés_PEL
-) = get_mt_max_prêt_PEL(
-    barême, mt_intérêts_acquis_PEL=3712, mensualité_plafond=1, verbose=False
-)
-assert durée_du_prêt_PEL == 15
-assert mt_du_prêt_du_PEL == 169
-assert mensualité == 1
+        print(
+            f'{résultat.durée_du_prêt_PEL=}  {résultat.mt_intérêts_acquis_PEL=}  ->  '
+            f'{résultat.mt_du_prêt_du_PEL=}  {résultat.mensualité=}'
+        )
+    return tuple(résultat)
 
 
 def get_inflation_annuelle(inflation_cum: float, nb_years_cum: int) -> float:
@@ -274,24 +414,155 @@ def get_inflation_annuelle(inflation_cum: float, nb_years_cum: int) -> float:
     return inf_annuelle_en_pct
 
 
-# Une inflation cumulée sur 5 ans de 10.5% correspond à 2% par an :
-assert get_inflation_annuelle(0.105, 5) == 0.020169782620610865
-assert get_inflation_annuelle(-0.105, 5) == -0.021942006004453285
-
-
 def projette_prix_inflate(
     prix_initial: float, inf_annuelle_en_pct: float, nb_years_projetées: int
 ) -> float:
     """
     Un prix_initial va subir une inflation annualisée de `inf_annuelle_en_pct` pendant `nb_years_projetées`. Quel est le nouveau prix ?
+    Accepte aussi des tableaux (le prix est alors tronqué élément par élément).
     """
     prix_final = prix_initial * (1 + inf_annuelle_en_pct) ** nb_years_projetées
-    return int(prix_final)
+    if np.ndim(prix_final) == 0:
+        return int(prix_final)
+    return np.trunc(prix_final)
+
 
+def vérifications():
+    """
+    Vérifications de cohérence, autrefois exécutées à chaque import du module :
+    $ python fonctions.py --selfcheck
+    """
+    # Un test, conformément à cette page :
+    # https://www.meilleurtaux.com/credit-immobilier/simulation-de-pret-immobilier/
+    # calcul-des-mensualites.html
+    assert round(get_mt_mensualités(230_000, 0.02, 20 * 12)) == 1164
+
+    assert round(get_mt_emprunt_max(1164, 0.02, 20 * 12)) == 230_093  # ~230K
+
+    # Ce test vérifie que, le 31 mai 2024, le CRD était bien de 156_980€,
+    # conformément au site de LBP
+    assert get_CRD_à_date(
+        à_date=datetime.date(2024, 5, 31),
+        date_début_du_prêt_existant=datetime.date(2020, 5, 5),
+        montant_emprunté=192_820
+    ) == 156_980
+    # Le tableau généré à partir des conditions du prêt redonne celui d'anil.org
+    prêt_LBP = PrêtExistant(192_820, 0.009, datetime.date(2020, 5, 5), 240)
+    assert prêt_LBP.CRD_à_date(datetime.date(2024, 5, 31)) == 156_980
+    tableau_anil = get_tableau_amortissement().valeurs
+    assert (prêt_LBP.valeurs[1:, 3] == tableau_anil[1:, 3]).all()
+    assert np.abs(prêt_LBP.valeurs[1:, 1:3] - tableau_anil[1:, 1:3]).max() <= 0.01 + 1e-9
+
+    # L'exemple donné sur mon contrat PEL
+    assert get_mt_prêt_et_mensualité_du_PEL(get_barême(), 100, 7) == (3090, 41)
 
-prix_final = projette_prix_inflate(
-    prix_initial=1000,
-    inf_annuelle_en_pct=0.020169782620610865,
-    nb_years_projetées=5
-)
-assert prix_final == 1105
+    (
+        durée_du_prêt_PEL, mt_du_prêt_du_PEL,
+        mensualité, intérêts_acquis_utilisés_PEL
+    ) = get_mt_max_prêt_PEL(
+        get_barême(), mt_intérêts_acquis_PEL=3712, mensualité_plafond=421
+    )
+    assert durée_du_prêt_PEL == 14
+    assert mt_du_prêt_du_PEL == 56_274
+    assert mensualité == 421
+
+    (
+        durée_du_prêt_PEL, mt_du_prêt_du_PEL,
+        mensualité, intérêts_acquis_utilisés_PEL
+    ) = get_mt_max_prêt_PEL(
+        get_barême(), mt_intérêts_acquis_PEL=3712, mensualité_plafond=420
+    )
+    assert durée_du_prêt_PEL == 15
+    assert mt_du_prêt_du_PEL == 52_358
+    assert mensualité == 372
+
+    (
+        durée_du_prêt_PEL, mt_du_prêt_du_PEL,
+        mensualité, intérêts_acquis_utilisés_PEL
+    ) = get_mt_max_prêt_PEL(
+        get_barême(), mt_intérêts_acquis_PEL=3712, mensualité_plafond=1, verbose=False
+    )
+    assert durée_du_prêt_PEL == 15
+    assert mt_du_prêt_du_PEL == 169
+    assert mensualité == 1
+
+    # D'autres cas calculés par l'ancienne recherche récursive (une année, puis 100 €
+    # d'intérêts acquis à la fois) : (intérêts acquis, plafond, durée minimale) ->
+    # (durée, montant du prêt, mensualité, intérêts acquis utilisés), en scalaire puis
+    # d'un seul appel vectorisé
+    cas_PEL = {
+        (3757, 900, 2): (10, 80_685, 794, 3757),
+        (3757, 2000, 2): (7, 92_000, 1555, 3757),  # plafonné à 92 000 €
+        (3757, 50, 2): (15, 6446, 46, 457),
+        (8000, 5000, 2): (6, 92_000, 4441, 8000),
+        (250, 30, 2): (14, 3790, 28, 250),
+        (3757, 0, 2): (0, 0, 0, 0),  # PEL inutilisable
+        (0, 500, 2): (2, 0, 0, 0),
+        (3757, 600, 6): (12, 66_852, 566, 3757),
+        (1234, 95, 2): (15, 13_174, 94, 934),
+    }
+    for (intérêts, plafond, durée), attendu in cas_PEL.items():
+        assert get_mt_max_prêt_PEL(get_barême(), intérêts, plafond, durée) == attendu
+    intérêts, plafonds, durées = map(np.array, zip(*cas_PEL))
+    assert (
+        np.stack(get_mt_max_prêt_PEL(get_barême(), intérêts, plafonds, durées), axis=-1)
+        == np.array(list(cas_PEL.values()))
+    ).all()
+
+    # Formes fermées de `emprunt` contre l'ancien calcul, échéance par échéance :
+    # CRD_k = CRD_k-1 * (1 + r) - M
+    assert np.allclose(
+        get_mt_mensualités(np.array([200_000, 100_000]), np.array([0.035, 0.04]), [300, 180]),
+        [1001.2471405189833, 739.6879256092577], rtol=1e-12
+    )
+    assert np.allclose(
+        get_mt_emprunt_max(np.array([1500, 1164]), np.array([0.035, 0.02]), [300, 240]),
+        [299_626.32387094654, 230_092.57656139447], rtol=1e-12
+    )
+    crd = emprunt.échéancier(200_000, 0.035, 300).CRD
+    assert np.allclose(
+        crd[[0, 11, 119]], [199_582.08619281437, 194_903.7986117796, 140_057.573463437],
+        rtol=1e-12
+    )
+
+    # Une inflation cumulée sur 5 ans de 10.5% correspond à 2% par an :
+    assert get_inflation_annuelle(0.105, 5) == 0.020169782620610865
+    assert get_inflation_annuelle(-0.105, 5) == -0.021942006004453285
+
+    prix_final = projette_prix_inflate(
+        prix_initial=1000,
+        inf_annuelle_en_pct=0.020169782620610865,
+        nb_years_projetées=5
+    )
+    assert prix_final == 1105
+
+    # 31 janvier + 1 mois = 29 février 2024 ; du 5 mai au 20 juin : 1 mois et 15 jours
+    assert ajoute_mois(datetime.date(2024, 1, 31), 1) == np.datetime64('2024-02-29')
+    assert nb_mois_calendaires(datetime.date(2020, 5, 5), datetime.date(2020, 6, 20)) == 1.5
+
+    # `simulate` redonne les montants que l'application calculait elle-même, avant le
+    # moteur : scénario par défaut, et achat passé avec un prêt PEL, à date de calcul fixe
+    from simulation import ScenarioParams, simulate
+    date_calcul = datetime.date(2026, 10, 17)
+    r = simulate(ScenarioParams(date_calcul=date_calcul))
+    assert round(r.prix_final_maximum, 2) == 819_672.57
+    assert round(r.mt_prêt_principal, 2) == 580_601.26
+    assert (r.mt_prêt_PEL, r.mensualité_PEL, r.durée_du_prêt_PEL) == (0, 0, 0)
+    r = simulate(ScenarioParams(
+        date_calcul=date_calcul, date_achat=datetime.date(2025, 6, 1), ville='CHATOU',
+        appart_ou_maison='Appartement', avec_crédit_BNP=False, tx_nominal=0.04, curseur_PEL=0.5
+    ))
+    assert r.nb_mois_restants_avant_achat == -16
+    assert round(r.prix_final_maximum, 2) == 441_627.28
+    assert round(r.mt_prêt_principal, 2) == 353_765.61
+    assert (r.mt_prêt_PEL, r.mensualité_PEL, r.durée_du_prêt_PEL) == (80_685, 794, 10)
+    assert r.intérêts_acquis_utilisés_PEL == 3757
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--selfcheck', action='store_true',
+                        help='lance les vérifications de cohérence')
+    if parser.parse_args().selfcheck:
+        vérifications()
+        print('OK')
@@ -0,0 +1,181 @@
+"""
+Index des prix par commune, projeté en mémoire (`np.load(..., mmap_mode='r')`).
+
+Construit une fois à partir du référentiel DVF (cf `dvf.py`) :
+
+$ python index_communes.py
+
+L'index est un dossier de fichiers .npy non compressés, ouverts en lecture seule et
+projetés en mémoire : rien n'est copié à l'ouverture, les pages sont partagées par
+toutes les sessions Streamlit du processus (et par les processus de la machine, via le
+cache du système), et une recherche ne lit que les quelques lignes concernées.
+
+Contenu :
+- par commune, triée par libellé : code INSEE, libellé, ligne de chaque type de local ;
+- par (commune, type de local) : prix médian au m² de chaque année, inflation cumulée
+  sur `INFLATION_SUR_NB_YEARS` ans et inflation annuelle (`get_inflation_annuelle`) ;
+- une table à adressage direct code INSEE -> commune, pour une recherche en O(1) ;
+- les libellés normalisés (sans accents ni tirets) triés, pour la recherche par préfixe
+  du sélecteur de ville (`np.searchsorted`).
+"""
+import dataclasses
+import functools
+import os
+import shutil
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+from dvf import CHEMIN_RÉFÉRENTIEL, TYPES_LOCAL
+from fonctions import DOSSIER_DATA, INFLATION_SUR_NB_YEARS, get_inflation_annuelle
+
+DOSSIER_INDEX = DOSSIER_DATA / 'index_communes'
+# Codes INSEE : 5 chiffres, sauf en Corse (2A001, 2B001...), rangés après les autres
+NB_CASES = 102_000
+
+
+def case(code_commune):
+    """Position du code INSEE dans la table à adressage direct. Vectorisé."""
+    code = np.char.upper(np.asarray(code_commune, dtype='U5'))
+    département = code.astype('U2')
+    numéro = np.array([c[2:] for c in code.ravel().tolist()], dtype=int).reshape(code.shape)
+    corse = np.where(département == '2A', 100, np.where(département == '2B', 101, 0))
+    département = np.where(corse > 0, '0', département).astype(int)
+    return ((département + corse) * 1000 + numéro)[()]
+
+
+def normalise(libellé):
+    """'Saint-Germain-en-Laye' -> 'SAINT GERMAIN EN LAYE'"""
+    sans_accents = unicodedata.normalize('NFKD', libellé).encode('ascii', 'ignore').decode()
+    return ' '.join(sans_accents.upper().replace('-', ' ').replace("'", ' ').split())
+
+
+@dataclasses.dataclass(frozen=True)
+class IndexCommunes:
+    # Par commune, dans l'ordre des libellés
+    code_commune: np.ndarray
+    libellé: np.ndarray
+    lignes: np.ndarray  # (commune, type de local) -> ligne des séries, -1 si absente
+    # Table à adressage direct : case(code INSEE) -> commune, -1 si absente
+    communes_par_case: np.ndarray
+    # Recherche par préfixe
+    libellé_normalisé: np.ndarray  # triés
+    ordre_normalisé: np.ndarray  # libellé_normalisé[i] est celui de la commune ordre_normalisé[i]
+    # Séries, une ligne par (commune, type de local)
+    années: np.ndarray
+    prix_m2_médian: np.ndarray  # (ligne, année)
+    inflation_cum: np.ndarray
+    inflation_annuelle: np.ndarray
+
+    def ligne(self, code_commune: str, type_local: str) -> int:
+        """Ligne des séries du couple (code INSEE, type de local), -1 s'il est absent"""
+        commune = self.communes_par_case[case(code_commune)]
+        if commune < 0:
+            return -1
+        return int(self.lignes[commune, TYPES_LOCAL.index(type_local)])
+
+    def ligne_libellé(self, libellé: str, type_local: str) -> int:
+        """Comme `ligne`, à partir du libellé de la commune ('SAINT-DENIS (93)')"""
+        commune = int(np.searchsorted(self.libellé, libellé))
+        if commune == len(self.libellé) or self.libellé[commune] != libellé:
+            return -1
+        return int(self.lignes[commune, TYPES_LOCAL.index(type_local)])
+
+    def série(self, ligne: int) -> np.ndarray:
+        """Prix médian au m² par année : une vue sur le fichier, sans copie"""
+        return self.prix_m2_médian[ligne]
+
+    def recherche(self, préfixe: str, limite: int = 50) -> list:
+        """Libellés des communes qui commencent par `préfixe` (casse, accents et tirets ignorés)"""
+        préfixe = normalise(préfixe)
+        début = np.searchsorted(self.libellé_normalisé, préfixe, side='left')
+        fin = np.searchsorted(self.libellé_normalisé, préfixe + '\uffff', side='left')
+        fin = min(fin, début + limite)
+        return self.libellé[np.sort(self.ordre_normalisé[début:fin])].tolist()
+
+
+def construit_index(chemin_référentiel=CHEMIN_RÉFÉRENTIEL, dossier=DOSSIER_INDEX):
+    """
+    Seuls les couples (commune, type de local) dont l'inflation est connue sont gardés.
+    Le dossier est remplacé d'un coup : un processus qui a déjà ouvert l'ancien index
+    continue de le lire.
+    """
+    with np.load(chemin_référentiel) as r:
+        référentiel = {nom: r[nom] for nom in r.files}
+    garde = np.isfinite(référentiel['inflation_cum'])
+    référentiel = {
+        nom: valeurs if nom == 'années' else valeurs[garde]
+        for nom, valeurs in référentiel.items()
+    }
+    libellé, commune = np.unique(référentiel['libellé'], return_inverse=True)
+    code_commune = np.empty(len(libellé), dtype=référentiel['code_commune'].dtype)
+    code_commune[commune] = référentiel['code_commune']
+    lignes = np.full((len(libellé), len(TYPES_LOCAL)), -1, dtype=np.int32)
+    for i, type_local in enumerate(TYPES_LOCAL):
+        est_du_type = référentiel['type_local'] == type_local
+        lignes[commune[est_du_type], i] = np.flatnonzero(est_du_type)
+    communes_par_case = np.full(NB_CASES, -1, dtype=np.int32)
+    communes_par_case[case(code_commune)] = np.arange(len(libellé))
+    libellé_normalisé = np.array([normalise(lib) for lib in libellé.tolist()])
+    ordre_normalisé = np.argsort(libellé_normalisé, kind='stable').astype(np.int32)
+    colonnes = dict(
+        code_commune=code_commune,
+        libellé=libellé,
+        lignes=lignes,
+        communes_par_case=communes_par_case,
+        libellé_normalisé=libellé_normalisé[ordre_normalisé],
+        ordre_normalisé=ordre_normalisé,
+        années=référentiel['années'],
+        prix_m2_médian=référentiel['prix_m2_médian'],
+        inflation_cum=référentiel['inflation_cum'],
+        inflation_annuelle=get_inflation_annuelle(
+            référentiel['inflation_cum'], INFLATION_SUR_NB_YEARS
+        ).astype(np.float32),
+    )
+
+    dossier = Path(dossier)
+    tmp = dossier.with_name(f'{dossier.name}.{os.getpid()}.tmp')
+    tmp.mkdir(parents=True)
+    for nom, valeurs in colonnes.items():
+        np.save(tmp / f'{nom}.npy', np.ascontiguousarray(valeurs))
+    ancien = dossier.with_name(f'{dossier.name}.{os.getpid()}.ancien')
+    if dossier.exists():
+        os.replace(dossier, ancien)
+    os.replace(tmp, dossier)
+    shutil.rmtree(ancien, ignore_errors=True)
+    return colonnes
+
+
+def signature(dossier=DOSSIER_INDEX) -> tuple:
+    """(nom, date de modification, taille) de chaque fichier de l'index ; () sans index"""
+    return tuple(
+        (chemin.name, stat.st_mtime_ns, stat.st_size)
+        for chemin in sorted(Path(dossier).glob('*.npy'))
+        for stat in (chemin.stat(),)
+    )
+
+
+def charge(dossier=DOSSIER_INDEX):
+    """
+    L'index, ouvert une fois par processus et partagé par toutes les sessions, puis
+    rouvert si ses fichiers changent (index reconstruit) ; None si l'index n'a pas été
+    construit.
+    """
+    return _charge(Path(dossier), signature(dossier))
+
+
+@functools.lru_cache(maxsize=4)
+def _charge(dossier: Path, signature: tuple):
+    """Mis en cache par la signature des fichiers, cf `signature`"""
+    if not signature:
+        return None
+    return IndexCommunes(**{
+        f.name: np.load(dossier / f'{f.name}.npy', mmap_mode='r')
+        for f in dataclasses.fields(IndexCommunes)
+    })
+
+
+if __name__ == '__main__':
+    colonnes = construit_index()
+    print(f"{len(colonnes['libellé'])} communes -> {DOSSIER_INDEX}")
@@ -0,0 +1,141 @@
+"""
+Chronométrage léger des étapes du calcul.
+
+Désactivé par défaut : `étape(nom)` retourne alors un gestionnaire de contexte partagé
+qui ne fait rien, et `compte_cache` retourne immédiatement, si bien que le coût est
+négligeable. Une fois activé (`active()`, ou la variable d'environnement
+SIMULATION_PROFILAGE=1), chaque étape nommée accumule son nombre d'appels et sa durée,
+les caches comptent leurs succès et leurs échecs, et chaque mesure est gardée comme
+événement exportable en JSON lines.
+
+`active()` vaut pour tout le processus (serveur, benchmarks). Pour ne profiler qu'une
+session de l'application, `utilise(mesures)` installe des `Mesures` propres au contexte
+courant (le thread d'exécution du script Streamlit), à refaire à chaque exécution ;
+`utilise(None)` revient au réglage du processus.
+
+>>> active()
+>>> with étape('PEL'):
+...     ...
+>>> statistiques()['PEL']['appels']
+1
+"""
+import collections
+import contextvars
+import json
+import os
+import time
+
+
+class Mesures:
+    """Statistiques par étape et événements, du processus ou d'une session"""
+    __slots__ = ('statistiques', 'événements')
+
+    def __init__(self):
+        self.statistiques = collections.defaultdict(
+            lambda: {'appels': 0, 'durée_totale': 0., 'succès_cache': 0, 'échecs_cache': 0}
+        )
+        self.événements = collections.deque(maxlen=100_000)
+
+
+_actif = os.environ.get('SIMULATION_PROFILAGE') == '1'
+_mesures_processus = Mesures()
+_mesures_contexte = contextvars.ContextVar('mesures', default=None)
+
+
+def active(actif: bool = True):
+    global _actif
+    _actif = actif
+
+
+def utilise(mesures: Mesures = None):
+    """Mesures propres au contexte courant ; None : celles du processus, si `active()`"""
+    _mesures_contexte.set(mesures)
+
+
+def _mesures() -> Mesures:
+    """Les mesures en cours, ou None si le profilage est désactivé"""
+    mesures = _mesures_contexte.get()
+    if mesures is not None:
+        return mesures
+    return _mesures_processus if _actif else None
+
+
+def est_actif() -> bool:
+    return _mesures() is not None
+
+
+def réinitialise():
+    mesures = _mesures() or _mesures_processus
+    mesures.statistiques.clear()
+    mesures.événements.clear()
+
+
+def enregistre(nom: str, durée: float):
+    """Ajoute une durée mesurée par ailleurs à l'étape `nom`"""
+    mesures = _mesures()
+    if mesures is None:
+        return
+    statistiques_étape = mesures.statistiques[nom]
+    statistiques_étape['appels'] += 1
+    statistiques_étape['durée_totale'] += durée
+    mesures.événements.append({'type': 'étape', 'nom': nom, 'fin': time.time(), 'durée': durée})
+
+
+class _Chrono:
+    __slots__ = ('nom', 'début')
+
+    def __init__(self, nom):
+        self.nom = nom
+
+    def __enter__(self):
+        self.début = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        enregistre(self.nom, time.perf_counter() - self.début)
+
+
+class _Rien:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_RIEN = _Rien()
+
+
+def étape(nom: str):
+    """À utiliser avec `with` autour d'une étape nommée du calcul"""
+    return _Chrono(nom) if est_actif() else _RIEN
+
+
+def compte_cache(nom: str, succès: bool):
+    mesures = _mesures()
+    if mesures is None:
+        return
+    mesures.statistiques[nom]['succès_cache' if succès else 'échecs_cache'] += 1
+    mesures.événements.append({'type': 'cache', 'nom': nom, 'fin': time.time(), 'succès': succès})
+
+
+def statistiques() -> dict:
+    """Par nom : appels, durée totale et moyenne (en secondes), succès et échecs de cache"""
+    return {
+        nom: {**s, 'durée_moyenne': s['durée_totale'] / s['appels'] if s['appels'] else 0.}
+        for nom, s in (_mesures() or _mesures_processus).statistiques.items()
+    }
+
+
+def en_jsonl() -> str:
+    événements = (_mesures() or _mesures_processus).événements
+    return ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in événements)
+
+
+def exporte_jsonl(chemin):
+    """Ajoute les événements enregistrés au fichier `chemin`, puis les oublie"""
+    with open(chemin, 'a', encoding='utf-8') as f:
+        f.write(en_jsonl())
+    (_mesures() or _mesures_processus).événements.clear()
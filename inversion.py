@@ -0,0 +1,153 @@
+"""
+Recherche inverse : au lieu de « quel prix maximal pour ces entrées ? », on cherche la
+valeur d'une entrée qui permet d'atteindre un prix cible, par exemple la première date
+d'achat à laquelle on peut s'offrir 650 k€ à CHATOU, ou le gain mensuel qu'il faut
+épargner pour y arriver en 2028.
+
+La recherche est vectorisée : `base` et `cible` peuvent être des tableaux (plusieurs
+villes, plusieurs cibles...), et tous les problèmes sont résolus ensemble. On évalue
+d'abord `simulate` sur une grille de l'intervalle de recherche pour encadrer la
+première solution, puis on resserre l'encadrement par dichotomie.
+
+>>> r = inverse(ScenarioParams(ville=np.array(['CHATOU', 'VÉSINET'])[:, None]),
+...             'date_achat', cible=[600_000, 650_000])
+>>> r.valeur.shape
+(2, 2)
+"""
+import dataclasses
+import datetime
+
+import numpy as np
+
+from balayage import en_tableau
+from simulation import ScenarioParams, ScenarioResult, simulate
+
+
+@dataclasses.dataclass(frozen=True)
+class ChampInversible:
+    bornes: tuple  # intervalle de recherche par défaut ; None : de date_calcul à +20 ans
+    croissant: bool  # le prix final maximum croît-il avec ce champ ?
+    pas: float  # précision de la solution : 1 jour, 1 €, ...
+
+
+CHAMPS_INVERSIBLES = {
+    'date_achat': ChampInversible(None, croissant=True, pas=1),
+    'gain_mensuel_pde': ChampInversible((0, 10_000), croissant=True, pas=1),
+    'gain_mensuel_lvo': ChampInversible((0, 10_000), croissant=True, pas=1),
+    'apport_actuel_pde': ChampInversible((0, 1_000_000), croissant=True, pas=1),
+    'apport_actuel_lvo': ChampInversible((0, 1_000_000), croissant=True, pas=1),
+    'w_mensuel_pde_date_achat': ChampInversible((0, 20_000), croissant=True, pas=1),
+    'w_mensuel_lvo_date_achat': ChampInversible((0, 20_000), croissant=True, pas=1),
+    'tx_nominal': ChampInversible((0.001, 0.10), croissant=False, pas=1e-5),
+    'tx_frais_agence': ChampInversible((0., 0.10), croissant=False, pas=1e-4),
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class Inversion:
+    """
+    `valeur` : pour chaque problème, la plus petite valeur du champ qui atteint la cible
+    (la plus grande si le prix décroît avec le champ), NaN / NaT si aucune valeur de
+    l'intervalle ne l'atteint.
+    """
+    champ: str
+    valeur: np.ndarray
+    atteignable: np.ndarray
+    # Le calcul complet à la solution (à la borne favorable si la cible est inatteignable)
+    résultat: ScenarioResult
+
+
+def _en_nombres(champ: str, valeurs) -> np.ndarray:
+    valeurs = en_tableau(champ, valeurs)
+    if champ == 'date_achat':
+        return valeurs.astype(int).astype(float)  # jours depuis le 1er janvier 1970
+    return valeurs.astype(float)
+
+
+def _depuis_nombres(champ: str, nombres: np.ndarray, entier: bool) -> np.ndarray:
+    if champ == 'date_achat':
+        return nombres.astype(int).astype('datetime64[D]')
+    return np.round(nombres) if entier else nombres
+
+
+def inverse(base: ScenarioParams, champ: str, cible, bornes: tuple = None,
+            champ_résultat: str = 'prix_final_maximum', nb_points: int = 32) -> Inversion:
+    """
+    Cherche, pour chaque problème, la valeur de `champ` telle que `champ_résultat`
+    atteigne `cible`. Les autres entrées sont prises dans `base`, dont les champs à None
+    sont résolus point par point (ainsi `remb_anticipé_gratuit` suit la date d'achat).
+    La grille de `nb_points` valeurs sert à trouver la *première* valeur qui convient, y
+    compris si le résultat n'est pas monotone (effets de seuil) ; la dichotomie affine
+    ensuite jusqu'à la précision du champ (`CHAMPS_INVERSIBLES[champ].pas`).
+    """
+    if champ not in CHAMPS_INVERSIBLES:
+        raise ValueError(
+            f'{champ!r} ne peut pas être recherché ; champs possibles : '
+            f'{sorted(CHAMPS_INVERSIBLES)}'
+        )
+    info = CHAMPS_INVERSIBLES[champ]
+    if bornes is None and info.bornes is None:
+        date_calcul = datetime.date.today() if base.date_calcul is None else base.date_calcul
+        date_calcul = np.min(en_tableau('date_calcul', date_calcul))
+        bornes = date_calcul, date_calcul + np.timedelta64(20 * 365, 'D')
+    bas, haut = _en_nombres(champ, bornes or info.bornes)
+    entier = info.pas == 1
+
+    # Forme commune de tous les problèmes : celle des champs tableaux de `base` et de `cible`
+    cible = np.asarray(cible, dtype=float)
+    champs_base = {
+        f.name: getattr(base, f.name) for f in dataclasses.fields(base)
+        if f.name != champ and getattr(base, f.name) is not None
+    }
+    forme = np.broadcast_shapes(cible.shape, *(np.shape(v) for v in champs_base.values()))
+    cible = np.broadcast_to(cible, forme)
+
+    def évalue(valeurs: np.ndarray):
+        """`valeurs` a la forme `forme` suivie d'éventuels axes supplémentaires"""
+        axes_en_plus = valeurs.ndim - len(forme)
+        étendus = {
+            nom: np.broadcast_to(v, forme).reshape(forme + (1,) * axes_en_plus)
+            for nom, v in champs_base.items() if np.ndim(v)
+        }
+        params = dataclasses.replace(
+            base, **étendus, **{champ: _depuis_nombres(champ, valeurs, entier)}
+        )
+        r = simulate(params)
+        atteint = np.broadcast_to(
+            getattr(r, champ_résultat) >= cible.reshape(forme + (1,) * axes_en_plus),
+            valeurs.shape
+        )
+        return r, atteint
+
+    # 1. Encadrement : la première valeur de la grille (dans le sens favorable) qui convient
+    grille = np.linspace(bas, haut, nb_points)
+    if entier:
+        grille = np.unique(np.round(grille))
+    if not info.croissant:
+        grille = grille[::-1]
+    _, atteint = évalue(np.broadcast_to(grille, forme + grille.shape))
+    atteignable = atteint.any(axis=-1)
+    i = np.argmax(atteint, axis=-1)
+    # `ok` convient toujours, `ko` jamais ; sans encadrement (la cible est atteinte dès
+    # la borne favorable, ou jamais), les deux coïncident
+    ok = grille[i]
+    ko = np.where(i > 0, grille[np.maximum(i - 1, 0)], ok)
+
+    # 2. Dichotomie entre `ko` et `ok`, pour tous les problèmes à la fois
+    while (np.abs(ok - ko) > info.pas).any():
+        milieu = (ok + ko) / 2
+        if entier:
+            milieu = np.floor(milieu) if info.croissant else np.ceil(milieu)
+        _, atteint = évalue(milieu)
+        ok = np.where(atteint, milieu, ok)
+        ko = np.where(atteint, ko, milieu)
+
+    résultat, _ = évalue(ok)
+    valeur = _depuis_nombres(champ, ok, entier)
+    if champ == 'date_achat':
+        valeur = np.where(atteignable, valeur, np.datetime64('NaT'))
+    else:
+        valeur = np.where(atteignable, valeur, np.nan)
+    return Inversion(
+        champ=champ, valeur=valeur[()], atteignable=atteignable[()], résultat=résultat
+    )
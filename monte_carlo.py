@@ -0,0 +1,143 @@
+"""
+Mode stochastique : au lieu d'une inflation locale et d'un taux d'emprunt figés, on tire
+des trajectoires mensuelles corrélées jusqu'à la date d'achat :
+- les prix à Cachan et dans la ville visée suivent des marches log-normales, de tendance
+  l'inflation annualisée historique (`get_inflation_annuelle`) ;
+- le taux nominal suit un processus d'Ornstein-Uhlenbeck (Vasicek), rappelé vers le
+  taux choisi.
+Chaque tirage passe par le même calcul que l'application (`simulate`, vectorisé), par
+paquets de taille fixe pour borner la mémoire. Les paquets sont répartis sur un pool de
+processus ; chacun a sa propre graine dérivée de `graine`, donc le résultat ne dépend
+pas du nombre de processus.
+
+$ python monte_carlo.py --tirages 1000000 --processus 8 --graine 42
+"""
+import argparse
+import dataclasses
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fonctions import INFLATION_SUR_NB_YEARS, sep_milliers
+from simulation import ScenarioParams, résout, simulate
+from table_resultats import TableRésultats
+
+PERCENTILES = (5, 50, 95)
+
+
+@dataclasses.dataclass(frozen=True)
+class HypothèsesAléas:
+    volatilité_prix: float = 0.05  # annuelle, sur le log des prix
+    corrélation_prix: float = 0.7  # entre Cachan et la ville visée
+    vitesse_rappel_taux: float = 0.3  # par an
+    volatilité_taux: float = 0.006  # annuelle, en points de taux
+    corrélation_taux_prix: float = -0.3  # les taux montent, les prix baissent
+
+
+@dataclasses.dataclass(frozen=True)
+class RésultatMonteCarlo:
+    nb_tirages: int
+    prix_final_maximum: np.ndarray
+    solde_revente: np.ndarray
+    # Toutes les lignes du budget de chaque tirage, si demandé (`toutes_les_lignes`)
+    table: TableRésultats = None
+
+    def percentiles(self, champ: str) -> dict:
+        valeurs = np.percentile(getattr(self, champ), PERCENTILES)
+        return {f'P{p}': v for p, v in zip(PERCENTILES, valeurs)}
+
+
+def _tire_paquet(base: ScenarioParams, hypothèses: HypothèsesAléas, nb_mois: int,
+                 nb_tirages: int, graine: np.random.SeedSequence, réels=None):
+    """
+    Tire `nb_tirages` trajectoires et les évalue ; `base` doit être résolu. Avec `réels`
+    (np.float64, np.float32), retourne aussi la `TableRésultats` du paquet.
+    """
+    rng = np.random.default_rng(graine)
+    h = hypothèses
+    corrélations = np.array([
+        [1, h.corrélation_prix, h.corrélation_taux_prix],
+        [h.corrélation_prix, 1, h.corrélation_taux_prix],
+        [h.corrélation_taux_prix, h.corrélation_taux_prix, 1],
+    ])
+    # Chocs mensuels corrélés : (tirage, mois, [Cachan, ville, taux])
+    chocs = rng.standard_normal((nb_tirages, nb_mois, 3)) @ np.linalg.cholesky(corrélations).T
+    dt = 1 / 12
+    nb_années = nb_mois / 12
+
+    # Prix : la médiane de chaque trajectoire suit l'inflation annualisée déterministe
+    r = simulate(base)
+    tendances = np.log1p([r.inflation_annuelle_cachan, r.inflation_par_an_les_x_dernières_années])
+    log_croissances = (
+        tendances * nb_années + h.volatilité_prix * np.sqrt(dt) * chocs[..., :2].sum(axis=1)
+    )
+    # Ramenées en inflation cumulée sur INFLATION_SUR_NB_YEARS ans, comme les dictionnaires
+    inflations_cum = np.expm1(log_croissances * INFLATION_SUR_NB_YEARS / max(nb_années, dt))
+
+    # Taux : solution exacte d'Ornstein-Uhlenbeck, somme pondérée des chocs mensuels
+    κ = h.vitesse_rappel_taux
+    poids = np.exp(-κ * (nb_années - dt * np.arange(1, nb_mois + 1)))
+    tx_nominal = base.tx_nominal + h.volatilité_taux * np.sqrt(dt) * (chocs[..., 2] @ poids)
+    tx_nominal = np.maximum(tx_nominal, 0)
+
+    tirages = simulate(dataclasses.replace(
+        base,
+        avec_projection_inflation=True,
+        inflation_cum_cachan=inflations_cum[:, 0],
+        inflation_cum_ville=inflations_cum[:, 1],
+        tx_nominal=tx_nominal,
+    ))
+    table = None if réels is None else TableRésultats.depuis_résultat(tirages, réels)
+    return (
+        tirages.prix_final_maximum, np.broadcast_to(tirages.solde_revente, (nb_tirages,)), table
+    )
+
+
+def monte_carlo(base: ScenarioParams = ScenarioParams(), nb_tirages: int = 100_000,
+                graine: int = None, hypothèses: HypothèsesAléas = HypothèsesAléas(),
+                taille_paquet: int = 10_000, nb_processus: int = 1,
+                toutes_les_lignes: bool = False, réels=np.float32) -> RésultatMonteCarlo:
+    """
+    `nb_processus` > 1 répartit les paquets sur un pool de processus (None : un par cœur).
+    À `graine` égale, les tirages sont identiques quel que soit `nb_processus`.
+    `toutes_les_lignes` garde toutes les lignes du budget de chaque tirage, dans une
+    `TableRésultats` de `octets_par_scénario(réels)` octets par tirage.
+    """
+    base = résout(base)
+    nb_mois = int(simulate(base).nb_mois_restants_avant_achat)
+    if not base.avec_projection_inflation:
+        # Les aléas restent centrés sur des prix stables
+        base = dataclasses.replace(base, inflation_cum_cachan=0., inflation_cum_ville=0.)
+    tailles = [taille_paquet] * (nb_tirages // taille_paquet)
+    if nb_tirages % taille_paquet:
+        tailles.append(nb_tirages % taille_paquet)
+    graines = np.random.SeedSequence(graine).spawn(len(tailles))
+    arguments = (
+        [base] * len(tailles), [hypothèses] * len(tailles), [max(nb_mois, 0)] * len(tailles),
+        tailles, graines, [réels if toutes_les_lignes else None] * len(tailles)
+    )
+    if nb_processus == 1:
+        paquets = list(map(_tire_paquet, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=nb_processus) as pool:
+            paquets = list(pool.map(_tire_paquet, *arguments))
+    return RésultatMonteCarlo(
+        nb_tirages=nb_tirages,
+        prix_final_maximum=np.concatenate([prix for prix, _, _ in paquets]),
+        solde_revente=np.concatenate([solde for _, solde, _ in paquets]),
+        table=TableRésultats.concatène(t for _, _, t in paquets) if toutes_les_lignes else None,
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tirages', type=int, default=100_000)
+    parser.add_argument('--graine', type=int, default=None)
+    parser.add_argument('--processus', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    résultat = monte_carlo(nb_tirages=args.tirages, graine=args.graine,
+                           nb_processus=args.processus)
+    for champ in ('prix_final_maximum', 'solde_revente'):
+        percentiles = résultat.percentiles(champ)
+        print(champ, '  '.join(f'{p} = {sep_milliers(v)} €' for p, v in percentiles.items()))
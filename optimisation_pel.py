@@ -0,0 +1,122 @@
+"""
+Répartition optimale de la capacité d'emprunt entre le PEL et le prêt principal.
+
+Plutôt que de déplacer `curseur_PEL` à la main, on évalue d'un seul appel vectorisé de
+`simulate` toutes les combinaisons (curseur, durée du prêt PEL, intérêts acquis
+utilisés), et on retient celle qui maximise le prix final, c'est-à-dire le budget net
+du coût total du crédit (`coût_crédit_principal + coût_crédit_PEL`), de l'assurance et
+des frais.
+
+En plus de la grille des curseurs, chaque couple (durée, intérêts) est évalué au plus
+petit curseur qui le permet (mensualité du PEL / mensualité maximale de Pierre) :
+au-delà, le curseur ne fait que retirer de la capacité au prêt principal.
+
+>>> o = optimise_PEL(ScenarioParams(tx_nominal=0.04))
+>>> o.curseur_PEL, o.durée_du_prêt_PEL, o.intérêts_acquis_utilisés_PEL
+"""
+import dataclasses
+
+import numpy as np
+import pandas as pd
+
+import pel
+from cache_disque import en_cache_disque
+from fonctions import get_barême
+from simulation import ScenarioParams, résout, simulate
+
+CURSEURS = np.round(np.linspace(0, 1, 101), 2)
+
+
+@dataclasses.dataclass(frozen=True)
+class OptimumPEL:
+    curseur_PEL: float
+    durée_du_prêt_PEL: int
+    intérêts_acquis_utilisés_PEL: int
+    prix_final_maximum: float
+    # Prix final selon le curseur : au mieux sur (durée, intérêts), et avec le choix
+    # automatique de `get_mt_max_prêt_PEL` (ce que fait le curseur de l'application)
+    courbe: pd.DataFrame
+
+
+def optimise_PEL(base: ScenarioParams, curseurs=CURSEURS) -> OptimumPEL:
+    """`base` doit être scalaire ; ses champs de prêt PEL imposé sont ignorés"""
+    base = résout(dataclasses.replace(
+        base, durée_du_prêt_PEL=0, intérêts_acquis_utilisés_PEL=0
+    ))
+    return _optimise_PEL(base, np.asarray(curseurs, dtype=float))
+
+
+@en_cache_disque
+def _optimise_PEL(base: ScenarioParams, curseurs: np.ndarray) -> OptimumPEL:
+    """`base` résolu : la clé du cache disque contient alors la date de calcul"""
+    durées = np.arange(pel.DURÉE_MIN_PRÊT_PEL, pel.DURÉE_MAX_PRÊT_PEL + 1)
+    # Par pas de 100 €, en partant de 100 € et, comme `get_mt_max_prêt_PEL`, de la totalité
+    # des intérêts acquis (0 € voudrait dire « tous les intérêts acquis »)
+    # Intérêts acquis à l'achat, y compris ceux de l'épargne placée sur le PEL d'ici là
+    acquis = int(simulate(base).intérêts_acquis_PEL)
+    pas = np.arange(0, acquis, pel.PAS_INTÉRÊTS_ACQUIS)
+    intérêts = np.unique(np.concatenate([pas, acquis - pas, [acquis]]))
+    intérêts = intérêts[intérêts > 0]
+
+    # Choix automatique de la durée et des intérêts, pour chaque curseur
+    automatique = simulate(dataclasses.replace(base, curseur_PEL=curseurs))
+
+    # Grille complète : (curseur, durée, intérêts)
+    grille = simulate(dataclasses.replace(
+        base,
+        curseur_PEL=curseurs[:, None, None],
+        durée_du_prêt_PEL=durées[None, :, None],
+        intérêts_acquis_utilisés_PEL=intérêts[None, None, :],
+    ))
+    prix_grille = np.broadcast_to(
+        grille.prix_final_maximum, (len(curseurs), len(durées), len(intérêts))
+    )
+
+    # Curseur au plus juste pour chaque (durée, intérêts)
+    mensualité_max_pde = simulate(base).mensualité_max_pde
+    _, mensualités = pel.prêt_et_mensualité(
+        pel.barême_par_durée(get_barême()), intérêts[None, :], durées[:, None]
+    )
+    curseurs_justes = np.clip(
+        np.nextafter(mensualités / max(mensualité_max_pde, 1e-9), np.inf), 0, 1
+    )
+    justes = simulate(dataclasses.replace(
+        base,
+        curseur_PEL=curseurs_justes,
+        durée_du_prêt_PEL=durées[:, None],
+        intérêts_acquis_utilisés_PEL=intérêts[None, :],
+    ))
+    prix_justes = np.broadcast_to(justes.prix_final_maximum, curseurs_justes.shape)
+
+    # Meilleur candidat de chaque famille : (prix, curseur, durée, intérêts) ; à égalité,
+    # on préfère le choix automatique, puis le plus petit curseur
+    prix_automatique = np.broadcast_to(automatique.prix_final_maximum, curseurs.shape)
+    i = np.argmax(prix_automatique)
+    candidats = [(prix_automatique[i], curseurs[i], 0, 0)]
+    i, j, k = np.unravel_index(np.argmax(prix_grille), prix_grille.shape)
+    candidats.append((prix_grille[i, j, k], curseurs[i], durées[j], intérêts[k]))
+    j, k = np.unravel_index(np.argmax(prix_justes), prix_justes.shape)
+    candidats.append((prix_justes[j, k], curseurs_justes[j, k], durées[j], intérêts[k]))
+    meilleur = candidats[0]
+    for candidat in candidats[1:]:
+        if candidat[0] > meilleur[0]:
+            meilleur = candidat
+    _, curseur, durée, intérêts_utilisés = meilleur
+    résultat = simulate(dataclasses.replace(
+        base, curseur_PEL=float(curseur),
+        durée_du_prêt_PEL=int(durée),
+        intérêts_acquis_utilisés_PEL=int(intérêts_utilisés),
+    ))
+
+    courbe = pd.DataFrame({
+        'curseur_PEL': curseurs,
+        'durée et intérêts optimisés': prix_grille.reshape(len(curseurs), -1).max(axis=1),
+        'choix automatique': prix_automatique,
+    })
+    return OptimumPEL(
+        curseur_PEL=float(curseur),
+        durée_du_prêt_PEL=int(résultat.durée_du_prêt_PEL),
+        intérêts_acquis_utilisés_PEL=int(résultat.intérêts_acquis_utilisés_PEL),
+        prix_final_maximum=float(résultat.prix_final_maximum),
+        courbe=courbe,
+    )
@@ -0,0 +1,112 @@
+"""
+Recherche du prêt PEL maximal dont la mensualité reste sous un plafond.
+
+Reprend exactement la règle de `get_mt_max_prêt_PEL` : on allonge d'abord la durée du
+prêt (de 2 à 15 ans), puis, à 15 ans, on renonce aux intérêts acquis par pas de 100 €.
+Mais au lieu d'une récursion par année puis par pas de 100 €, on évalue toutes les
+durées d'un coup et on cherche le nombre de pas par dichotomie (la mensualité croît avec
+les intérêts acquis utilisés). Tous les arguments peuvent être des tableaux : un appel
+répond pour tout un lot de plafonds.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+import instrumentation
+
+DURÉE_MIN_PRÊT_PEL = 2
+DURÉE_MAX_PRÊT_PEL = 15
+# "Le montant maximum du prêt est de 92 000 €"
+MT_MAX_PRÊT_PEL = 92_000
+PAS_INTÉRÊTS_ACQUIS = 100
+
+
+class BarêmePEL(NamedTuple):
+    """Colonnes du barême, indexées par la durée du prêt en années (NaN hors barême)"""
+    prêt_pour_1_euro_dintérêts_acquis: np.ndarray
+    mensualité_pour_1000_euros_prêtés: np.ndarray
+
+
+class PrêtPEL(NamedTuple):
+    durée_du_prêt_PEL: np.ndarray
+    mt_du_prêt_du_PEL: np.ndarray
+    mensualité: np.ndarray
+    mt_intérêts_acquis_PEL: np.ndarray
+
+
+_BARÊMES = {}
+
+
+def barême_par_durée(barême) -> BarêmePEL:
+    """
+    Convertit le DataFrame `barême` (une colonne par durée) en tableaux indexés par durée.
+    La conversion n'est faite qu'une fois par DataFrame.
+    """
+    instrumentation.compte_cache('barême PEL', id(barême) in _BARÊMES)
+    if id(barême) not in _BARÊMES:
+        prêt_pour_1_euro = np.full(DURÉE_MAX_PRÊT_PEL + 1, np.nan)
+        mensualité_pour_1000_euros = np.full(DURÉE_MAX_PRÊT_PEL + 1, np.nan)
+        for durée in range(DURÉE_MIN_PRÊT_PEL, DURÉE_MAX_PRÊT_PEL + 1):
+            prêt_pour_1_euro[durée], mensualité_pour_1000_euros[durée] = barême[str(durée)]
+        # On garde une référence sur `barême` pour que son id ne soit pas réutilisé
+        _BARÊMES[id(barême)] = barême, BarêmePEL(prêt_pour_1_euro, mensualité_pour_1000_euros)
+    return _BARÊMES[id(barême)][1]
+
+
+def prêt_et_mensualité(barême_pel: BarêmePEL, mt_intérêts_acquis_PEL, durée_du_prêt_PEL):
+    """Version vectorisée de `get_mt_prêt_et_mensualité_du_PEL`"""
+    mt_du_prêt_du_PEL = (
+        mt_intérêts_acquis_PEL * barême_pel.prêt_pour_1_euro_dintérêts_acquis[durée_du_prêt_PEL]
+    )
+    mensualité = (
+        mt_du_prêt_du_PEL * barême_pel.mensualité_pour_1000_euros_prêtés[durée_du_prêt_PEL]
+    ) / 1000
+    mt_du_prêt_du_PEL = np.minimum(mt_du_prêt_du_PEL, MT_MAX_PRÊT_PEL)
+    return np.round(mt_du_prêt_du_PEL), np.round(mensualité)
+
+
+def mt_max_prêt_PEL(barême_pel: BarêmePEL, mt_intérêts_acquis_PEL, mensualité_plafond,
+                    durée_du_prêt_PEL=DURÉE_MIN_PRÊT_PEL) -> PrêtPEL:
+    """
+    Retourne, pour chaque plafond, la durée, le montant du prêt, la mensualité et les
+    intérêts acquis utilisés. Si même 100 € d'intérêts acquis sur 15 ans dépassent le
+    plafond, le PEL est inutilisable et tout vaut 0.
+    """
+    intérêts, plafond, durée_min = np.broadcast_arrays(
+        np.asarray(mt_intérêts_acquis_PEL), np.asarray(mensualité_plafond),
+        np.asarray(durée_du_prêt_PEL)
+    )
+
+    # 1. La plus courte durée < 15 ans dont la mensualité passe sous le plafond
+    durées = np.arange(DURÉE_MIN_PRÊT_PEL, DURÉE_MAX_PRÊT_PEL)
+    _, mensualités = prêt_et_mensualité(barême_pel, intérêts[..., None], durées)
+    ok = (durées >= durée_min[..., None]) & (mensualités <= plafond[..., None])
+    trouvé_avant_15_ans = ok.any(axis=-1)
+    durée = np.where(
+        trouvé_avant_15_ans, durées[np.argmax(ok, axis=-1)], DURÉE_MAX_PRÊT_PEL
+    )
+
+    # 2. À 15 ans, le plus petit nombre de pas k tel que les intérêts restants
+    # `intérêts - k * 100` soient > 0 et donnent une mensualité sous le plafond
+    k_max = np.maximum(np.ceil(intérêts / PAS_INTÉRÊTS_ACQUIS).astype(int) - 1, 0)
+
+    def passe(k):
+        _, mensualité = prêt_et_mensualité(
+            barême_pel, intérêts - k * PAS_INTÉRÊTS_ACQUIS, DURÉE_MAX_PRÊT_PEL
+        )
+        return mensualité <= plafond
+
+    bas, haut = np.zeros_like(k_max), k_max.copy()
+    while (bas < haut).any():
+        milieu = (bas + haut) // 2
+        ok = passe(milieu)
+        haut = np.where(ok, milieu, haut)
+        bas = np.where(ok, bas, milieu + 1)
+    utilisable = trouvé_avant_15_ans | ((intérêts > 0) & passe(haut))
+    intérêts = np.where(trouvé_avant_15_ans, intérêts, intérêts - haut * PAS_INTÉRÊTS_ACQUIS)
+
+    mt_du_prêt_du_PEL, mensualité = prêt_et_mensualité(barême_pel, intérêts, durée)
+    return PrêtPEL(*(
+        np.where(utilisable, x, 0)[()]
+        for x in (durée, mt_du_prêt_du_PEL.astype(int), mensualité.astype(int), intérêts)
+    ))
@@ -0,0 +1,131 @@
+"""
+Renégociation ou rachat du prêt principal, sur de nombreuses trajectoires de taux.
+
+Le prêt est celui du budget : `mt_prêt_principal` emprunté au taux `tx_nominal` sur
+`nb_années_pr_rembourser` ans (cf `get_mt_emprunt_max`). Pour chaque trajectoire des
+taux proposés sur le marché et chaque mois k après l'achat, on compare :
+- les mensualités restantes du prêt actuel, sur les n = N - k mois restants ;
+- celles d'un nouveau prêt du CRD au taux du mois k, sur la même durée restante, plus
+  les frais payés comptant : indemnités de remboursement anticipé (6 mois d'intérêts,
+  plafonnées à 3 % du CRD), frais de dossier et de garantie pour un rachat par une autre
+  banque, frais d'avenant pour une renégociation avec la banque actuelle.
+L'économie est actualisée à la date d'achat (`tx_actualisation`, nul par défaut : somme
+des montants). Le mois optimal d'une trajectoire est celui qui maximise l'économie,
+à trajectoire connue : c'est un majorant de ce qu'on peut espérer en pratique.
+
+Tout est calculé sur la grille (trajectoires x mois) d'un coup : 10 000 trajectoires
+sur 300 mois prennent quelques dixièmes de seconde.
+
+>>> taux = trajectoires_taux(0.035, nb_trajectoires=10_000, nb_mois=240, graine=0)
+>>> rf = refinance(ScenarioParams(tx_nominal=0.035), taux)
+>>> rf.proportion_intéressante, np.median(rf.économie_optimale)
+"""
+import dataclasses
+
+import numpy as np
+
+import emprunt
+from monte_carlo import HypothèsesAléas
+from simulation import FRAIS_DE_DOSSIER_BANCAIRE, ScenarioParams, résout, simulate
+
+MODES = ('rachat', 'renégociation')
+
+
+@dataclasses.dataclass(frozen=True)
+class FraisRefinancement:
+    # Indemnités de remboursement anticipé : au plus 6 mois d'intérêts et 3 % du CRD
+    # (article R313-25 du code de la consommation)
+    ira_nb_mois_intérêts: float = 6
+    ira_plafond_crd: float = 0.03
+    frais_de_dossier: float = FRAIS_DE_DOSSIER_BANCAIRE
+    tx_frais_garantie: float = 0.012  # nouvelle caution, en part du CRD racheté
+    frais_avenant: float = 500  # renégociation avec la banque actuelle
+    ira_en_renégociation: bool = False  # la banque actuelle y renonce souvent
+
+
+@dataclasses.dataclass(frozen=True)
+class Refinancement:
+    """Mois comptés depuis l'achat (le mois 1 est la première échéance)"""
+    mois: np.ndarray  # (mois,)
+    crd: np.ndarray  # (mois,)
+    frais: np.ndarray  # (mois,)
+    économies: np.ndarray  # (trajectoire, mois), actualisées à la date d'achat
+    mois_optimal: np.ndarray  # (trajectoire,), 0 : ne jamais refinancer
+    économie_optimale: np.ndarray  # (trajectoire,), 0 si on ne refinance jamais
+    taux_optimal: np.ndarray  # (trajectoire,), NaN si on ne refinance jamais
+
+    @property
+    def proportion_intéressante(self) -> float:
+        """Part des trajectoires sur lesquelles refinancer rapporte quelque chose"""
+        return float(np.mean(self.mois_optimal > 0))
+
+
+def trajectoires_taux(tx_initial: float, nb_trajectoires: int, nb_mois: int,
+                      hypothèses: HypothèsesAléas = HypothèsesAléas(), graine=None):
+    """
+    Taux proposés chaque mois (trajectoire, mois), colonne 0 : l'achat. Processus
+    d'Ornstein-Uhlenbeck rappelé vers `tx_initial`, comme dans `monte_carlo`, discrétisé
+    exactement au pas mensuel ; les taux négatifs sont ramenés à 0.
+    """
+    rng = np.random.default_rng(graine)
+    κ, σ, dt = hypothèses.vitesse_rappel_taux, hypothèses.volatilité_taux, 1 / 12
+    amortissement = np.exp(-κ * dt)
+    écart_type = σ * np.sqrt((1 - amortissement**2) / (2 * κ)) if κ else σ * np.sqrt(dt)
+    chocs = écart_type * rng.standard_normal((nb_trajectoires, nb_mois))
+    écarts = np.zeros((nb_trajectoires, nb_mois))
+    for k in range(1, nb_mois):
+        écarts[:, k] = amortissement * écarts[:, k - 1] + chocs[:, k]
+    return np.maximum(tx_initial + écarts, 0)
+
+
+def refinance(base: ScenarioParams, trajectoires, mode: str = 'rachat',
+              frais: FraisRefinancement = FraisRefinancement(),
+              tx_actualisation: float = 0.) -> Refinancement:
+    """
+    `trajectoires` : taux annuels proposés, de forme (trajectoire, mois) ; la colonne k
+    est le taux du mois k après l'achat (la colonne 0 est ignorée). `base` doit être
+    scalaire.
+    """
+    if mode not in MODES:
+        raise ValueError(f'mode {mode!r} inconnu ; modes possibles : {MODES}')
+    p = résout(base)
+    r = simulate(p)
+    trajectoires = np.atleast_2d(np.asarray(trajectoires, dtype=float))
+    nb_mois_prêt = int(p.nb_années_pr_rembourser * 12)
+    # Mois auxquels on peut refinancer : après l'achat, avant la dernière échéance
+    mois = np.arange(1, min(trajectoires.shape[1], nb_mois_prêt))
+    restants = nb_mois_prêt - mois
+    éch = emprunt.échéancier(r.mt_prêt_principal, p.tx_nominal, nb_mois_prêt)
+    crd = éch.CRD[mois - 1]
+    mensualité = éch.mensualité
+
+    ira = np.minimum(
+        frais.ira_nb_mois_intérêts * crd * p.tx_nominal / 12, frais.ira_plafond_crd * crd
+    )
+    if mode == 'rachat':
+        frais_mois = ira + frais.frais_de_dossier + frais.tx_frais_garantie * crd
+    else:
+        frais_mois = frais.ira_en_renégociation * ira + frais.frais_avenant
+
+    taux = trajectoires[:, mois]
+    nouvelles_mensualités = emprunt.mensualités(crd, taux, restants)
+    # Valeur à l'instant k d'une mensualité de 1 € sur les n mois restants, puis
+    # actualisation de l'instant k à la date d'achat
+    valeur_mensualités = emprunt.emprunt_max(1, tx_actualisation, restants)
+    actualisation = (1 + tx_actualisation / 12) ** -mois
+    économies = (
+        (mensualité - nouvelles_mensualités) * valeur_mensualités - frais_mois
+    ) * actualisation
+
+    i = np.argmax(économies, axis=1)
+    économie_optimale = économies[np.arange(len(économies)), i]
+    refinance_ = économie_optimale > 0
+    return Refinancement(
+        mois=mois,
+        crd=crd,
+        frais=frais_mois,
+        économies=économies,
+        mois_optimal=np.where(refinance_, mois[i], 0),
+        économie_optimale=np.where(refinance_, économie_optimale, 0.),
+        taux_optimal=np.where(refinance_, taux[np.arange(len(i)), i], np.nan),
+    )
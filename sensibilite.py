@@ -0,0 +1,91 @@
+"""
+Sensibilité du prix final maximum à chacune des entrées numériques de `ScenarioParams`,
+hypothèses comprises (taux d'endettement maximal, inflation à Cachan, variable, frais de
+notaire, assurance...).
+
+Chaque entrée est baissée puis montée de `pas_relatif` (10 % par défaut), toutes les
+autres restant à leur valeur de `base` : les 2·k scénarios sont évalués d'un seul appel
+vectorisé de `simulate`, chaque champ étant un tableau de 2·k valeurs. On en tire l'écart
+de prix final de chaque côté et l'élasticité (différence centrée : variation relative
+du prix pour une variation relative de l'entrée), de quoi tracer un diagramme en tornade.
+
+Les entrées nulles (le curseur du PEL à 0...) sont ignorées : une variation relative
+n'y a pas de sens.
+
+>>> s = sensibilités(ScenarioParams())
+>>> s[['champ', 'impact_bas', 'impact_haut', 'élasticité']].head()
+"""
+import dataclasses
+import numbers
+
+import numpy as np
+import pandas as pd
+
+from cache_disque import en_cache_disque
+from simulation import ScenarioParams, résout, simulate
+
+
+def champs_numériques(params: ScenarioParams) -> list:
+    """Les champs de `params` (résolu, scalaire) dont la valeur est un nombre non nul"""
+    return [
+        f.name for f in dataclasses.fields(params)
+        if isinstance(getattr(params, f.name), numbers.Number)
+        and not isinstance(getattr(params, f.name), (bool, np.bool_))
+        and getattr(params, f.name) != 0
+    ]
+
+
+def sensibilités(base: ScenarioParams, pas_relatif: float = 0.1, champs=None,
+                 champ_résultat: str = 'prix_final_maximum') -> pd.DataFrame:
+    """
+    Une ligne par champ, triées par ampleur de l'impact : valeurs basse, de base et
+    haute, `champ_résultat` correspondant, écarts à la base et élasticité. Les champs
+    entiers sont arrondis, d'au moins une unité. `base` doit être scalaire.
+    """
+    base = résout(base)
+    champs = champs_numériques(base) if champs is None else list(champs)
+    return _sensibilités(base, pas_relatif, champs, champ_résultat)
+
+
+@en_cache_disque
+def _sensibilités(base: ScenarioParams, pas_relatif: float, champs: list,
+                  champ_résultat: str) -> pd.DataFrame:
+    """`base` résolu : la clé du cache disque contient alors la date de calcul"""
+    valeurs = np.array([getattr(base, champ) for champ in champs], dtype=float)
+    entiers = np.array([isinstance(getattr(base, champ), numbers.Integral) for champ in champs])
+    # Basse < haute, y compris pour une valeur négative (inflation en baisse)
+    basses = np.minimum(valeurs * (1 - pas_relatif), valeurs * (1 + pas_relatif))
+    hautes = np.maximum(valeurs * (1 - pas_relatif), valeurs * (1 + pas_relatif))
+    # Pour un entier : arrondi, sans retomber sur la valeur de base
+    basses = np.where(entiers, np.minimum(np.round(basses), valeurs - 1), basses)
+    hautes = np.where(entiers, np.maximum(np.round(hautes), valeurs + 1), hautes)
+
+    # Le scénario 2·i baisse le champ i, le scénario 2·i + 1 le monte
+    nb_scénarios = 2 * len(champs)
+    colonnes = {}
+    for i, champ in enumerate(champs):
+        colonne = np.full(nb_scénarios, valeurs[i])
+        colonne[2 * i], colonne[2 * i + 1] = basses[i], hautes[i]
+        colonnes[champ] = colonne.astype(int) if entiers[i] else colonne
+    résultats = np.broadcast_to(
+        getattr(simulate(dataclasses.replace(base, **colonnes)), champ_résultat),
+        (nb_scénarios,)
+    )
+    référence = float(getattr(simulate(base), champ_résultat))
+    bas, haut = résultats[0::2], résultats[1::2]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        élasticités = ((haut - bas) / référence) / ((hautes - basses) / valeurs)
+    tableau = pd.DataFrame({
+        'champ': champs,
+        'valeur_basse': basses,
+        'valeur': valeurs,
+        'valeur_haute': hautes,
+        f'{champ_résultat}_bas': bas,
+        f'{champ_résultat}_haut': haut,
+        'impact_bas': bas - référence,
+        'impact_haut': haut - référence,
+        'élasticité': élasticités,
+    })
+    ampleur = np.maximum(np.abs(tableau['impact_bas']), np.abs(tableau['impact_haut']))
+    return tableau.iloc[np.argsort(-ampleur.to_numpy(), kind='stable')].reset_index(drop=True)
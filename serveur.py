@@ -0,0 +1,358 @@
+"""
+Service HTTP/JSON local autour du calcul du budget, pour les autres outils (tableurs,
+notebooks, tableaux de bord) : les mêmes chiffres que l'application, sans Streamlit.
+
+$ python serveur.py --port 8765
+$ curl -d '{"tx_nominal": 0.035, "ville": "CHATOU"}' localhost:8765/simulation
+$ curl -d '[{"id": "a"}, {"id": "b", "date_achat": "2029-01-01"}]' localhost:8765/simulation
+$ curl localhost:8765/metriques
+
+- POST /simulation : un scénario (objet JSON) ou une liste de scénarios, au format de
+  `batch.py` (champs de `ScenarioParams`, dates AAAA-MM-JJ, "id" facultatif). Réponse :
+  un objet (ou une liste d'objets) avec toutes les lignes du budget (`ScenarioResult`).
+  Dans une liste, un scénario invalide donne un objet {"erreur": ...} à sa place.
+- GET /metriques : latences (médiane, p95, p99), débit, taille des lots, cache.
+
+Les scénarios de requêtes concurrentes sont regroupés : le premier arrivé attend au plus
+`délai` secondes les suivants, puis tout le lot est évalué d'un seul appel vectorisé de
+`simulate`, dans un thread pour que la boucle continue d'accepter des requêtes (qui
+formeront le lot suivant). Les résultats sont mis en cache par scénario (et par jour, à
+cause des dates par défaut).
+
+Uniquement la bibliothèque standard, NumPy et le code du calcul : aucun accès réseau
+sortant. Le service écoute par défaut sur 127.0.0.1.
+"""
+import argparse
+import asyncio
+import collections
+import datetime
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+
+import cache_disque
+import instrumentation
+from batch import CHAMPS_PARAMS, CHAMPS_RÉSULTAT, params_depuis_scénarios
+from simulation import simulate
+
+TAILLE_MAX_CORPS = 10_000_000  # octets
+NB_LATENCES_GARDÉES = 10_000
+
+
+class ErreurRequête(Exception):
+    """Requête invalide : répondue en 400, avec le message"""
+
+
+def _en_json(valeur):
+    if isinstance(valeur, float) and not math.isfinite(valeur):
+        return None
+    if isinstance(valeur, datetime.date):
+        return valeur.isoformat()
+    return valeur
+
+
+def résultats_en_dicts(params_scénarios: list) -> list:
+    """Un dict par scénario : toutes les lignes de `ScenarioResult`, en types JSON"""
+    r = simulate(params_depuis_scénarios(params_scénarios))
+    colonnes = [
+        np.broadcast_to(getattr(r, champ), (len(params_scénarios),)).tolist()
+        for champ in CHAMPS_RÉSULTAT
+    ]
+    return [
+        {champ: _en_json(valeur) for champ, valeur in zip(CHAMPS_RÉSULTAT, ligne)}
+        for ligne in zip(*colonnes)
+    ]
+
+
+def valide(scénario) -> dict:
+    if not isinstance(scénario, dict):
+        raise ErreurRequête('Chaque scénario doit être un objet JSON')
+    inconnus = set(scénario) - set(CHAMPS_PARAMS) - {'id'}
+    if inconnus:
+        raise ErreurRequête(f'Champs inconnus : {sorted(inconnus)}')
+    return scénario
+
+
+class Métriques:
+    def __init__(self):
+        self.début = time.time()
+        self.requêtes = collections.Counter()  # par (méthode chemin, statut)
+        self.latences = collections.deque(maxlen=NB_LATENCES_GARDÉES)  # (fin, durée)
+        self.scénarios = 0
+        self.lots = 0
+        self.tailles_lots = collections.Counter()
+        self.durée_calcul = 0.
+        self.succès_cache = 0
+        self.échecs_cache = 0
+
+    def requête(self, route: str, statut: int, durée: float):
+        self.requêtes[f'{route} {statut}'] += 1
+        self.latences.append((time.time(), durée))
+
+    def lot(self, taille: int, durée: float):
+        self.lots += 1
+        self.scénarios += taille
+        self.tailles_lots[taille] += 1
+        self.durée_calcul += durée
+
+    def en_dict(self, taille_cache: int) -> dict:
+        maintenant = time.time()
+        durées = np.array([durée for _, durée in self.latences])
+        récentes = sum(1 for fin, _ in self.latences if fin >= maintenant - 60)
+        quantiles = (
+            dict(zip(('p50', 'p95', 'p99', 'max'), np.quantile(durées, [.5, .95, .99, 1.])))
+            if len(durées) else {}
+        )
+        return {
+            'depuis_s': maintenant - self.début,
+            'requêtes': dict(self.requêtes),
+            'latence_ms': {nom: 1000 * valeur for nom, valeur in quantiles.items()},
+            'requêtes_par_s_dernière_minute': récentes / 60,
+            'scénarios_calculés': self.scénarios,
+            'scénarios_par_s': self.scénarios / max(maintenant - self.début, 1e-9),
+            'lots': self.lots,
+            'taille_moyenne_lot': self.scénarios / self.lots if self.lots else 0.,
+            'tailles_lots': {str(taille): n for taille, n in sorted(self.tailles_lots.items())},
+            'durée_calcul_s': self.durée_calcul,
+            'cache': {
+                'taille': taille_cache,
+                'succès': self.succès_cache,
+                'échecs': self.échecs_cache,
+            },
+            'cache_disque': cache_disque.statistiques(),
+            'étapes': instrumentation.statistiques(),
+        }
+
+
+class Regroupeur:
+    """
+    File des scénarios à calculer. `calcule` attend le résultat d'un scénario ; une seule
+    tâche évalue les lots, l'un après l'autre, dans un thread dédié.
+    """
+
+    def __init__(self, métriques: Métriques, délai: float = 0.002,
+                 taille_max_lot: int = 4096, taille_cache: int = 100_000):
+        self.métriques = métriques
+        self.délai = délai
+        self.taille_max_lot = taille_max_lot
+        self.taille_cache = taille_cache
+        self.cache = collections.OrderedDict()
+        self.file = asyncio.Queue()
+        self.thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='simulation')
+        self.tâche = None
+
+    def démarre(self):
+        self.tâche = asyncio.create_task(self._boucle())
+
+    async def arrête(self):
+        self.tâche.cancel()
+        self.thread.shutdown()
+
+    @staticmethod
+    def _clé(scénario: dict) -> str:
+        # Les champs absents prennent des valeurs qui dépendent du jour (date_calcul...)
+        sans_id = {champ: valeur for champ, valeur in scénario.items() if champ != 'id'}
+        return json.dumps([datetime.date.today().isoformat(), sans_id], sort_keys=True)
+
+    async def calcule(self, scénario: dict) -> dict:
+        clé = self._clé(scénario)
+        if clé in self.cache:
+            self.cache.move_to_end(clé)
+            self.métriques.succès_cache += 1
+            return self.cache[clé]
+        self.métriques.échecs_cache += 1
+        futur = asyncio.get_running_loop().create_future()
+        await self.file.put((clé, scénario, futur))
+        return await futur
+
+    async def _boucle(self):
+        boucle = asyncio.get_running_loop()
+        while True:
+            lot = [await self.file.get()]
+            fin_attente = boucle.time() + self.délai
+            # Pas de `wait_for(file.get())` : annulé à l'échéance, il peut perdre l'élément
+            # qu'il venait de retirer (Python 3.11). On vide la file sans attendre, et on
+            # dort jusqu'à l'échéance tant qu'elle n'est pas atteinte.
+            while len(lot) < self.taille_max_lot:
+                try:
+                    lot.append(self.file.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                reste = fin_attente - boucle.time()
+                if reste <= 0:
+                    break
+                await asyncio.sleep(reste)
+            # Un même scénario demandé plusieurs fois dans le lot n'est calculé qu'une fois
+            uniques = {}
+            for clé, scénario, _ in lot:
+                uniques.setdefault(clé, scénario)
+            début = time.perf_counter()
+            résultats = await boucle.run_in_executor(
+                self.thread, self._évalue, list(uniques.values())
+            )
+            self.métriques.lot(len(uniques), time.perf_counter() - début)
+            par_clé = dict(zip(uniques, résultats))
+            for clé, _, futur in lot:
+                résultat = par_clé[clé]
+                if not isinstance(résultat, Exception):
+                    self._met_en_cache(clé, résultat)
+                if futur.done():  # client parti entre-temps
+                    continue
+                if isinstance(résultat, Exception):
+                    futur.set_exception(résultat)
+                else:
+                    futur.set_result(résultat)
+
+    @staticmethod
+    def _évalue(scénarios: list) -> list:
+        """
+        Tout le lot d'un coup ; si un scénario fait échouer le calcul (ville inconnue...),
+        on reprend un par un pour que seuls les scénarios fautifs échouent.
+        """
+        try:
+            return résultats_en_dicts(scénarios)
+        except Exception:
+            résultats = []
+            for scénario in scénarios:
+                try:
+                    résultats.extend(résultats_en_dicts([scénario]))
+                except Exception as e:
+                    résultats.append(ErreurRequête(f'{type(e).__name__} : {e}'))
+            return résultats
+
+    def _met_en_cache(self, clé: str, résultat: dict):
+        self.cache[clé] = résultat
+        self.cache.move_to_end(clé)
+        while len(self.cache) > self.taille_cache:
+            self.cache.popitem(last=False)
+
+
+class Serveur:
+    def __init__(self, **options_regroupeur):
+        self.métriques = Métriques()
+        self.regroupeur = Regroupeur(self.métriques, **options_regroupeur)
+
+    async def simulation(self, corps: bytes):
+        try:
+            demande = json.loads(corps or b'null')
+        except json.JSONDecodeError as e:
+            raise ErreurRequête(f'JSON invalide : {e}')
+        scénarios = demande if isinstance(demande, list) else [demande]
+        scénarios = [valide(scénario) for scénario in scénarios]
+        résultats = await asyncio.gather(
+            *(self.regroupeur.calcule(scénario) for scénario in scénarios),
+            return_exceptions=True
+        )
+        if not isinstance(demande, list):
+            if isinstance(résultats[0], Exception):
+                raise résultats[0]
+            return {'id': demande['id'], **résultats[0]} if 'id' in demande else résultats[0]
+        # Dans une liste, un scénario en erreur ne fait pas échouer les autres
+        return [
+            {
+                **({'id': scénario['id']} if 'id' in scénario else {}),
+                **({'erreur': str(résultat)} if isinstance(résultat, Exception) else résultat)
+            }
+            for scénario, résultat in zip(scénarios, résultats)
+        ]
+
+    async def traite(self, méthode: str, chemin: str, corps: bytes):
+        """(statut, objet JSON de la réponse)"""
+        chemin = chemin.split('?')[0].rstrip('/')
+        if (méthode, chemin) == ('POST', '/simulation'):
+            return HTTPStatus.OK, await self.simulation(corps)
+        if (méthode, chemin) == ('GET', '/metriques'):
+            return HTTPStatus.OK, self.métriques.en_dict(len(self.regroupeur.cache))
+        if chemin in ('/simulation', '/metriques'):
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'erreur': f'{méthode} {chemin}'}
+        return HTTPStatus.NOT_FOUND, {'erreur': f'Route inconnue : {chemin}'}
+
+    async def connexion(self, lecteur: asyncio.StreamReader, écrivain: asyncio.StreamWriter):
+        """Une connexion HTTP/1.1, éventuellement gardée ouverte pour plusieurs requêtes"""
+        try:
+            while True:
+                try:
+                    entête = await lecteur.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                        ConnectionError):
+                    return
+                début = time.perf_counter()
+                ligne, *lignes = entête.decode('latin-1').split('\r\n')
+                méthode, chemin, version = (ligne.split(' ') + ['', ''])[:3]
+                entêtes = {
+                    nom.strip().lower(): valeur.strip()
+                    for nom, _, valeur in (ligne.partition(':') for ligne in lignes if ligne)
+                }
+                longueur = int(entêtes.get('content-length', 0))
+                if longueur > TAILLE_MAX_CORPS:
+                    statut, réponse = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'erreur': 'Trop gros'}
+                    garde_ouverte = False
+                else:
+                    corps = await lecteur.readexactly(longueur)
+                    garde_ouverte = (
+                        entêtes.get('connection', '').lower() != 'close'
+                        and version == 'HTTP/1.1'
+                    )
+                    try:
+                        statut, réponse = await self.traite(méthode, chemin, corps)
+                    except ErreurRequête as e:
+                        statut, réponse = HTTPStatus.BAD_REQUEST, {'erreur': str(e)}
+                    except Exception as e:
+                        statut = HTTPStatus.INTERNAL_SERVER_ERROR
+                        réponse = {'erreur': f'{type(e).__name__} : {e}'}
+                données = json.dumps(réponse, ensure_ascii=False).encode('utf-8')
+                écrivain.write(
+                    f'HTTP/1.1 {statut.value} {statut.phrase}\r\n'
+                    'Content-Type: application/json; charset=utf-8\r\n'
+                    f'Content-Length: {len(données)}\r\n'
+                    f"Connection: {'keep-alive' if garde_ouverte else 'close'}\r\n"
+                    '\r\n'.encode('latin-1') + données
+                )
+                await écrivain.drain()
+                self.métriques.requête(
+                    f'{méthode} {chemin}', statut.value, time.perf_counter() - début
+                )
+                if not garde_ouverte:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            écrivain.close()
+
+    async def sert(self, hôte: str = '127.0.0.1', port: int = 8765):
+        self.regroupeur.démarre()
+        serveur = await asyncio.start_server(self.connexion, hôte, port)
+        print(f'Simulation servie sur http://{hôte}:{port}/simulation')
+        try:
+            async with serveur:
+                await serveur.serve_forever()
+        finally:
+            await self.regroupeur.arrête()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--hôte', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--délai-ms', type=float, default=2.,
+                        help="attente maximale des scénarios suivants avant d'évaluer un lot")
+    parser.add_argument('--taille-max-lot', type=int, default=4096)
+    parser.add_argument('--taille-cache', type=int, default=100_000)
+    parser.add_argument('--profilage', action='store_true',
+                        help='chronomètre les étapes du calcul (dans /metriques)')
+    args = parser.parse_args()
+    if args.profilage:
+        instrumentation.active()
+    serveur = Serveur(
+        délai=args.délai_ms / 1000, taille_max_lot=args.taille_max_lot,
+        taille_cache=args.taille_cache,
+    )
+    try:
+        asyncio.run(serveur.sert(args.hôte, args.port))
+    except KeyboardInterrupt:
+        pass
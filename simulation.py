@@ -0,0 +1,783 @@
+"""
+Moteur de calcul du budget, indépendant de Streamlit.
+
+`simulate(ScenarioParams(...))` enchaîne exactement les calculs de l'application :
+CRD de Cachan, prix de revente, apports, mensualités maximales, PEL, prêt principal, puis
+les déductions (inflation, coût du crédit, assurance, frais de notaire, frais d'agence,
+indemnités de remboursement anticipé, frais de dossier).
+
+Tous les calculs sont écrits avec des opérations NumPy : les champs de `ScenarioParams`
+peuvent aussi être des tableaux (diffusés entre eux), auquel cas chaque champ du
+`ScenarioResult` est un tableau. Les résultats scalaires sont mis en cache sur le tuple
+des paramètres.
+"""
+import dataclasses
+import datetime
+import functools
+import itertools
+
+import numpy as np
+
+import cache_disque
+import epargne
+import index_communes
+import instrumentation
+import pel
+from cache_disque import en_cache_disque
+from endettement import (
+    TAUX_MAX_ENDETTEMENT, Emprunteurs, Revenu, RevenuLocatif, mensualités_max
+)
+from fonctions import (
+    INFLATION_SUR_NB_YEARS, LIEU_TO_INFLATION_APPART, LIEU_TO_INFLATION_MAISON, TAUX_BNP,
+    TAUX_NOMINAL_PUBLIC, TAUX_PEL, PrêtExistant, get_barême, get_inflation_annuelle,
+    get_mt_emprunt_max, get_mt_max_prêt_PEL, nb_mois_calendaires,
+    nb_mois_depuis_que_lisa_économise, projette_prix_inflate
+)
+
+# Hypothèses
+SECURITE_LISA = 10_000
+
+# Appartement actuel à Cachan
+TX_LBP = 0.9
+DATE_DÉBUT_DU_PRÊT_EXISTANT = datetime.date(2020, 5, 5)
+MONTANT_REMBOURSÉ_PAR_MOIS = 878.19
+CHARGES_MENSUELLES = 200
+PRIX_APPARTEMENT_CACHAN = 259_000
+MONTANT_EMPRUNTE = 192_820
+ASSURANCE_PRÊT = 16
+# Une fois révolu le 7e anniversaire suivant la date de signature de la présente offre,
+# l'Emprunteur peut effectuer des remboursements par anticipation, sans frais
+DATE_REMB_ANTICIPÉ_GRATUIT = datetime.date(DATE_DÉBUT_DU_PRÊT_EXISTANT.year + 7,
+                                           DATE_DÉBUT_DU_PRÊT_EXISTANT.month,
+                                           DATE_DÉBUT_DU_PRÊT_EXISTANT.day)
+PRÊT_LBP = PrêtExistant(
+    montant_emprunté=MONTANT_EMPRUNTE, tx_nominal=TX_LBP / 100,
+    date_début=DATE_DÉBUT_DU_PRÊT_EXISTANT, nb_mois=20 * 12
+)
+# Prêts en cours soldés à la vente de Cachan : leurs CRD s'additionnent
+PRÊTS_EXISTANTS = (PRÊT_LBP,)
+
+# "Depuis le 1er janvier 2022, les banques doivent limiter à 25 ans la durée
+# des crédits immobiliers"
+DURÉE_MAX_CRÉDIT_EN_MOIS = 25 * 12
+
+PARTICIPATION = 3697  # montant pour 2024
+INTERESSEMENT = 3460  # montant pour 2024
+PARTICIPATION_INTERESSEMENT = PARTICIPATION + INTERESSEMENT
+W_TOTAL_AVANT_IMPÔT = (67_000 + 5000 + 12_000) * (63_000 / 84_000)  # hors PI et abondemment
+W_VARIABLE_AVANT_IMPÔT = 12_000 * (63_000 / 84_000)  # https://www.salaire-brut-en-net.fr
+
+# mensualité d'assurance / mensualité du crédit
+TX_ASSURANCE_ACTUELLE = 16.07 / MONTANT_REMBOURSÉ_PAR_MOIS
+TX_FRAIS_DE_NOTAIRE = {'Ancien': 0.075, 'Neuf': 0.03}
+FRAIS_DE_DOSSIER_BANCAIRE = 1000
+
+
+@dataclasses.dataclass(frozen=True)
+class ScenarioParams:
+    """
+    Les entrées de la barre latérale de l'application. Les champs à None sont déduits
+    des autres par `résout`, comme les valeurs par défaut des widgets.
+    """
+    # Type d'appartement
+    ville: str = 'RUEIL-MALMAISON'
+    appart_ou_maison: str = 'Maison'
+    neuf_ancien: str = 'Ancien'
+    date_achat: datetime.date = datetime.date(2029, 1, 1)
+    # Vente de Cachan ; None : le jour de l'achat. Le solde de la revente entre dans
+    # l'apport quelle que soit la date (une vente après l'achat suppose un prêt relais,
+    # dont le coût n'est pas compté)
+    date_vente: datetime.date = None
+    # Emprunt
+    avec_vente_appartement: bool = True
+    avec_crédit_BNP: bool = True
+    prise_en_compte_du_variable: bool = True
+    prise_en_compte_participation_interessement: bool = False
+    remb_anticipé_gratuit: bool = None  # None : vente après le 7e anniversaire du prêt LBP
+    nb_années_pr_rembourser: int = 20
+    tx_nominal: float = None  # None : taux BNP ou taux public selon `avec_crédit_BNP`
+    curseur_PEL: float = 0.
+    mt_intérêts_acquis_pel: int = int(
+        0.0225 * 20000 + 0.0225 * 35000 + 0.0225 * 52000 + 0.0225 * 60000
+    )
+    # Prêt PEL imposé ; 0 (ou None) : choisi par `get_mt_max_prêt_PEL` (durée la plus
+    # courte, puis le plus d'intérêts acquis possible sous le plafond de mensualité). Résolu
+    # élément par élément : un lot peut mêler prêts imposés et choix automatique
+    durée_du_prêt_PEL: int = 0
+    intérêts_acquis_utilisés_PEL: int = 0  # 0 (ou None) : tous les intérêts acquis
+    tx_frais_agence: float = 0.048
+    # Apports
+    avec_projection_inflation: bool = True
+    gain_mensuel_pde: int = 1800
+    gain_mensuel_lvo: int = 2200
+    apport_actuel_pde: int = 100_000
+    apport_actuel_lvo: int = None  # None : ce que Lisa a économisé, moins sa sécurité
+    w_mensuel_pde_date_achat: int = int((W_TOTAL_AVANT_IMPÔT - W_VARIABLE_AVANT_IMPÔT) / 12)
+    w_mensuel_lvo_date_achat: int = 3500
+    # Inflations cumulées sur INFLATION_SUR_NB_YEARS ans, avant `avec_projection_inflation` ;
+    # None : celle d'un appartement à CACHAN, et celle de `ville` pour `appart_ou_maison`,
+    # cf `inflation_cum_commune`
+    inflation_cum_cachan: float = None
+    inflation_cum_ville: float = None
+    # Date à laquelle la simulation est faite ; None : aujourd'hui
+    date_calcul: datetime.date = None
+    # Décompte des mois : en mois calendaires exacts, ou (historique) en tranches de 30,5 jours
+    mois_calendaires: bool = False
+    # Hypothèses, par défaut les constantes du module
+    taux_max_endettement: float = TAUX_MAX_ENDETTEMENT
+    w_variable: float = W_VARIABLE_AVANT_IMPÔT  # annuel, avant impôt
+    participation_intéressement: float = PARTICIPATION_INTERESSEMENT  # annuels
+    tx_frais_de_notaire: float = None  # None : selon `neuf_ancien`, cf TX_FRAIS_DE_NOTAIRE
+    tx_assurance: float = TX_ASSURANCE_ACTUELLE
+    frais_de_dossier: float = FRAIS_DE_DOSSIER_BANCAIRE
+    # Placement de l'épargne jusqu'à l'achat, cf `epargne.py` : part des apports actuels et
+    # des gains mensuels sur chaque produit, le reste sur le compte courant (non rémunéré)
+    part_épargne_PEL: float = 0.
+    part_épargne_livret: float = 0.
+    part_épargne_compte_à_terme: float = 0.
+    part_épargne_PEE: float = 0.
+    participation_intéressement_sur_PEE: bool = False  # versés chaque année sur le PEE de Pierre
+
+
+@dataclasses.dataclass(frozen=True)
+class ScenarioResult:
+    """Toutes les lignes du calcul, dans l'ordre où l'application les affiche"""
+    nb_mois_restants_avant_achat: float
+    nb_années_restantes_avant_achat: float
+    années_depuis_achat: float
+    CRD: float
+    indemnités_de_remb_par_anticipation: float
+    dû_à_la_banque: float
+    inflation_annuelle_cachan: float
+    prix_estimé_revente: float
+    solde_revente: float
+    apport_qui_sera_apporté_pde: float
+    apport_qui_sera_apporté_lvo: float
+    montant_total_qui_sera_apporté: float
+    mensualité_max_pde: float
+    mensualité_max_lvo: float
+    mensualité_maximale: float
+    est_PEL_intéressant: bool
+    intérêts_acquis_PEL: int  # `mt_intérêts_acquis_pel`, plus ceux du PEL d'ici l'achat
+    durée_du_prêt_PEL: int
+    mt_prêt_PEL: int
+    mensualité_PEL: int
+    intérêts_acquis_utilisés_PEL: int
+    mt_prêt_principal_pde: float
+    mt_prêt_principal_lvo: float
+    mt_prêt_principal: float
+    mt_emprunt_max: float
+    mensualités_prêt_principal: float
+    budget: float
+    inflation_cum_ville: float
+    inflation_par_an_les_x_dernières_années: float
+    inflation_temps_restant_avant_achat: float
+    budget_après_inflation: float
+    coût_crédit_principal: float
+    coût_crédit_PEL: float
+    coût_crédit: float
+    coût_assurance: float
+    frais_de_notaire: float
+    frais_agence: float
+    indemnités_déduites: float
+    frais_de_dossier: float
+    prix_final_maximum: float
+
+
+def _depuis_dict(dico: dict, clés):
+    """`dico[clés]`, élément par élément si `clés` est un tableau"""
+    clés = np.asarray(clés)
+    if clés.ndim == 0:
+        return dico[clés.item()]
+    uniques, inverse = np.unique(clés, return_inverse=True)
+    return np.array([dico[clé] for clé in uniques.tolist()])[inverse].reshape(clés.shape)
+
+
+def _en_date64(date):
+    return np.asarray(date, dtype='datetime64[D]')
+
+
+_LIEU_TO_INFLATION = {'Appartement': LIEU_TO_INFLATION_APPART, 'Maison': LIEU_TO_INFLATION_MAISON}
+_AUTRE_TYPE_LOCAL = {'Appartement': 'Maison', 'Maison': 'Appartement'}
+
+
+def _clé_commune(libellé: str) -> str:
+    """'LE VÉSINET (78)' -> 'VESINET' : sans accents, département ni article"""
+    nom = index_communes.normalise(libellé.split(' (')[0])
+    for article in ('LE ', 'LA ', 'LES ', 'L '):
+        if nom.startswith(article):
+            return nom[len(article):]
+    return nom
+
+
+# Libellés DVF -> clés de `LIEU_TO_INFLATION_*` ('LE VÉSINET' -> 'VÉSINET')
+_LIEUX_HISTORIQUES = {
+    _clé_commune(lieu): lieu for lieu in LIEU_TO_INFLATION_MAISON | LIEU_TO_INFLATION_APPART
+}
+
+
+def _inflation_cum_connue(index, ville: str, type_local: str):
+    """Celle de l'index DVF, sinon celle de `LIEU_TO_INFLATION_*` ; None si inconnue"""
+    ligne = -1 if index is None else index.ligne_libellé(ville, type_local)
+    if ligne >= 0:
+        return float(index.inflation_cum[ligne])
+    lieu = _LIEUX_HISTORIQUES.get(_clé_commune(ville), ville)
+    return _LIEU_TO_INFLATION[type_local].get(lieu)
+
+
+def type_local_retenu(ville: str, type_local: str) -> str:
+    """
+    Le type de local dont l'inflation est utilisée pour `ville` : `type_local`, ou l'autre
+    type si la commune n'a pas assez de ventes du premier
+    """
+    if _inflation_cum_connue(index_communes.charge(), ville, type_local) is not None:
+        return type_local
+    return _AUTRE_TYPE_LOCAL[type_local]
+
+
+def inflation_cum_commune(ville, appart_ou_maison):
+    """
+    Inflation cumulée sur INFLATION_SUR_NB_YEARS ans : celle de l'index DVF si la commune
+    y figure (cf `index_communes.py`), sinon celle de `LIEU_TO_INFLATION_*`. Sans ventes
+    du type de local demandé, celle de l'autre type (cf `type_local_retenu`). Vectorisé.
+    """
+    ville, appart_ou_maison = np.broadcast_arrays(np.asarray(ville), np.asarray(appart_ou_maison))
+    paires, inverse = np.unique(
+        np.stack([ville.ravel(), appart_ou_maison.ravel()], axis=-1), axis=0, return_inverse=True
+    )
+    index = index_communes.charge()
+    valeurs = []
+    for ville_, type_local in paires.tolist():
+        valeur = _inflation_cum_connue(index, ville_, type_local)
+        if valeur is None:
+            valeur = _inflation_cum_connue(index, ville_, _AUTRE_TYPE_LOCAL[type_local])
+        if valeur is None:
+            raise KeyError(f'Commune inconnue : {ville_}')
+        valeurs.append(valeur)
+    return np.array(valeurs)[inverse.ravel()].reshape(ville.shape)[()]
+
+
+def résout(params: ScenarioParams) -> ScenarioParams:
+    """Remplace les champs à None par leur valeur par défaut"""
+    défauts = {}
+    if params.date_calcul is None:
+        défauts['date_calcul'] = datetime.date.today()
+    date_calcul = défauts.get('date_calcul', params.date_calcul)
+    if params.tx_nominal is None:
+        défauts['tx_nominal'] = np.where(
+            params.avec_crédit_BNP,
+            _depuis_dict(TAUX_BNP, params.nb_années_pr_rembourser),
+            _depuis_dict(TAUX_NOMINAL_PUBLIC, params.nb_années_pr_rembourser)
+        )[()]
+    if params.date_vente is None:
+        défauts['date_vente'] = params.date_achat
+    date_vente = défauts.get('date_vente', params.date_vente)
+    if params.remb_anticipé_gratuit is None:
+        # Le prêt LBP est remboursé par anticipation à la vente
+        défauts['remb_anticipé_gratuit'] = (
+            _en_date64(date_vente) > _en_date64(DATE_REMB_ANTICIPÉ_GRATUIT)
+        )[()]
+    if params.apport_actuel_lvo is None:
+        défauts['apport_actuel_lvo'] = np.trunc(
+            np.asarray(params.gain_mensuel_lvo) * nb_mois_depuis_que_lisa_économise(date_calcul)
+            - SECURITE_LISA
+        )[()]
+    if params.inflation_cum_cachan is None:
+        défauts['inflation_cum_cachan'] = inflation_cum_commune('CACHAN', 'Appartement')
+    if params.inflation_cum_ville is None:
+        défauts['inflation_cum_ville'] = inflation_cum_commune(
+            params.ville, params.appart_ou_maison
+        )
+    for champ in ('durée_du_prêt_PEL', 'intérêts_acquis_utilisés_PEL'):
+        valeurs = np.asarray(getattr(params, champ), dtype=object)
+        if np.any(np.equal(valeurs, None)):
+            # None, y compris pour une partie des éléments : choix automatique (0)
+            défauts[champ] = np.where(np.equal(valeurs, None), 0, valeurs).astype(int)[()]
+    if params.tx_frais_de_notaire is None:
+        défauts['tx_frais_de_notaire'] = _depuis_dict(TX_FRAIS_DE_NOTAIRE, params.neuf_ancien)
+    return dataclasses.replace(params, **défauts) if défauts else params
+
+
+def emprunteur_pde(
+    w_mensuel_pde_date_achat,
+    prise_en_compte_du_variable,
+    prise_en_compte_participation_interessement,
+    avec_vente_appartement,
+    w_variable=W_VARIABLE_AVANT_IMPÔT,
+    taux_max_endettement=TAUX_MAX_ENDETTEMENT,
+    participation_intéressement=PARTICIPATION_INTERESSEMENT,
+    mt_remboursé_par_mois=MONTANT_REMBOURSÉ_PAR_MOIS,
+    assurance_prêt=ASSURANCE_PRÊT
+) -> Emprunteurs:
+    """
+    Si je garde mon appartement, c'est pour le mettre en location (et donc, j'aurai
+    des revenus fonciers). On lit ici que les revenus fonciers sont pris en compte dans le
+    calcul du taux d'endettement à hauteur de 70% :
+    https://fr.luko.eu/conseils/guide/taux-endettement-maximum/
+    1200 € : le montant que je peux mettre en location, charges comprises (source SeLoger)
+    Hypothèse pessimiste : l'établissement bancaire retire les charges de copropriété de
+    mes revenus fonciers dans le calcul du taux d'endettement. C'est plutôt rare, cf ChatGPT.
+    """
+    garde_appartement = np.logical_not(avec_vente_appartement)
+    return Emprunteurs(
+        revenus={
+            'salaire': Revenu(w_mensuel_pde_date_achat),
+            'variable': Revenu(w_variable / 12, prise_en_compte_du_variable),
+            'participation_intéressement': Revenu(
+                participation_intéressement / 12, prise_en_compte_participation_interessement
+            ),
+        },
+        revenus_locatifs={
+            'Cachan': RevenuLocatif(
+                loyer_mensuel=garde_appartement * 1200,
+                charges_mensuelles=garde_appartement * 250,
+                tx_assurance_loyers_impayés=0.0295,  # source Macif
+            ),
+        },
+        mensualités_prêts_existants=garde_appartement * (mt_remboursé_par_mois + assurance_prêt),
+        taux_max_endettement=taux_max_endettement,
+    )
+
+
+def emprunteur_lvo(w_mensuel_lvo_date_achat, tx_max_endettement=TAUX_MAX_ENDETTEMENT):
+    return Emprunteurs(
+        revenus={'salaire': Revenu(w_mensuel_lvo_date_achat)},
+        taux_max_endettement=tx_max_endettement,
+    )
+
+
+def calcule_mensualité_max_pde(*args, **kwargs):
+    """cf `emprunteur_pde`"""
+    return mensualités_max(emprunteur_pde(*args, **kwargs))
+
+
+def calcule_mensualité_max_lvo(*args, **kwargs):
+    """cf `emprunteur_lvo`"""
+    return mensualités_max(emprunteur_lvo(*args, **kwargs))
+
+
+# Les étapes du calcul. Chacune reçoit les paramètres résolus et les résultats des
+# étapes précédentes, et retourne ses propres résultats.
+
+def _nb_mois_restants(p: ScenarioParams, date):
+    nb_mois = (date - _en_date64(p.date_calcul)).astype(int) / 30.5
+    if np.any(p.mois_calendaires):
+        nb_mois = np.where(
+            p.mois_calendaires, nb_mois_calendaires(p.date_calcul, date), nb_mois
+        )
+    return np.round(nb_mois)
+
+
+def _étape_calendrier(p: ScenarioParams, r: dict) -> dict:
+    nb_mois_restants_avant_achat = _nb_mois_restants(p, _en_date64(p.date_achat))
+    date_vente = _en_date64(p.date_vente)
+    return dict(
+        nb_mois_restants_avant_achat=nb_mois_restants_avant_achat,
+        nb_années_restantes_avant_achat=nb_mois_restants_avant_achat / 12,
+        # Pas dans `ScenarioResult` : utilisé par les étapes suivantes seulement
+        nb_années_restantes_avant_vente=_nb_mois_restants(p, date_vente) / 12,
+        # Ancienneté du prêt de Cachan à la vente
+        années_depuis_achat=(
+            (date_vente - _en_date64(DATE_DÉBUT_DU_PRÊT_EXISTANT)).astype(int) / 365
+        ),
+    )
+
+
+def _étape_CRD(p: ScenarioParams, r: dict) -> dict:
+    CRD = sum(
+        prêt.CRD_à_date(p.date_vente, mois_calendaires=p.mois_calendaires)
+        for prêt in PRÊTS_EXISTANTS
+    )
+    # Source : pdf des conditions générales LBP
+    indemnités_de_remb_par_anticipation = np.minimum(
+        # "En cas de remboursement anticipé, LBP percevra une indemnité égale à un semestre
+        # d'intérêts calculés au taux indiqué dans les conditions particulières sur le
+        # montant du CRD."
+        144.62 * 6,
+        # "Cette indemnité est plafonnée à 3 % du capital restant dû avant le remboursement."
+        CRD * 0.03,
+    )
+    dû_à_la_banque = CRD + (
+        np.logical_not(p.remb_anticipé_gratuit) * indemnités_de_remb_par_anticipation
+    )
+    return dict(
+        CRD=CRD,
+        indemnités_de_remb_par_anticipation=indemnités_de_remb_par_anticipation,
+        dû_à_la_banque=dû_à_la_banque,
+    )
+
+
+def _étape_prix_estimé_revente(p: ScenarioParams, r: dict) -> dict:
+    inflation_annuelle_cachan = get_inflation_annuelle(
+        inflation_cum=np.where(p.avec_projection_inflation, p.inflation_cum_cachan, 0),
+        nb_years_cum=INFLATION_SUR_NB_YEARS
+    )
+    prix_estimé_revente = np.trunc(projette_prix_inflate(
+        prix_initial=PRIX_APPARTEMENT_CACHAN,
+        inf_annuelle_en_pct=inflation_annuelle_cachan,
+        nb_years_projetées=r['nb_années_restantes_avant_vente']
+    ))
+    return dict(
+        inflation_annuelle_cachan=inflation_annuelle_cachan,
+        prix_estimé_revente=prix_estimé_revente,
+    )
+
+
+def _épargne_placée(p: ScenarioParams, nb_mois):
+    """
+    Projection de l'épargne de Pierre et de Lisa (avant-dernier axe) jusqu'à l'achat,
+    placée selon les `part_épargne_*` (cf `epargne.projette`), et les scénarios où elle
+    diffère de la projection linéaire
+    """
+    parts = np.stack(np.broadcast_arrays(
+        p.part_épargne_PEL, p.part_épargne_livret, p.part_épargne_compte_à_terme,
+        p.part_épargne_PEE
+    ), axis=-1)
+    placée = np.any(parts > 0, axis=-1) | np.asarray(p.participation_intéressement_sur_PEE)
+    if not np.any(placée):
+        return None, placée
+    # Dernier axe : Pierre, Lisa
+    versement_annuel_pee = np.multiply(
+        p.participation_intéressement_sur_PEE, p.participation_intéressement
+    )
+    projection = epargne.projette(
+        apport=np.stack(np.broadcast_arrays(p.apport_actuel_pde, p.apport_actuel_lvo), axis=-1),
+        versement_mensuel=np.stack(
+            np.broadcast_arrays(p.gain_mensuel_pde, p.gain_mensuel_lvo), axis=-1
+        ),
+        nb_mois=np.asarray(nb_mois)[..., None],
+        répartition=parts[..., None, :],
+        versement_annuel_pee=np.stack(
+            np.broadcast_arrays(versement_annuel_pee, 0.), axis=-1
+        ),
+        mois_départ=(
+            _en_date64(p.date_calcul).astype('datetime64[M]').astype(int) % 12 + 1
+        )[..., None],
+    )
+    return projection, placée
+
+
+def _étape_apports(p: ScenarioParams, r: dict) -> dict:
+    solde_revente = r['prix_estimé_revente'] - r['dû_à_la_banque']
+    nb_mois_restants_avant_achat = r['nb_mois_restants_avant_achat']
+
+    épargne_pde = p.apport_actuel_pde + p.gain_mensuel_pde * nb_mois_restants_avant_achat
+    épargne_lvo = p.apport_actuel_lvo + p.gain_mensuel_lvo * nb_mois_restants_avant_achat
+    # Intérêts acquis qui ouvrent droit au prêt PEL (celui de Pierre) : ceux déjà acquis,
+    # plus ceux que le PEL rapporte d'ici l'achat si une part de l'épargne y est placée
+    intérêts_acquis_PEL = np.asarray(p.mt_intérêts_acquis_pel)
+    projection, placée = _épargne_placée(p, nb_mois_restants_avant_achat)
+    if projection is not None:
+        épargne_pde = np.where(placée, projection.total[..., 0], épargne_pde)
+        épargne_lvo = np.where(placée, projection.total[..., 1], épargne_lvo)
+        intérêts_PEL = projection.intérêts_bruts[..., 0, list(epargne.PRODUITS).index('PEL')]
+        intérêts_acquis_PEL = intérêts_acquis_PEL + np.where(
+            placée, np.floor(intérêts_PEL), 0
+        ).astype(int)
+
+    apport_qui_sera_apporté_pde = épargne_pde + solde_revente * p.avec_vente_appartement
+    apport_qui_sera_apporté_lvo = épargne_lvo
+    return dict(
+        solde_revente=solde_revente,
+        apport_qui_sera_apporté_pde=apport_qui_sera_apporté_pde,
+        apport_qui_sera_apporté_lvo=apport_qui_sera_apporté_lvo,
+        montant_total_qui_sera_apporté=apport_qui_sera_apporté_pde + apport_qui_sera_apporté_lvo,
+        intérêts_acquis_PEL=intérêts_acquis_PEL,
+    )
+
+
+def _étape_mensualité_max(p: ScenarioParams, r: dict) -> dict:
+    mensualité_max_lvo = calcule_mensualité_max_lvo(
+        p.w_mensuel_lvo_date_achat, tx_max_endettement=p.taux_max_endettement
+    )
+    mensualité_max_pde = calcule_mensualité_max_pde(
+        w_mensuel_pde_date_achat=p.w_mensuel_pde_date_achat,
+        prise_en_compte_du_variable=p.prise_en_compte_du_variable,
+        prise_en_compte_participation_interessement=(
+            p.prise_en_compte_participation_interessement
+        ),
+        avec_vente_appartement=p.avec_vente_appartement,
+        w_variable=p.w_variable,
+        taux_max_endettement=p.taux_max_endettement,
+        participation_intéressement=p.participation_intéressement,
+    )
+    return dict(
+        mensualité_max_pde=mensualité_max_pde,
+        mensualité_max_lvo=mensualité_max_lvo,
+        mensualité_maximale=mensualité_max_pde + mensualité_max_lvo,
+    )
+
+
+def _étape_PEL(p: ScenarioParams, r: dict) -> dict:
+    est_PEL_intéressant = TAUX_PEL <= np.asarray(p.tx_nominal)
+    # Sans PEL intéressant, le curseur est ignoré : tout va au prêt principal
+    curseur_PEL = np.where(est_PEL_intéressant, p.curseur_PEL, 0.)
+    mensualité_plafond = curseur_PEL * r['mensualité_max_pde']
+    intérêts_imposés = np.asarray(p.intérêts_acquis_utilisés_PEL)
+    intérêts_acquis = np.where(
+        intérêts_imposés > 0,
+        np.minimum(intérêts_imposés, r['intérêts_acquis_PEL']),
+        r['intérêts_acquis_PEL']
+    )
+    durée_imposée = np.asarray(p.durée_du_prêt_PEL)
+    automatique = durée_imposée <= 0
+    prêt_PEL = (0, 0, 0, 0)
+    if np.any(automatique):
+        prêt_PEL = get_mt_max_prêt_PEL(
+            get_barême(),
+            mt_intérêts_acquis_PEL=intérêts_acquis,
+            mensualité_plafond=mensualité_plafond
+        )
+    if not np.all(automatique):
+        # Durée imposée : le prêt n'est possible que si sa mensualité passe sous le plafond
+        durée_imposée = np.where(automatique, pel.DURÉE_MIN_PRÊT_PEL, durée_imposée)
+        mt_prêt_PEL, mensualité_PEL = pel.prêt_et_mensualité(
+            pel.barême_par_durée(get_barême()), intérêts_acquis, durée_imposée
+        )
+        possible = (mensualité_PEL <= mensualité_plafond) & (intérêts_acquis > 0)
+        prêt_PEL = tuple(
+            np.where(automatique, auto, np.where(possible, imposé, 0)).astype(int)
+            for auto, imposé in zip(
+                prêt_PEL, (durée_imposée, mt_prêt_PEL, mensualité_PEL, intérêts_acquis)
+            )
+        )
+    durée_du_prêt_PEL, mt_prêt_PEL, mensualité_PEL, intérêts_acquis_utilisés_PEL = (
+        np.where(est_PEL_intéressant, x, 0) for x in prêt_PEL
+    )
+    return dict(
+        est_PEL_intéressant=est_PEL_intéressant,
+        curseur_PEL=curseur_PEL,
+        durée_du_prêt_PEL=durée_du_prêt_PEL,
+        mt_prêt_PEL=mt_prêt_PEL,
+        mensualité_PEL=mensualité_PEL,
+        intérêts_acquis_utilisés_PEL=intérêts_acquis_utilisés_PEL,
+    )
+
+
+def _étape_prêt_principal(p: ScenarioParams, r: dict) -> dict:
+    mensualité_max_pde_prêt_principal = (1 - r['curseur_PEL']) * r['mensualité_max_pde']
+    nb_mois = np.asarray(p.nb_années_pr_rembourser) * 12
+    mt_prêt_principal_pde = get_mt_emprunt_max(
+        mensualité_max=mensualité_max_pde_prêt_principal,
+        tx_nominal=p.tx_nominal,
+        nb_mois=nb_mois
+    )
+    mt_prêt_principal_lvo = get_mt_emprunt_max(
+        mensualité_max=r['mensualité_max_lvo'],
+        tx_nominal=p.tx_nominal,
+        nb_mois=nb_mois
+    )
+    mt_prêt_principal = mt_prêt_principal_pde + mt_prêt_principal_lvo
+    mt_emprunt_max = mt_prêt_principal + r['mt_prêt_PEL']
+    return dict(
+        mt_prêt_principal_pde=mt_prêt_principal_pde,
+        mt_prêt_principal_lvo=mt_prêt_principal_lvo,
+        mt_prêt_principal=mt_prêt_principal,
+        mt_emprunt_max=mt_emprunt_max,
+        mensualités_prêt_principal=mensualité_max_pde_prêt_principal + r['mensualité_max_lvo'],
+        budget=r['montant_total_qui_sera_apporté'] + mt_emprunt_max,
+    )
+
+
+def _étape_déductions(p: ScenarioParams, r: dict) -> dict:
+    inflation_cum_ville = np.where(p.avec_projection_inflation, p.inflation_cum_ville, 0)
+    inflation_par_an_les_x_dernières_années = get_inflation_annuelle(
+        inflation_cum=inflation_cum_ville,
+        nb_years_cum=INFLATION_SUR_NB_YEARS
+    )
+    inflation_temps_restant_avant_achat = (
+        (1 + inflation_par_an_les_x_dernières_années) ** r['nb_années_restantes_avant_achat']
+    )
+    budget_après_inflation = np.round(r['budget'] / inflation_temps_restant_avant_achat)
+
+    coût_crédit_principal = (
+        r['mensualités_prêt_principal'] * 12 * np.asarray(p.nb_années_pr_rembourser)
+        - r['mt_prêt_principal']
+    )
+    coût_crédit_PEL = (
+        r['mensualité_PEL'] * 12 * r['durée_du_prêt_PEL'] - r['mt_prêt_PEL']
+    )
+    coût_crédit = coût_crédit_principal + coût_crédit_PEL
+    budget = budget_après_inflation - coût_crédit
+
+    coût_assurance = np.multiply(p.tx_assurance, r['mt_emprunt_max'])
+    budget = budget - coût_assurance
+
+    frais_de_notaire = np.multiply(p.tx_frais_de_notaire, budget)
+    budget = budget - frais_de_notaire
+
+    frais_agence = p.avec_vente_appartement * (p.tx_frais_agence * r['prix_estimé_revente'])
+    budget = budget - frais_agence
+
+    indemnités_déduites = (
+        np.logical_not(p.remb_anticipé_gratuit) * r['indemnités_de_remb_par_anticipation']
+    )
+    budget = budget - indemnités_déduites
+
+    budget = budget - p.frais_de_dossier
+    return dict(
+        inflation_cum_ville=inflation_cum_ville,
+        inflation_par_an_les_x_dernières_années=inflation_par_an_les_x_dernières_années,
+        inflation_temps_restant_avant_achat=inflation_temps_restant_avant_achat,
+        budget_après_inflation=budget_après_inflation,
+        coût_crédit_principal=coût_crédit_principal,
+        coût_crédit_PEL=coût_crédit_PEL,
+        coût_crédit=coût_crédit,
+        coût_assurance=coût_assurance,
+        frais_de_notaire=frais_de_notaire,
+        frais_agence=frais_agence,
+        indemnités_déduites=indemnités_déduites,
+        frais_de_dossier=np.asarray(p.frais_de_dossier),
+        prix_final_maximum=budget,
+    )
+
+
+ÉTAPES = {
+    'calendrier': _étape_calendrier,
+    'CRD': _étape_CRD,
+    'prix_estimé_revente': _étape_prix_estimé_revente,
+    'apports': _étape_apports,
+    'mensualité_max': _étape_mensualité_max,
+    'PEL': _étape_PEL,
+    'prêt_principal': _étape_prêt_principal,
+    'déductions': _étape_déductions,
+}
+_CHAMPS_RÉSULTAT = [champ.name for champ in dataclasses.fields(ScenarioResult)]
+
+
+def _simule(params: ScenarioParams) -> ScenarioResult:
+    r = {}
+    for nom, étape in ÉTAPES.items():
+        with instrumentation.étape(nom):
+            r.update(étape(params, r))
+    return ScenarioResult(**{champ: np.asarray(r[champ])[()] for champ in _CHAMPS_RÉSULTAT})
+
+
+# En mémoire, puis sur disque (partagé entre sessions et processus, cf `cache_disque`).
+# La version des données fait partie de la clé en mémoire comme de celle sur disque : un
+# CSV ou un index des communes modifié invalide les deux
+@functools.lru_cache(maxsize=1024)
+@en_cache_disque
+def _simule_en_cache(params: ScenarioParams, version_données: str) -> ScenarioResult:
+    return _simule(params)
+
+
+def simulate(params: ScenarioParams) -> ScenarioResult:
+    """
+    Calcule toutes les lignes du budget. Les paramètres scalaires sont mis en cache ;
+    des paramètres tableaux (non hachables) sont évalués directement.
+    """
+    params = résout(params)
+    try:
+        hash(params)
+    except TypeError:
+        return _simule(params)
+    if instrumentation.est_actif():
+        succès_avant = _simule_en_cache.cache_info().hits
+        résultat = _simule_en_cache(params, cache_disque.version_données())
+        instrumentation.compte_cache(
+            'simulate', _simule_en_cache.cache_info().hits > succès_avant
+        )
+        return résultat
+    return _simule_en_cache(params, cache_disque.version_données())
+
+
+class _ParamsTracés:
+    """Enregistre les champs de `ScenarioParams` lus par une étape, et leurs valeurs"""
+    __slots__ = ('_params', 'lus')
+
+    def __init__(self, params: ScenarioParams):
+        self._params = params
+        self.lus = {}
+
+    def __getattr__(self, nom):
+        valeur = getattr(self._params, nom)
+        self.lus[nom] = valeur
+        return valeur
+
+
+class _RésultatsTracés(dict):
+    """Enregistre les résultats des étapes précédentes lus par une étape"""
+
+    def __init__(self, r: dict):
+        super().__init__(r)
+        self.lus = set()
+
+    def __getitem__(self, clé):
+        self.lus.add(clé)
+        return super().__getitem__(clé)
+
+
+def _égaux(a, b) -> bool:
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        a, b = np.asarray(a), np.asarray(b)
+        return a.dtype == b.dtype and a.shape == b.shape and bool(np.all(
+            (a == b) | ((a != a) & (b != b))  # NaN == NaN
+        ))
+    return type(a) is type(b) and a == b
+
+
+@dataclasses.dataclass
+class _Nœud:
+    params_lus: dict  # champ -> valeur lue au dernier calcul
+    étapes_lues: dict  # étape -> version lue au dernier calcul
+    sorties: dict
+    version: int
+
+
+class CalculIncrémental:
+    """
+    Le calcul vu comme un graphe des étapes de `ÉTAPES`. Lors de chaque calcul, on
+    enregistre les champs de `ScenarioParams` et les résultats d'étapes que lit chaque
+    étape ; au calcul suivant, une étape n'est réévaluée que si l'un d'eux a changé.
+    Une étape réévaluée qui redonne les mêmes sorties garde sa version, et ses
+    dépendantes ne sont pas réévaluées non plus.
+    Modifier `tx_frais_agence` ne réévalue ainsi que l'étape des déductions.
+
+    >>> calcul = CalculIncrémental()
+    >>> r = calcul.calcule(ScenarioParams())
+    >>> r = calcul.calcule(ScenarioParams(tx_frais_agence=0.03))
+    >>> calcul.recalculées
+    ['déductions']
+    """
+
+    def __init__(self):
+        self._nœuds = {}
+        self._versions = itertools.count()
+        self.recalculées = []
+
+    def _à_jour(self, nœud: _Nœud, params: ScenarioParams, versions: dict) -> bool:
+        return all(
+            versions[étape] == version for étape, version in nœud.étapes_lues.items()
+        ) and all(
+            _égaux(getattr(params, champ), valeur) for champ, valeur in nœud.params_lus.items()
+        )
+
+    def calcule(self, params: ScenarioParams) -> ScenarioResult:
+        params = résout(params)
+        r, versions, producteurs = {}, {}, {}
+        self.recalculées = []
+        for nom, étape in ÉTAPES.items():
+            nœud = self._nœuds.get(nom)
+            à_jour = nœud is not None and self._à_jour(nœud, params, versions)
+            instrumentation.compte_cache(f'étape {nom}', à_jour)
+            if not à_jour:
+                p, r_lus = _ParamsTracés(params), _RésultatsTracés(r)
+                with instrumentation.étape(nom):
+                    sorties = étape(p, r_lus)
+                inchangé = nœud is not None and sorties.keys() == nœud.sorties.keys() and all(
+                    _égaux(valeur, nœud.sorties[clé]) for clé, valeur in sorties.items()
+                )
+                nœud = self._nœuds[nom] = _Nœud(
+                    params_lus=p.lus,
+                    étapes_lues={
+                        producteurs[clé]: versions[producteurs[clé]] for clé in r_lus.lus
+                    },
+                    sorties=nœud.sorties if inchangé else sorties,
+                    version=nœud.version if inchangé else next(self._versions),
+                )
+                self.recalculées.append(nom)
+            r.update(nœud.sorties)
+            versions[nom] = nœud.version
+            producteurs.update(dict.fromkeys(nœud.sorties, nom))
+        return ScenarioResult(**{champ: np.asarray(r[champ])[()] for champ in _CHAMPS_RÉSULTAT})
@@ -0,0 +1,131 @@
+"""
+Stockage en colonnes des résultats de nombreux scénarios (balayages, Monte Carlo...).
+
+Un `ScenarioResult` vectorisé garde ses champs sous des formes diffusables, parfois
+scalaires, parfois des vues sans pas (`np.broadcast_to`). `TableRésultats` en fait une
+table à une ligne par scénario et une colonne contiguë par ligne du budget, cascade des
+déductions comprise (coût du crédit, assurance, frais de notaire, frais d'agence,
+indemnités, frais de dossier, prix final maximum) :
+- chaque colonne a un type fixe (réels en float64, ou float32 pour diviser la place par
+  deux, entiers en int32, booléens sur un octet), d'où un nombre d'octets par scénario
+  connu d'avance : `octets_par_scénario(réels)` ;
+- une tranche (`table[i:j]`) est une vue, sans copie ; un filtre (`table[masque]`)
+  copie seulement les lignes gardées ;
+- `to_arrow()` partage la mémoire des colonnes numériques avec Arrow (les booléens,
+  stockés en bits par Arrow, sont convertis).
+
+>>> b = balaye(ScenarioParams(), tx_nominal=np.linspace(0.01, 0.05, 1000),
+...            nb_années_pr_rembourser=[15, 20, 25])
+>>> t = TableRésultats.depuis_résultat(b.résultat, réels=np.float32)
+>>> len(t), t.nbytes == len(t) * octets_par_scénario(np.float32)
+(3000, True)
+>>> t[t['prix_final_maximum'] > 700_000].to_arrow()
+"""
+import dataclasses
+
+import numpy as np
+
+from simulation import ScenarioResult
+
+_TYPES = {float: None, int: np.int32, bool: np.bool_}  # None : `réels`
+CHAMPS = [champ.name for champ in dataclasses.fields(ScenarioResult)]
+
+
+def dtypes(réels=np.float64) -> dict:
+    """Type de chaque colonne"""
+    return {
+        champ.name: np.dtype(_TYPES[champ.type] or réels)
+        for champ in dataclasses.fields(ScenarioResult)
+    }
+
+
+def octets_par_scénario(réels=np.float64) -> int:
+    return sum(dtype.itemsize for dtype in dtypes(réels).values())
+
+
+class TableRésultats:
+    __slots__ = ('colonnes',)
+
+    def __init__(self, colonnes: dict):
+        """`colonnes` : une colonne 1D par champ de `ScenarioResult`, toutes de même longueur"""
+        longueurs = {len(colonne) for colonne in colonnes.values()}
+        if set(colonnes) != set(CHAMPS) or len(longueurs) != 1:
+            raise ValueError('Il faut une colonne par champ de ScenarioResult, de même longueur')
+        self.colonnes = {champ: colonnes[champ] for champ in CHAMPS}
+
+    @classmethod
+    def vide(cls, nb_scénarios: int, réels=np.float64) -> 'TableRésultats':
+        """Table allouée d'avance, à remplir par tranches : `table[i:j] = résultat`"""
+        return cls({
+            champ: np.zeros(nb_scénarios, dtype=dtype) for champ, dtype in dtypes(réels).items()
+        })
+
+    @classmethod
+    def depuis_résultat(cls, résultat: ScenarioResult, réels=np.float64) -> 'TableRésultats':
+        """Un scénario par élément de la forme commune des champs, aplatie dans l'ordre C"""
+        forme = np.broadcast_shapes(*(np.shape(getattr(résultat, champ)) for champ in CHAMPS))
+        table = cls.vide(int(np.prod(forme)), réels)
+        table[:] = résultat
+        return table
+
+    @classmethod
+    def concatène(cls, tables) -> 'TableRésultats':
+        tables = list(tables)
+        return cls({
+            champ: np.concatenate([table.colonnes[champ] for table in tables])
+            for champ in CHAMPS
+        })
+
+    def __len__(self) -> int:
+        return len(self.colonnes[CHAMPS[0]])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(colonne.nbytes for colonne in self.colonnes.values())
+
+    def __getitem__(self, clé):
+        """
+        Un nom de champ : la colonne (vue). Une tranche : une table de vues. Un masque
+        booléen ou des indices : une table des lignes choisies (copie).
+        """
+        if isinstance(clé, str):
+            return self.colonnes[clé]
+        if isinstance(clé, (int, np.integer)):
+            return self.résultat(clé)
+        return TableRésultats({champ: colonne[clé] for champ, colonne in self.colonnes.items()})
+
+    def __setitem__(self, tranche: slice, résultat):
+        """
+        Écrit dans la tranche les scénarios d'un `ScenarioResult` vectorisé (aplati) ou
+        d'une autre `TableRésultats`
+        """
+        début, fin, pas = tranche.indices(len(self))
+        if isinstance(résultat, TableRésultats):
+            résultat = résultat.colonnes
+            forme = (len(résultat[CHAMPS[0]]),)
+        else:
+            résultat = {champ: getattr(résultat, champ) for champ in CHAMPS}
+            forme = np.broadcast_shapes(*(np.shape(valeurs) for valeurs in résultat.values()))
+        if pas != 1 or fin - début != int(np.prod(forme)):
+            raise ValueError(f'Tranche {tranche} incompatible avec des résultats de forme {forme}')
+        for champ, colonne in self.colonnes.items():
+            # Diffusion directement dans la colonne, sans tableau intermédiaire
+            colonne[début:fin].reshape(forme)[...] = résultat[champ]
+
+    def filtre(self, masque) -> 'TableRésultats':
+        return self[np.asarray(masque, dtype=bool)]
+
+    def résultat(self, i: int) -> ScenarioResult:
+        """Le scénario `i`, avec des champs scalaires"""
+        return ScenarioResult(**{champ: colonne[i] for champ, colonne in self.colonnes.items()})
+
+    def to_arrow(self):
+        import pyarrow as pa
+        return pa.table(self.colonnes)
+
+    def to_frame(self):
+        import pandas as pd
+        return pd.DataFrame(self.colonnes, copy=False)
+
+    def __repr__(self) -> str:
+        return f'TableRésultats({len(self)} scénarios, {self.nbytes / 2**20:.1f} Mo)'
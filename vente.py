@@ -0,0 +1,126 @@
+"""
+Date de vente de l'appartement de Cachan : chaque mois restant du prêt LBP d'un coup.
+
+Le produit net de la vente dépend du mois : CRD du prêt, indemnités de remboursement
+anticipé (un semestre d'intérêts plafonné à 3 % du CRD, offertes après le 7e
+anniversaire du prêt, cf `DATE_REMB_ANTICIPÉ_GRATUIT`), prix de revente projeté et
+frais d'agence. On évalue une vente à chaque échéance mensuelle (même jour du mois que
+la date de calcul), jusqu'à la fin du prêt, d'un seul appel vectorisé de `simulate`
+(`date_vente` tableau), avec le décompte des mois de `base` (`mois_calendaires`), comme
+le résultat principal.
+
+L'achat peut rester à la date de `base` (la vente et l'achat sont alors décorrélés :
+vendre avant l'achat, ou après avec un prêt relais) ou suivre la vente
+(`achat_à_la_vente`). Vendre après l'achat oblige à payer en parallèle les mensualités
+du prêt LBP et les charges jusqu'à la vente : ce coût de portage est retiré du prix
+final maximum. Vendre avant l'achat oblige à se loger ailleurs : par défaut le loyer
+compense exactement mensualités et charges, sinon `loyer_après_vente` fixe l'écart.
+Le mois optimal est celui qui maximise le prix final maximum, portage déduit.
+
+>>> v = ventes(ScenarioParams(date_achat=datetime.date(2029, 1, 1)))
+>>> v.meilleur_mois(), v.série('produit_net_vente').max()
+"""
+import dataclasses
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from fonctions import ajoute_mois, nb_mois_calendaires
+from simulation import (
+    CHARGES_MENSUELLES, MONTANT_REMBOURSÉ_PAR_MOIS, PRÊT_LBP, ScenarioParams, ScenarioResult,
+    résout, simulate
+)
+
+# Séries retenues pour l'affichage, dans l'ordre
+SÉRIES = {
+    'CRD': 'CRD du prêt de Cachan',
+    'indemnités_de_remb_par_anticipation': 'Indemnités de remboursement anticipé',
+    'prix_estimé_revente': 'Prix de revente de Cachan',
+    'frais_agence': "Frais d'agence",
+    'produit_net_vente': 'Produit net de la vente',
+    'coût_portage': 'Coût de portage',
+    'prix_final_maximum': 'Prix final maximum',
+    'prix_final_net': 'Prix final maximum, portage déduit',
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class Ventes:
+    dates: np.ndarray  # datetime64[D], une vente par mois
+    résultat: ScenarioResult  # chaque champ a la forme de `dates`
+    # Dépenses dues au décalage entre vente et achat, négatives si la vente fait économiser
+    coût_portage: np.ndarray
+
+    def série(self, champ: str) -> np.ndarray:
+        if champ == 'produit_net_vente':
+            # Ce que la vente laisse une fois la banque et l'agence payées
+            return self.série('solde_revente') - self.série('frais_agence')
+        if champ == 'coût_portage':
+            return self.coût_portage
+        if champ == 'prix_final_net':
+            return self.série('prix_final_maximum') - self.coût_portage
+        return np.broadcast_to(getattr(self.résultat, champ), self.dates.shape)
+
+    def meilleur_mois(self, champ: str = 'prix_final_net') -> datetime.date:
+        """Le mois de vente qui maximise `champ` (le premier, en cas d'égalité)"""
+        return self.dates[np.argmax(self.série(champ))].astype(datetime.date)
+
+    def to_frame(self, champs=SÉRIES) -> pd.DataFrame:
+        return pd.DataFrame(
+            {champ: self.série(champ) for champ in champs},
+            index=pd.DatetimeIndex(self.dates, name='date_vente')
+        )
+
+
+def _nb_échéances_échues(date):
+    """Nombre d'échéances du prêt LBP (même jour du mois que son début) échues à `date`"""
+    return np.clip(
+        np.floor(nb_mois_calendaires(PRÊT_LBP.date_début, date)), 0, PRÊT_LBP.nb_mois
+    )
+
+
+def coût_portage(date_achat, date_vente, loyer_après_vente: float = None):
+    """
+    Échéances LBP tombées après l'achat, jusqu'à la vente comprise, et charges au prorata
+    des jours entre l'achat et une vente postérieure ; pour une vente antérieure, loyer
+    moins charges au prorata, moins les échéances économisées. Vectorisé.
+    """
+    durée = nb_mois_calendaires(date_achat, date_vente)  # négative si vente avant l'achat
+    échéances = _nb_échéances_échues(date_vente) - _nb_échéances_échues(date_achat)
+    mois_après_achat = np.maximum(durée, 0)
+    portage = (
+        np.maximum(échéances, 0) * MONTANT_REMBOURSÉ_PAR_MOIS
+        + mois_après_achat * CHARGES_MENSUELLES
+    )
+    if loyer_après_vente is not None:
+        mois_avant_achat = np.maximum(-durée, 0)
+        portage = portage + (
+            mois_avant_achat * (loyer_après_vente - CHARGES_MENSUELLES)
+            - np.maximum(-échéances, 0) * MONTANT_REMBOURSÉ_PAR_MOIS
+        )
+    return portage
+
+
+def ventes(base: ScenarioParams, achat_à_la_vente: bool = False,
+           loyer_après_vente: float = None, date_fin=None) -> Ventes:
+    """
+    Une vente à chaque mois, de la date de calcul jusqu'à `date_fin` (par défaut la
+    dernière échéance du prêt LBP). La clause de remboursement anticipé gratuit suit la
+    date de vente, quel que soit `base.remb_anticipé_gratuit`. `base` doit être scalaire.
+    """
+    base = résout(dataclasses.replace(base, avec_vente_appartement=True))
+    if date_fin is None:
+        date_fin = ajoute_mois(PRÊT_LBP.date_début, PRÊT_LBP.nb_mois)
+    nb_mois = max(int(np.floor(nb_mois_calendaires(base.date_calcul, date_fin))), 0)
+    dates = ajoute_mois(base.date_calcul, np.arange(nb_mois + 1))
+    dates_achat = dates if achat_à_la_vente else base.date_achat
+    résultat = simulate(dataclasses.replace(
+        base, date_vente=dates, date_achat=dates_achat, remb_anticipé_gratuit=None
+    ))
+    return Ventes(
+        dates=dates, résultat=résultat,
+        coût_portage=np.broadcast_to(
+            coût_portage(dates_achat, dates, loyer_après_vente), dates.shape
+        ),
+    )